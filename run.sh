@@ -12,6 +12,14 @@ echo ""
 echo "🚀 Dashboard listo en: http://localhost:8501"
 echo "--------------------------------------------"
 
+# WORKERS>1 serves with several gunicorn processes (caches are invalidated through data/.version)
+# that map a single parsed copy of the data (data/.dataset) instead of parsing one each
+WORKERS=${WORKERS:-1}
+if [ "$WORKERS" -gt 1 ]; then
+    export SHARED_DATASET=${SHARED_DATASET:-1}  # Already the default; kept explicit for the workers
+    exec gunicorn --workers "$WORKERS" --bind 127.0.0.1:8501 --chdir src/web app:app
+fi
+
 # Run Flask with reduced noise but keep it in foreground
 # We remove 2>/dev/null so the process doesn't terminate immediately and we see errors
 flask run --host 127.0.0.1 --port 8501
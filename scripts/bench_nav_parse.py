@@ -0,0 +1,34 @@
+"""Micro-benchmark of the NAV extraction over the saved QueFondos fixture pages."""
+import glob
+import os
+import sys
+import timeit
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src', 'web'))
+import market_data
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tests', 'fixtures')
+
+def bench(path, number=50):
+    with open(path, encoding='utf-8') as f:
+        html = f.read()
+
+    soup_price = market_data._parse_price_soup(html)
+    fast_price = market_data._parse_price(html)
+    if soup_price != fast_price:
+        print(f"❌ {os.path.basename(path)}: results differ ({soup_price} vs {fast_price})")
+        return False
+
+    soup_ms = min(timeit.repeat(lambda: market_data._parse_price_soup(html), number=number, repeat=3)) / number * 1000
+    fast_ms = min(timeit.repeat(lambda: market_data._parse_price(html), number=number, repeat=3)) / number * 1000
+    print(f"{os.path.basename(path):<40} {len(html) / 1024:>7.1f} KB  "
+          f"soup {soup_ms:>7.2f} ms  fast {fast_ms:>7.2f} ms  x{soup_ms / fast_ms:.1f}  -> {fast_price}")
+    return True
+
+if __name__ == "__main__":
+    if market_data.lxml_html is None:
+        print("AVISO: lxml no está instalado, solo existe la ruta BeautifulSoup.")
+        sys.exit(1)
+    pages = sys.argv[1:] or sorted(glob.glob(os.path.join(FIXTURES_DIR, 'quefondos_*.html')))
+    ok = all([bench(p) for p in pages])
+    sys.exit(0 if ok else 1)
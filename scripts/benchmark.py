@@ -0,0 +1,170 @@
+"""
+Times the logic.py entry points over synthetic data, cold (fresh process caches) and warm,
+and compares them with a stored baseline: a regression above the threshold, or a scale without
+baseline, fails the run.
+
+    python scripts/benchmark.py --scale medium --save-baseline   # Record the reference timings
+    python scripts/benchmark.py --scale medium                   # Exit 1 on regression
+    python scripts/benchmark.py --scale medium --snapshot        # Cold = restart from data/.dataset
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT, 'src', 'web'))
+sys.path.append(os.path.join(ROOT, 'scripts'))
+import pandas as pd
+import logic
+import synthetic_data
+
+BASELINE_FILE = os.path.join(ROOT, 'scripts', 'benchmark_baseline.json')
+THRESHOLD = 0.25       # Allowed slowdown over the baseline (fraction)
+MIN_DELTA_MS = 5.0     # Slowdowns below this are noise, whatever the ratio
+MACHINE_RATIO = 1.5    # Calibrations closer than this are the same machine: baselines are not rescaled
+
+def _charts():
+    return logic.create_charts(logic.get_portfolio_summary(), logic.get_financial_flow())
+
+def _sankey():
+    periodo = logic.month_label([logic.load_data()[3]['periodo'].max()])[0]
+    return logic.get_sankey_data(str(periodo), window=12)
+
+ENTRY_POINTS = {
+    'load_data': logic.load_data,
+    'rebuild_portfolio': logic.rebuild_portfolio,
+    'get_portfolio_summary': logic.get_portfolio_summary,
+    'get_financial_flow': logic.get_financial_flow,
+    'get_portfolio_history_chart_data': logic.get_portfolio_history_chart_data,
+    'create_charts': _charts,
+    'get_sankey_data': _sankey,
+}
+
+def use_data_dir(data_dir):
+    """Points every logic.py path at 'data_dir'."""
+    logic.DATA_DIR = data_dir
+    logic.PRICES_FILE = os.path.join(data_dir, 'latest_prices.json')
+    logic.HISTORY_FILE = os.path.join(data_dir, 'precios_historicos.csv')
+    logic.HISTORY_STORE_DIR = os.path.join(data_dir, 'precios_historicos')
+    logic.LEDGER_CHECKPOINT_FILE = os.path.join(data_dir, '.ledger_checkpoint.json')
+    logic.DATA_VERSION_FILE = os.path.join(data_dir, '.version')
+    logic.DATABASE_FILE = os.path.join(data_dir, 'finanzas.db')
+    logic.SHARED_DATASET_DIR = os.path.join(data_dir, '.dataset')
+    logic.SHARED_DATASET = False  # Cold runs parse the ledgers; run(snapshot=True) turns it back on
+    logic.reset_caches()
+
+def _timed(fn):
+    start = time.perf_counter()
+    fn()
+    return (time.perf_counter() - start) * 1000
+
+def calibrate(repeat=7):
+    """Time of a fixed pandas workload: baselines are scaled by it, so a slower machine is not a regression."""
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({'k': rng.integers(0, 1000, 1_000_000), 'v': rng.random(1_000_000)})
+    return min(_timed(lambda: df.groupby('k')['v'].sum().sort_values()) for _ in range(repeat))
+
+def run(repeat=5, snapshot=False):
+    """
+    {entry point: {'cold': ms, 'warm': ms}}, best of 'repeat' runs each. With 'snapshot', cold
+    runs start from the dataset and artifacts saved on disk, like a restarted process.
+    """
+    logic.SHARED_DATASET = snapshot
+    logic.load_data()  # Writes cartera.csv and the ledger checkpoint once, like a deployed instance
+    results = {}
+    for name, fn in ENTRY_POINTS.items():
+        cold, warm = [], []
+        for _ in range(repeat):
+            if snapshot:
+                logic.save_artifacts_snapshot()  # What the previous run built (rebuild_portfolio changes the sources)
+            logic.reset_caches()
+            cold.append(_timed(fn))
+            warm.append(_timed(fn))
+        results[name] = {'cold': round(min(cold), 2), 'warm': round(min(warm), 2)}
+    return results
+
+def compare(results, baseline, threshold=THRESHOLD, min_delta_ms=MIN_DELTA_MS, speed=1.0):
+    """
+    Rows (name, mode, baseline ms, current ms, regressed) for every timing present in both.
+    'speed' is the current calibration time over the baseline's one.
+    """
+    rows = []
+    for name, timings in results.items():
+        for mode, current in timings.items():
+            reference = baseline.get(name, {}).get(mode)
+            if reference is None:
+                continue
+            reference = round(reference * speed, 2)
+            regressed = current > reference * (1 + threshold) and current - reference > min_delta_ms
+            rows.append((name, mode, reference, current, regressed))
+    return rows
+
+def _environment():
+    return {'python': platform.python_version(), 'pandas': pd.__version__, 'machine': platform.machine(),
+            'processor': platform.processor() or platform.node()}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', choices=synthetic_data.SCALES, default='medium')
+    parser.add_argument('--data-dir', help="Reutiliza (o crea) los datos sintéticos en este directorio")
+    parser.add_argument('--repeat', type=int, default=9)
+    parser.add_argument('--baseline', default=BASELINE_FILE)
+    parser.add_argument('--save-baseline', action='store_true', help="Guarda los tiempos como referencia de la escala")
+    parser.add_argument('--snapshot', action='store_true', help="Mide el arranque desde la instantánea de data/.dataset")
+    parser.add_argument('--threshold', type=float, default=THRESHOLD, help="Empeoramiento admitido (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix='finanzas-bench-')
+    try:
+        if not os.path.exists(os.path.join(data_dir, 'activos.csv')):
+            print(f"Generando datos sintéticos ({args.scale}) en {data_dir}...")
+            synthetic_data.generate(data_dir, **synthetic_data.SCALES[args.scale])
+        use_data_dir(data_dir)
+        before = calibrate()
+        results = run(args.repeat, args.snapshot)
+        calibration = max(before, calibrate())  # The slower of both, in case the machine slowed down meanwhile
+    finally:
+        if not args.data_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    scale = args.scale + ('+snapshot' if args.snapshot else '')
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baselines = json.load(f)
+
+    if args.save_baseline:
+        baselines[scale] = {'environment': _environment(), 'calibration_ms': round(calibration, 2), 'results': results}
+        with open(args.baseline, 'w') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+
+    entry = baselines.get(scale, {})
+    baseline = entry.get('results', {})
+    speed = calibration / entry['calibration_ms'] if entry.get('calibration_ms') else 1.0
+    if 1 / MACHINE_RATIO < speed < MACHINE_RATIO:
+        speed = 1.0  # Calibration noise on the same machine is larger than what it would correct
+    rows = compare(results, baseline, args.threshold, speed=speed)
+    compared = {(name, mode): (reference, regressed) for name, mode, reference, _, regressed in rows}
+    print(f"\nCalibración: {calibration:.1f} ms (referencia escalada x{speed:.2f})")
+    print(f"\n{'Función':<34} {'modo':<5} {'base ms':>10} {'actual ms':>10}")
+    for name, timings in results.items():
+        for mode, current in timings.items():
+            reference, regressed = compared.get((name, mode), (None, False))
+            ref_text = f"{reference:>10.1f}" if reference is not None else f"{'-':>10}"
+            print(f"{name:<34} {mode:<5} {ref_text} {current:>10.1f}{'  ❌ REGRESIÓN' if regressed else ''}")
+
+    if args.save_baseline:
+        print(f"\n✅ Referencia '{scale}' guardada en {args.baseline}")
+    elif not baseline:
+        print(f"\n❌ No hay referencia para '{scale}'; ejecuta con --save-baseline para crearla.")
+        sys.exit(1)
+    regressions = [r for r in rows if r[4]]
+    if regressions and not args.save_baseline:
+        print(f"\n❌ {len(regressions)} tiempos empeoran más de un {args.threshold:.0%} respecto a la referencia.")
+        sys.exit(1)
@@ -0,0 +1,84 @@
+"""
+Parse time and resident bytes of every frame returned by load_data(), for the untyped read
+(read_csv defaults, object strings, Period months) and the typed one logic.py uses.
+
+    python scripts/memory_report.py --scale large
+    python scripts/memory_report.py --data-dir data
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+import pandas as pd
+import benchmark
+import logic
+import synthetic_data
+
+FRAMES = ('activos', 'cartera', 'ingresos', 'gastos', 'aportaciones')
+
+def untyped_parse(store):
+    """load_data() payload read the untyped way: inferred dtypes, dates converted afterwards, Period months."""
+    activos, cartera = store.read('activos'), store.read('cartera')
+    ingresos, gastos, aportaciones = store.read('ingresos'), store.read('gastos_variables'), store.read('aportaciones')
+    for df in (ingresos, gastos, aportaciones):
+        if not df.empty:
+            df['fecha'] = pd.to_datetime(df['fecha'])
+    recurrentes = store.read('gastos_recurrentes')
+    if not recurrentes.empty and not gastos.empty:
+        expanded = logic.expand_recurrent_expenses(recurrentes, pd.Period(gastos['fecha'].min(), 'M'),
+                                                   pd.Period(datetime.now(), 'M'))
+        gastos = pd.concat([gastos, expanded], ignore_index=True)
+    for df in (ingresos, gastos, aportaciones):
+        if not df.empty:
+            df['periodo'] = df['fecha'].dt.to_period('M')
+            df.sort_values(by='fecha', inplace=True, kind='stable')
+    return activos, cartera, ingresos, gastos, aportaciones
+
+def frame_bytes(payload):
+    """{frame: bytes} with the strings of object columns included."""
+    return {name: int(df.memory_usage(deep=True).sum()) for name, df in zip(FRAMES, payload)}
+
+def measure(parse, repeat=3):
+    """(best parse ms, {frame: bytes}) over 'repeat' runs."""
+    best, payload = None, None
+    for _ in range(repeat):
+        logic.reset_caches()
+        start = time.perf_counter()
+        payload = parse()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best, frame_bytes(payload)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', choices=synthetic_data.SCALES, default='large')
+    parser.add_argument('--data-dir', help="Directorio de datos a medir (por defecto, datos sintéticos temporales)")
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix='finanzas-memoria-')
+    try:
+        if not os.path.exists(os.path.join(data_dir, 'activos.csv')):
+            print(f"Generando datos sintéticos ({args.scale}) en {data_dir}...")
+            synthetic_data.generate(data_dir, **synthetic_data.SCALES[args.scale])
+        benchmark.use_data_dir(data_dir)
+        logic.sync_portfolio()
+        store = logic.get_storage()
+        before_ms, before = measure(lambda: untyped_parse(store), args.repeat)
+        after_ms, after = measure(lambda: logic._parse_data(store, logic._table_versions(store)), args.repeat)
+    finally:
+        if not args.data_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    print(f"\n{'Tabla':<14} {'antes MB':>10} {'después MB':>11} {'ahorro':>8}")
+    for name in FRAMES:
+        saving = 1 - after[name] / before[name] if before[name] else 0
+        print(f"{name:<14} {before[name] / 2**20:>10.2f} {after[name] / 2**20:>11.2f} {saving:>8.0%}")
+    total_before, total_after = sum(before.values()), sum(after.values())
+    print(f"{'total':<14} {total_before / 2**20:>10.2f} {total_after / 2**20:>11.2f} {1 - total_after / total_before:>8.0%}")
+    print(f"\nLectura: {before_ms:.0f} ms -> {after_ms:.0f} ms")
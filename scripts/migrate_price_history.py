@@ -0,0 +1,15 @@
+"""One-shot migration of data/precios_historicos.csv into the partitioned Parquet price store."""
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src', 'web'))
+import logic
+import price_store
+
+if __name__ == "__main__":
+    if not os.path.exists(logic.HISTORY_FILE):
+        print(f"ERROR: No se encuentra {logic.HISTORY_FILE}")
+        sys.exit(1)
+    rows = price_store.migrate_from_csv(logic.HISTORY_FILE, logic.HISTORY_STORE_DIR)
+    print(f"✅ {rows} precios migrados a {logic.HISTORY_STORE_DIR}")
+    print("El CSV original no se modifica; puede archivarse una vez verificado el dashboard.")
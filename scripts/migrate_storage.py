@@ -0,0 +1,35 @@
+"""Moves the ledgers between the CSV layout of data/ and the SQLite backend (STORAGE_BACKEND=sqlite)."""
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src', 'web'))
+import logic
+import storage
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('direction', choices=['import', 'export'],
+                        help="import: CSV -> SQLite; export: SQLite -> CSV")
+    parser.add_argument('--data-dir', default=logic.DATA_DIR, help="Directorio con los CSV")
+    parser.add_argument('--db', default=logic.DATABASE_FILE, help="Base de datos SQLite")
+    args = parser.parse_args()
+
+    if args.direction == 'import':
+        if not os.path.exists(os.path.join(args.data_dir, 'activos.csv')):
+            print(f"ERROR: No se encuentra activos.csv en {args.data_dir}")
+            sys.exit(1)
+        counts = storage.import_csv(args.data_dir, args.db)
+        target = args.db
+    else:
+        if not os.path.exists(args.db):
+            print(f"ERROR: No se encuentra {args.db}")
+            sys.exit(1)
+        counts = storage.export_csv(args.db, args.data_dir)
+        target = args.data_dir
+
+    for name, rows in counts.items():
+        print(f"  {name:<20} {rows:>8} filas")
+    print(f"✅ Datos copiados a {target}")
+    if args.direction == 'import':
+        print("Los CSV no se modifican. Arranca con STORAGE_BACKEND=sqlite para usar la base de datos.")
@@ -0,0 +1,141 @@
+"""Deterministic synthetic ledgers (same seed and sizes -> same files) for benchmarks and load tests."""
+import argparse
+import json
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src', 'web'))
+import price_store
+
+# Sizes of each scale; 'medium' is the benchmark's default and the one with a stored baseline
+SCALES = {
+    'small': dict(n_assets=10, years=2, n_operations=2_000, n_expenses=5_000, n_recurring=10),
+    'medium': dict(n_assets=20, years=5, n_operations=20_000, n_expenses=50_000, n_recurring=20),
+    'large': dict(n_assets=50, years=10, n_operations=100_000, n_expenses=500_000, n_recurring=50),
+}
+END_DATE = '2025-12-31'
+ASSET_TYPES = ['Renta Variable', 'Renta Variable', 'Renta Fija', 'Monetario']
+EXPENSE_CATEGORIES = ['Comida', 'Casa', 'Transporte', 'Ocio', 'Viajes', 'Salud', 'Ropa', 'Regalos', 'Educación', 'Otros']
+CONCEPTS = ['Supermercado', 'Restaurante', 'Gasolina', 'Cine', 'Farmacia', 'Tienda', 'Online', 'Mercado']
+OPERATION_TYPES = ['COMPRA', 'VENTA', 'TRASPASO_ENTRADA', 'TRASPASO_SALIDA']
+OPERATION_WEIGHTS = [0.7, 0.15, 0.075, 0.075]
+
+def _days(start, end, rng, n):
+    """'n' sorted random dates between 'start' and 'end' (inclusive)."""
+    span = (end - start).days + 1
+    return start + pd.to_timedelta(np.sort(rng.integers(0, span, n)), unit='D')
+
+def _fmt(dates):
+    return pd.DatetimeIndex(dates).strftime('%Y-%m-%d')
+
+def generate(data_dir, n_assets=50, years=10, n_operations=100_000, n_expenses=500_000, n_recurring=50,
+             seed=42, end_date=END_DATE):
+    """
+    Writes activos, aportaciones, ingresos, gastos_variables and gastos_recurrentes CSVs, the
+    Parquet price store (one price per business day and asset) and latest_prices.json into
+    'data_dir'. Returns {file: rows}.
+    """
+    rng = np.random.default_rng(seed)
+    end = pd.Timestamp(end_date)
+    start = end - pd.DateOffset(years=years) + pd.Timedelta(days=1)
+    os.makedirs(data_dir, exist_ok=True)
+    counts = {}
+
+    # Catalog: funds plus the cash account
+    ids = [f"F{i:03d}" for i in range(n_assets)]
+    activos = pd.DataFrame({
+        'id': ids + ['CASH_DIG'],
+        'nombre': [f"Fondo Sintético {i} {ASSET_TYPES[i % len(ASSET_TYPES)]} Acc" for i in range(n_assets)] + ['Cuenta Efectivo'],
+        'isin': [f"IE{i:010d}" for i in range(n_assets)] + ['CASH'],
+        'tipo': [ASSET_TYPES[i % len(ASSET_TYPES)] for i in range(n_assets)] + ['Efectivo'],
+        'fuente': ['quefondos'] * n_assets + ['manual'],
+        'precio_actual': [100.0] * n_assets + [1.0]
+    })
+    activos.to_csv(os.path.join(data_dir, 'activos.csv'), index=False)
+    counts['activos'] = len(activos)
+
+    # Prices: geometric random walk per asset over business days
+    days = pd.bdate_range(start, end)
+    returns = rng.normal(0.0003, 0.01, size=(len(days), n_assets))
+    prices = np.round(rng.uniform(10, 300, n_assets) * np.exp(np.cumsum(returns, axis=0)), 4)
+    hist = pd.DataFrame({
+        'fecha': np.repeat(days.to_numpy(), n_assets + 1),
+        'id_activo': np.tile(ids + ['CASH_DIG'], len(days)),
+        'precio': np.hstack([prices, np.ones((len(days), 1))]).ravel()
+    })
+    tmp_csv = os.path.join(data_dir, '.precios_sinteticos.csv')
+    hist.to_csv(tmp_csv, index=False)
+    counts['precios'] = price_store.migrate_from_csv(tmp_csv, os.path.join(data_dir, 'precios_historicos'))
+    os.remove(tmp_csv)
+    with open(os.path.join(data_dir, 'latest_prices.json'), 'w') as f:
+        json.dump({**dict(zip(ids, prices[-1].tolist())), 'CASH_DIG': 1.0}, f)
+
+    # Operations: an initial cash deposit, then buys, sells and transfers at that day's price
+    op_days = _days(start, end, rng, n_operations)
+    assets = rng.integers(0, n_assets, n_operations)
+    price_at = prices[np.clip(days.searchsorted(op_days), 0, len(days) - 1), assets]
+    titulos = np.round(rng.uniform(0.5, 20, n_operations), 4)
+    aportaciones = pd.DataFrame({
+        'fecha': _fmt(op_days),
+        'tipo': rng.choice(OPERATION_TYPES, n_operations, p=OPERATION_WEIGHTS),
+        'id_activo': np.array(ids)[assets],
+        'cantidad_dinero': np.round(titulos * price_at, 2),
+        'titulos': titulos,
+        'precio_titulo': np.round(price_at, 4),
+        'notas': 'Sintético'
+    })
+    inicial = pd.DataFrame([{'fecha': _fmt([start])[0], 'tipo': 'INICIAL', 'id_activo': 'CASH_DIG',
+                             'cantidad_dinero': 1_000_000.0, 'titulos': 1_000_000.0, 'precio_titulo': 1.0, 'notas': 'Inicial'}])
+    aportaciones = pd.concat([inicial, aportaciones], ignore_index=True)
+    aportaciones.to_csv(os.path.join(data_dir, 'aportaciones.csv'), index=False)
+    counts['aportaciones'] = len(aportaciones)
+
+    # Income: monthly payroll plus a few extras per year
+    months = pd.date_range(start, end, freq='MS') + pd.Timedelta(days=24)
+    n_extras = years * 3
+    ingresos = pd.concat([
+        pd.DataFrame({'fecha': months, 'cantidad': np.round(rng.normal(2800, 150, len(months)), 2),
+                      'concepto': 'Nómina', 'categoria': 'Trabajo'}),
+        pd.DataFrame({'fecha': _days(start, end, rng, n_extras), 'cantidad': np.round(rng.uniform(100, 2000, n_extras), 2),
+                      'concepto': 'Extra', 'categoria': 'Otros'})
+    ]).sort_values('fecha', kind='stable')
+    ingresos['fecha'] = _fmt(ingresos['fecha'])
+    ingresos.to_csv(os.path.join(data_dir, 'ingresos.csv'), index=False)
+    counts['ingresos'] = len(ingresos)
+
+    gastos = pd.DataFrame({
+        'fecha': _fmt(_days(start, end, rng, n_expenses)),
+        'cantidad': np.round(rng.exponential(40, n_expenses) + 1, 2),
+        'categoria': rng.choice(EXPENSE_CATEGORIES, n_expenses),
+        'concepto': rng.choice(CONCEPTS, n_expenses)
+    })
+    gastos.to_csv(os.path.join(data_dir, 'gastos_variables.csv'), index=False)
+    counts['gastos_variables'] = len(gastos)
+
+    recurrentes = pd.DataFrame({
+        'dia': rng.integers(1, 32, n_recurring),
+        'cantidad': np.round(rng.uniform(5, 900, n_recurring), 2),
+        'categoria': rng.choice(EXPENSE_CATEGORIES[:4], n_recurring),
+        'concepto': [f"Recibo {i}" for i in range(n_recurring)]
+    })
+    recurrentes.to_csv(os.path.join(data_dir, 'gastos_recurrentes.csv'), index=False)
+    counts['gastos_recurrentes'] = len(recurrentes)
+    return counts
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('data_dir', help="Directorio de destino (se sobrescriben los ficheros)")
+    parser.add_argument('--scale', choices=SCALES, default='large')
+    parser.add_argument('--seed', type=int, default=42)
+    for name in SCALES['large']:
+        parser.add_argument(f"--{name.replace('_', '-')}", type=int, dest=name, help="Sobrescribe el tamaño de la escala")
+    args = parser.parse_args()
+
+    sizes = dict(SCALES[args.scale])
+    sizes.update({k: getattr(args, k) for k in sizes if getattr(args, k) is not None})
+    counts = generate(args.data_dir, seed=args.seed, **sizes)
+    for name, rows in counts.items():
+        print(f"  {name:<20} {rows:>8} filas")
+    print(f"✅ Datos sintéticos ({args.scale}) escritos en {args.data_dir}")
@@ -1,15 +1,116 @@
-from flask import Flask, render_template, redirect, url_for, flash
+from flask import Flask, render_template, redirect, url_for, flash, request, session, make_response, jsonify, g
+from flask import before_render_template, template_rendered, abort, send_from_directory
+from functools import wraps
+import hashlib
+import os
+import time
 import logic
+import metrics
+import profiler
 import pandas as pd
 
 app = Flask(__name__)
 app.secret_key = 'secure_key_dashboard'
 
+@app.before_request
+def _start_timing():
+    g.request_start = time.perf_counter()
+    metrics.start_request()
+
+@app.after_request
+def _add_server_timing(response):
+    """Per-stage timings of this request as a Server-Timing header, plus the request histogram."""
+    start = g.pop('request_start', None)
+    if start is None:
+        return response
+    total = time.perf_counter() - start
+    response.headers['Server-Timing'] = metrics.server_timing(metrics.request_stages(), total)
+    endpoint = request.endpoint or 'unknown'
+    metrics.observe('finance_request_seconds', total, help='Latency of the HTTP requests by endpoint.', endpoint=endpoint)
+    metrics.inc('finance_requests_total', help='HTTP requests by endpoint and status.', endpoint=endpoint, status=response.status_code)
+    return response
+
+def _template_started(sender, template, context, **extra):
+    g.render_start = time.perf_counter()
+
+def _template_finished(sender, template, context, **extra):
+    start = g.pop('render_start', None)
+    if start is not None:
+        metrics.record_stage('render', time.perf_counter() - start)
+
+before_render_template.connect(_template_started, app)
+template_rendered.connect(_template_finished, app)
+
+@app.after_request
+def _save_snapshot(response):
+    # Artifacts rebuilt by this request are kept for the next process started on the same data
+    logic.schedule_artifacts_snapshot()
+    return response
+
+def _profiles_dir():
+    return os.path.join(logic.DATA_DIR, 'profiles')
+
+@app.before_request
+def _start_profile():
+    # Registered after _start_timing: starts later and stops earlier, so the capture is the view's work
+    mode = profiler.requested_mode(request.args.get('profile') or request.headers.get('X-Profile'))
+    if mode:
+        g.profile = profiler.start(mode)
+        g.profile_busy = g.profile is None
+
+@app.after_request
+def _save_profile(response):
+    capture = g.pop('profile', None)
+    if capture is not None:
+        response.headers['X-Profile'] = profiler.stop(capture, _profiles_dir(), request.endpoint or request.path)
+    elif g.pop('profile_busy', False):
+        response.headers['X-Profile'] = 'busy'
+    return response
+
+def _templates_version():
+    """Hash of this module and the templates: the rendering side of what a page depends on."""
+    digest = hashlib.sha1()
+    with open(__file__, 'rb') as f:
+        digest.update(f.read())
+    for root, _, files in sorted(os.walk(os.path.join(app.root_path, app.template_folder))):
+        for name in sorted(files):
+            digest.update(name.encode())
+            with open(os.path.join(root, name), 'rb') as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+TEMPLATES_VERSION = _templates_version()
+
+def conditional_get(view):
+    """
+    Strong ETag from the code version, the data fingerprint, the URL and the session cookie (flashes, import preview).
+    A matching If-None-Match is answered with 304 before the view (and any pandas work) runs.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        session_cookie = request.cookies.get(app.config['SESSION_COOKIE_NAME'], '')
+        # After a deploy the same data renders differently: old validators must not match
+        key = (f"{logic.CODE_VERSION}|{TEMPLATES_VERSION}|{logic.get_data_fingerprint()}"
+               f"|{request.full_path}|{session_cookie}")
+        etag = hashlib.sha1(key.encode()).hexdigest()
+
+        if request.if_none_match.contains(etag):
+            response = make_response('', 304)
+        else:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'  # Always revalidate
+        response.vary.add('Cookie')
+        return response
+    return wrapper
+
 @app.route('/')
+@conditional_get
 def index():
     portfolio = logic.get_portfolio_summary()
     flow_data = logic.get_financial_flow(portfolio_summary=portfolio) 
-    charts = logic.create_charts(portfolio, flow_data)
     
     # Available periods for the selector
     ing_ts = flow_data.get('ingresos_ts', pd.DataFrame())
@@ -28,9 +129,9 @@ def index():
     _, _, _, _, aportaciones = logic.load_data()
     if not aportaciones.empty:
         # Group by month and sum quantity
-        monthly_inv = aportaciones.groupby(aportaciones['fecha'].dt.to_period('M'))['cantidad_dinero'].sum().reset_index()
-        monthly_inv['periodo'] = monthly_inv['fecha'].astype(str)
-        monthly_inv = monthly_inv.sort_values('fecha', ascending=False).head(12) # Last 12 months
+        monthly_inv = aportaciones.groupby('periodo')['cantidad_dinero'].sum().reset_index()
+        monthly_inv = monthly_inv.sort_values('periodo', ascending=False).head(12) # Last 12 months
+        monthly_inv['periodo'] = logic.month_label(monthly_inv['periodo'])
         monthly_investments = monthly_inv.to_dict('records')
     else:
         monthly_investments = []
@@ -40,21 +141,49 @@ def index():
     return render_template('dashboard.html', 
                            portfolio=portfolio, 
                            forecast=forecast,
-                           charts=charts,
                            monthly_investments=monthly_investments,
                            available_periods=available_periods,
                            monthly_detail=monthly_detail,
                            sankey_data=sankey_data)
 
 @app.route('/api/monthly-detail/<period>')
+@conditional_get
 def api_monthly_detail(period):
-    from flask import request
-    window = request.args.get('window', 1, type=int)
+    window = min(max(request.args.get('window', 1, type=int), 1), logic.MAX_WINDOW)
     detail = logic.get_monthly_cashflow_detail(periodo=period, window=window)
     sankey = logic.get_sankey_data(periodo=period, window=window)
     return {'detail': detail, 'sankey': sankey}
 
+@app.route('/api/charts/<name>')
+@conditional_get
+def api_chart(name):
+    if name not in logic.CHARTS:
+        return {'error': 'Gráfico no encontrado'}, 404
+    return jsonify(logic.get_chart(name))
+
+@app.route('/api/cache-stats')
+def api_cache_stats():
+    return logic.get_cache_stats()
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Stage and request latency histograms, cache hit ratios and scraper counters of this process."""
+    return app.response_class(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/profiles')
+def profiles_index():
+    if not profiler.ENABLED:
+        abort(404)
+    return render_template('profiles.html', profiles=profiler.list_profiles(_profiles_dir()))
+
+@app.route('/profiles/<path:name>')
+def profile_file(name):
+    if not profiler.ENABLED:
+        abort(404)
+    return send_from_directory(_profiles_dir(), name, as_attachment=True)
+
 @app.route('/detail')
+@conditional_get
 def detail():
     portfolio = logic.get_portfolio_summary()
     expenses_data = logic.get_expense_breakdown()
@@ -67,21 +196,41 @@ def detail():
 
 @app.route('/update-prices', methods=['POST'])
 def update_prices():
-    success, message = logic.refresh_market_data()
-    if success:
-        flash(message, 'success')
+    job_id, started = logic.start_refresh_job()
+    if request.accept_mimetypes.best == 'application/json':
+        return {'job_id': job_id, 'joined': not started,
+                'status_url': url_for('api_refresh_status', job_id=job_id)}, 202
+    if started:
+        flash("Actualización de precios iniciada.", 'info')
     else:
-        flash(message, 'danger')
+        flash("Ya hay una actualización de precios en curso.", 'info')
     return redirect(url_for('index'))
 
+@app.route('/api/refresh/<job_id>')
+def api_refresh_status(job_id):
+    job = logic.get_refresh_job(job_id)
+    if job is None:
+        return {'error': 'Trabajo no encontrado'}, 404
+    # Report the outcome once, on the page the poller reloads into
+    if job['status'] != 'running' and session.get('refresh_reported') != job_id:
+        flash(job['message'], 'success' if job['status'] == 'done' else 'danger')
+        session['refresh_reported'] = job_id
+    return job
+
 @app.route('/data')
+@conditional_get
 def data_view():
+    return _render_data_view()
+
+def _render_data_view(**extra):
     activos, cartera, ingresos, gastos, aportaciones = logic.load_data()
     
     def df_to_html(df, sort_col=None):
         if df is None or df.empty: return None
         if sort_col and sort_col in df.columns:
             df = df.sort_values(by=sort_col, ascending=False)
+        if 'periodo' in df.columns:
+            df = df.assign(periodo=logic.month_label(df['periodo']))
         return df.to_html(classes="table table-striped table-sm", index=False, float_format=lambda x: "{:,.2f}".format(x))
 
     tables = {
@@ -99,11 +248,11 @@ def data_view():
     return render_template('data.html', 
                            tables=tables, 
                            assets=assets_list, 
-                           now_date=pd.Timestamp.now().strftime('%Y-%m-%d'))
+                           now_date=pd.Timestamp.now().strftime('%Y-%m-%d'),
+                           **extra)
 
 @app.route('/add-contribution', methods=['POST'])
 def add_contribution():
-    from flask import request
     data = {
         'fecha': request.form.get('fecha'),
         'tipo': request.form.get('tipo'),
@@ -125,7 +274,6 @@ def add_contribution():
 
 @app.route('/add-transfer', methods=['POST'])
 def add_transfer():
-    from flask import request
     data = {
         'fecha': request.form.get('fecha'),
         'id_origen': request.form.get('id_origen'),
@@ -149,7 +297,6 @@ def add_transfer():
 
 @app.route('/import-myinvestor', methods=['POST'])
 def import_myinvestor():
-    from flask import request, session
     
     # Check if this is a confirmation of a preview
     if request.form.get('confirm') == 'true':
@@ -191,9 +338,41 @@ def import_myinvestor():
     session.pop('import_is_duplicate', None)
     return redirect(url_for('data_view'))
 
+BATCH_FIELDS = ['fecha', 'tipo', 'id_activo', 'cantidad_dinero', 'titulos', 'precio_titulo']
+
+@app.route('/import-myinvestor-batch', methods=['POST'])
+def import_myinvestor_batch():
+    # Confirmation: rows travel as hidden fields, only the checked ones are saved
+    if request.form.get('confirm') == 'true':
+        accepted = request.form.getlist('accept')
+        # Rows the preview flagged as duplicates were unchecked: keeping one is an explicit override
+        items = [{**{f: request.form.get(f"{f}_{i}") for f in BATCH_FIELDS}, 'force': bool(request.form.get(f"duplicate_{i}"))}
+                 for i in accepted]
+        if not items:
+            flash("No se ha seleccionado ninguna operación.", 'warning')
+            return redirect(url_for('data_view'))
+        success, message = logic.import_myinvestor_batch(items)
+        flash(message, 'success' if success else 'danger')
+        return redirect(url_for('data_view'))
+
+    # Preview: pasted subjects and/or an .eml/.mbox export
+    upload = request.files.get('mailbox')
+    content = upload.read() if upload and upload.filename else None
+    try:
+        subjects = logic.extract_myinvestor_subjects(request.form.get('subjects'),
+                                                     upload.filename if content else None, content)
+    except Exception as e:
+        flash(f"No se pudo leer el fichero: {e}", 'danger')
+        return redirect(url_for('data_view'))
+    if not subjects:
+        flash("No se encontraron asuntos de MyInvestor.", 'warning')
+        return redirect(url_for('data_view'))
+
+    # Rendered directly: hundreds of rows do not fit in the session cookie
+    return _render_data_view(batch_preview=logic.preview_myinvestor_batch(subjects))
+
 @app.route('/cancel-import')
 def cancel_import():
-    from flask import session
     session.pop('import_preview', None)
     session.pop('import_is_duplicate', None)
     return redirect(url_for('data_view'))
@@ -0,0 +1,77 @@
+from collections import Counter
+
+GRAM = 3
+
+def _grams(text):
+    """Distinct character trigrams of 'text' (empty for shorter strings)."""
+    return {text[i:i + GRAM] for i in range(len(text) - GRAM + 1)}
+
+class AssetMatcher:
+    """
+    Resolves asset names from broker emails against a catalog of (id, nombre, nombre_norm).
+    Names are indexed by character trigram, so each stage only verifies the few entries that
+    can possibly match. Stages and tie-breaks (first entry in catalog order) are those of the
+    original linear search:
+    1. the search is contained in the catalog name,
+    2. the catalog name is contained in the search,
+    3. most significant words (> 3 chars) of the search appear in the catalog name.
+    """
+
+    def __init__(self, entries):
+        self.entries = list(entries)
+        self.postings = {}    # trigram -> set of entry positions
+        self.n_grams = []     # distinct trigrams per entry
+        self.short = []       # entries too short to have trigrams
+        for pos, (_, _, nombre_norm) in enumerate(self.entries):
+            grams = _grams(nombre_norm)
+            self.n_grams.append(len(grams))
+            if not grams:
+                self.short.append(pos)
+            for g in grams:
+                self.postings.setdefault(g, set()).add(pos)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _containing(self, text):
+        """Positions of the entries whose name contains 'text', ascending."""
+        grams = _grams(text)
+        if not grams:
+            candidates = range(len(self.entries))
+        else:
+            sets = sorted((self.postings.get(g, set()) for g in grams), key=len)
+            candidates = sorted(set.intersection(*sets))
+        return [pos for pos in candidates if text in self.entries[pos][2]]
+
+    def _contained_in(self, text):
+        """Positions of the entries whose name is contained in 'text', ascending."""
+        hits = Counter()
+        for g in _grams(text):
+            for pos in self.postings.get(g, ()):
+                hits[pos] += 1
+        # Every trigram of the name must appear in the text
+        candidates = sorted([pos for pos, n in hits.items() if n == self.n_grams[pos]] + self.short)
+        return [pos for pos in candidates if self.entries[pos][2] in text]
+
+    def match(self, search_norm):
+        """(id, nombre) of the best entry for an already normalized name, or None."""
+        for stage in (self._containing, self._contained_in):
+            found = stage(search_norm)
+            if found:
+                asset_id, nombre, _ = self.entries[found[0]]
+                return asset_id, nombre
+
+        words = [w for w in search_norm.split() if len(w) > 3]  # Only significant words
+        if not words or not self.entries:
+            return None
+        scores = Counter()
+        for w in words:
+            for pos in self._containing(w):
+                scores[pos] += 1
+        if not scores:
+            return None
+        best_score = max(scores.values())
+        if best_score < len(words) * 0.6:  # At least 60% of significant words must match
+            return None
+        asset_id, nombre, _ = self.entries[min(pos for pos, s in scores.items() if s == best_score)]
+        return asset_id, nombre
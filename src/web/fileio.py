@@ -0,0 +1,120 @@
+import csv
+import io
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+try:
+    import fcntl
+except ImportError:  # Windows: only threads of this process are serialized
+    fcntl = None
+
+_thread_locks = {}
+_thread_locks_guard = threading.Lock()
+
+def _thread_lock(path):
+    with _thread_locks_guard:
+        return _thread_locks.setdefault(os.path.abspath(path), threading.RLock())
+
+@contextmanager
+def locked(path):
+    """
+    Exclusive lock on 'path' shared by threads and processes (flock on a '<path>.lock' sidecar,
+    so the data file itself can be replaced while locked).
+    """
+    with _thread_lock(path):
+        if fcntl is None:
+            yield
+            return
+        with open(f"{path}.lock", 'a') as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+def read_header(path):
+    """Column names of a CSV file ([] when it does not exist or is empty)."""
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', newline='', encoding='utf-8') as f:
+        return next(csv.reader(f), [])
+
+def _format(value):
+    return '' if value is None else value
+
+def append_csv_rows(path, rows, columns):
+    """
+    Appends 'rows' (dicts) to a CSV with a single write; the caller holds locked(path).
+    Values follow the existing header order (missing ones are left empty); a new or empty file
+    gets 'columns' as header. Returns False, writing nothing, when a row has a column the header lacks.
+    """
+    header = read_header(path)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    if not header:
+        header = list(columns)
+        writer.writerow(header)
+    elif any(k not in header for row in rows for k in row):
+        return False
+
+    for row in rows:
+        writer.writerow([_format(row.get(col)) for col in header])
+
+    payload = buffer.getvalue()
+    with open(path, 'a+b') as f:
+        # Previous content without a trailing newline would swallow the first appended row
+        if f.tell() > 0:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b'\n':
+                payload = '\n' + payload
+        f.write(payload.encode('utf-8'))
+        f.flush()
+        os.fsync(f.fileno())
+    return True
+
+@contextmanager
+def atomic_open(path, mode='w', **kwargs):
+    """
+    Opens a temporary file next to 'path' and renames it over 'path' once the block succeeds.
+    Readers see either the old or the new content, never a partial write.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix='.tmp')
+    try:
+        # mkstemp creates the file as 0600: keep the permissions of the file being replaced
+        os.chmod(tmp_path, os.stat(path).st_mode & 0o777 if os.path.exists(path) else 0o644)
+        with os.fdopen(fd, mode, **kwargs) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def write_json(path, data):
+    with atomic_open(path, 'w') as f:
+        json.dump(data, f)
+
+def write_csv(df, path, **kwargs):
+    with atomic_open(path, 'w', newline='') as f:
+        df.to_csv(f, **kwargs)
+
+def read_counter(path):
+    """Integer stored in 'path' (0 when missing or unreadable)."""
+    try:
+        with open(path, 'r') as f:
+            return int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+def bump_counter(path):
+    """Atomically increments the counter in 'path' and returns the new value."""
+    with locked(path):
+        value = read_counter(path) + 1
+        with atomic_open(path, 'w') as f:
+            f.write(str(value))
+        return value
@@ -0,0 +1,304 @@
+import pandas as pd
+import hashlib
+import json
+import io
+import os
+import fileio
+
+ENTRY_TYPES = ['INICIAL', 'COMPRA', 'TRASPASO_ENTRADA']
+EXIT_TYPES = ['VENTA', 'TRASPASO_SALIDA']
+CARTERA_COLUMNS = ['id_activo', 'participaciones', 'precio_medio_compra']
+
+CHECKPOINT_VERSION = 1
+
+# In-memory copy of the last checkpoint (same structure as the JSON file on disk)
+_state = {
+    'checkpoint': None,
+    'checkpoint_stat': None  # (mtime_ns, size) of the checkpoint file when it was last read or written
+}
+
+def _py(value):
+    """Converts numpy scalars to plain Python values (JSON friendly)."""
+    return value.item() if hasattr(value, 'item') else value
+
+def apply_operation(portfolio, asset_id, tipo, titulos_op, cantidad_op, precio_op):
+    """Applies a single operation to the running portfolio state (in place)."""
+    if asset_id not in portfolio:
+        portfolio[asset_id] = {'participaciones': 0.0, 'precio_medio_compra': 0.0}
+
+    current = portfolio[asset_id]
+
+    if tipo in ENTRY_TYPES:
+        total_cost_old = current['participaciones'] * current['precio_medio_compra']
+        total_cost_new = titulos_op * precio_op
+        new_shares = current['participaciones'] + titulos_op
+
+        if new_shares > 0:
+            new_avg = (total_cost_old + total_cost_new) / new_shares
+            current['participaciones'] = new_shares
+            current['precio_medio_compra'] = round(new_avg, 2)
+
+        # Handle CASH impact for COMPRA (INICIAL has no cash impact as it's the starting point)
+        if tipo == 'COMPRA' and 'CASH_DIG' in portfolio:
+            portfolio['CASH_DIG']['participaciones'] -= cantidad_op
+
+    elif tipo in EXIT_TYPES:
+        current['participaciones'] = max(0.0, current['participaciones'] - titulos_op)
+        if tipo == 'VENTA' and 'CASH_DIG' in portfolio:
+            portfolio['CASH_DIG']['participaciones'] += cantidad_op
+
+    elif tipo == 'AJUSTE_VALOR':
+        val = cantidad_op if cantidad_op > 0 else titulos_op
+        current['participaciones'] = val
+        current['precio_medio_compra'] = 1.0 # Reset cost basis for cash
+
+def _prepare_ops(df_ops):
+    """Parses dates and orders operations by date, with INICIAL first on the same date."""
+    df_ops = df_ops.copy()
+    df_ops['fecha'] = pd.to_datetime(df_ops['fecha'])
+    df_ops['tipo_rank'] = (df_ops['tipo'].astype(str).str.upper() != 'INICIAL').astype(int)
+    df_ops.sort_values(by=['fecha', 'tipo_rank'], inplace=True)
+    return df_ops
+
+def replay(df_ops, portfolio=None):
+    """
+    Replays already prepared operations on top of 'portfolio'.
+    Returns the resulting portfolio and the sort key of the last operation applied.
+    """
+    portfolio = {} if portfolio is None else portfolio
+    last_key = None
+
+    tipos = df_ops['tipo'].astype(str).str.upper().str.strip()
+    titulos = df_ops['titulos'].astype(float).fillna(0.0)
+    cantidades = df_ops['cantidad_dinero'].astype(float).fillna(0.0)
+    precios = df_ops['precio_titulo'].astype(float).fillna(0.0)
+
+    for asset_id, tipo, titulos_op, cantidad_op, precio_op in zip(
+            df_ops['id_activo'], tipos, titulos, cantidades, precios):
+        apply_operation(portfolio, _py(asset_id), tipo, titulos_op, cantidad_op, precio_op)
+
+    if not df_ops.empty:
+        last = df_ops.iloc[-1]
+        last_key = (last['fecha'], int(last['tipo_rank']))
+    return portfolio, last_key
+
+def _parse_ops(raw_bytes):
+    """Parses CSV bytes into prepared operations (None if there is nothing to replay)."""
+    if not raw_bytes.strip():
+        return None
+    df_ops = pd.read_csv(io.BytesIO(raw_bytes))
+    if df_ops.empty or 'fecha' not in df_ops.columns:
+        return None
+    return _prepare_ops(df_ops)
+
+def _write_cartera(portfolio, cartera_path):
+    rows = []
+    for asset_id, data in portfolio.items():
+        rows.append({
+            'id_activo': asset_id,
+            'participaciones': round(data['participaciones'], 6),
+            'precio_medio_compra': round(data['precio_medio_compra'], 2)
+        })
+    df_final = pd.DataFrame(rows, columns=CARTERA_COLUMNS)
+    fileio.write_csv(df_final, cartera_path, index=False)
+    return os.stat(cartera_path).st_mtime_ns
+
+def _file_stat(path):
+    try:
+        st = os.stat(path)
+        return (st.st_mtime_ns, st.st_size)
+    except OSError:
+        return None
+
+def _load_checkpoint(checkpoint_path):
+    """
+    Returns the in-memory checkpoint, falling back to the persisted one. A persisted checkpoint
+    saved by another process (another worker) since the last read replaces the in-memory copy.
+    """
+    cp = _state['checkpoint']
+    stat = _file_stat(checkpoint_path) if checkpoint_path else None
+    if stat is not None and (cp is None or stat != _state['checkpoint_stat']):
+        _state['checkpoint_stat'] = stat
+        try:
+            with open(checkpoint_path, 'r') as f:
+                cp = json.load(f)
+            if cp.get('version') != CHECKPOINT_VERSION:
+                cp = None
+            else:
+                cp['portfolio'] = {a: {'participaciones': s, 'precio_medio_compra': p} for a, s, p in cp['portfolio']}
+                if cp['last_key'] is not None:
+                    cp['last_key'] = (pd.Timestamp(cp['last_key'][0]), cp['last_key'][1])
+        except Exception:
+            cp = None
+    return cp
+
+def _save_checkpoint(cp, checkpoint_path):
+    _state['checkpoint'] = cp
+    if not checkpoint_path:
+        return
+    data = dict(cp)
+    data['portfolio'] = [[a, v['participaciones'], v['precio_medio_compra']] for a, v in cp['portfolio'].items()]
+    if cp['last_key'] is not None:
+        data['last_key'] = [cp['last_key'][0].isoformat(), cp['last_key'][1]]
+    fileio.write_json(checkpoint_path, data)
+    _state['checkpoint_stat'] = _file_stat(checkpoint_path)
+
+def reset():
+    """Drops the in-memory checkpoint (the next sync will trust only the file on disk)."""
+    _state['checkpoint'] = None
+    _state['checkpoint_stat'] = None
+
+def sync(aportaciones_path, cartera_path, checkpoint_path=None, force_full=False):
+    """
+    Brings cartera.csv up to date with aportaciones.csv.
+
+    Only the operations appended since the last checkpoint are replayed. A full replay
+    happens when there is no valid checkpoint, when an earlier row was edited (the
+    already processed prefix of the file changed) or when an appended operation is
+    dated before the last one replayed.
+
+    Returns 'full', 'incremental' or None (nothing to do).
+    """
+    cp = None if force_full else _load_checkpoint(checkpoint_path)
+    if cp and 'offset' not in cp:
+        cp = None  # Checkpoint of the SQLite ledger (see sync_rows())
+
+    # Appends write under the ledger lock: holding it, the stat and the read see a complete file
+    with fileio.locked(aportaciones_path):
+        st = os.stat(aportaciones_path) if os.path.exists(aportaciones_path) else None
+        size = st.st_size if st else 0
+        mtime_ns = st.st_mtime_ns if st else None
+        unchanged = cp and cp['size'] == size and cp['mtime_ns'] == mtime_ns
+
+        raw = b''
+        if st and not unchanged:
+            with open(aportaciones_path, 'rb') as f:
+                raw = f.read()
+
+    cartera_mtime = os.stat(cartera_path).st_mtime_ns if os.path.exists(cartera_path) else None
+
+    # Fast path: nothing changed since the last sync
+    if unchanged:
+        if cartera_mtime != cp['cartera_mtime_ns']:
+            cp['cartera_mtime_ns'] = _write_cartera(cp['portfolio'], cartera_path)
+            _save_checkpoint(cp, checkpoint_path)
+        return None
+
+    header = raw.split(b'\n', 1)[0]
+
+    mode = 'full'
+    portfolio, last_key = None, None
+    replayed = True
+
+    if cp and 0 < cp['offset'] <= len(raw):
+        prefix = raw[:cp['offset']]
+        if (prefix.endswith(b'\n') and
+                hashlib.sha1(prefix).hexdigest() == cp['prefix_sha1'] and
+                header.decode('utf-8', 'replace') == cp['header']):
+            df_new = _parse_ops(header + b'\n' + raw[cp['offset']:])
+            if df_new is None:
+                mode = 'incremental'
+                portfolio, last_key = cp['portfolio'], cp['last_key']
+                replayed = False
+            else:
+                first = df_new.iloc[0]
+                first_key = (first['fecha'], int(first['tipo_rank']))
+                if cp['last_key'] is None or first_key >= cp['last_key']:
+                    mode = 'incremental'
+                    portfolio = {a: dict(v) for a, v in cp['portfolio'].items()}
+                    portfolio, last_key = replay(df_new, portfolio)
+
+    if mode == 'full':
+        df_ops = _parse_ops(raw)
+        portfolio, last_key = replay(df_ops) if df_ops is not None else ({}, None)
+
+    cp_cartera_mtime = cp['cartera_mtime_ns'] if cp else None
+    cp = {
+        'version': CHECKPOINT_VERSION,
+        'offset': len(raw),
+        'size': size,
+        'mtime_ns': mtime_ns,
+        'prefix_sha1': hashlib.sha1(raw).hexdigest(),
+        'header': header.decode('utf-8', 'replace'),
+        'last_key': last_key,
+        'portfolio': portfolio,
+        'cartera_mtime_ns': cartera_mtime
+    }
+    if replayed or cartera_mtime != cp_cartera_mtime:
+        cp['cartera_mtime_ns'] = _write_cartera(portfolio, cartera_path)
+    _save_checkpoint(cp, checkpoint_path)
+    return mode
+
+def _write_cartera_table(portfolio, store):
+    rows = [{'id_activo': asset_id,
+             'participaciones': round(data['participaciones'], 6),
+             'precio_medio_compra': round(data['precio_medio_compra'], 2)} for asset_id, data in portfolio.items()]
+    store.replace('cartera', pd.DataFrame(rows, columns=CARTERA_COLUMNS))
+    return list(store.version('cartera'))
+
+def sync_rows(store, checkpoint_path=None, force_full=False):
+    """
+    sync() for a SQLite store: brings its cartera table up to date with its aportaciones table.
+
+    The checkpoint keeps the last rowid replayed and the insert/edit counters of the table.
+    Rows inserted since then are replayed on top of the checkpoint; any update or delete,
+    or an inserted operation dated before the last one replayed, triggers a full replay.
+
+    Returns 'full', 'incremental' or None (nothing to do).
+    """
+    cp = None if force_full else _load_checkpoint(checkpoint_path)
+    if cp and 'rowid' not in cp:
+        cp = None  # Checkpoint of the CSV ledger
+
+    appends, edits = store.version('aportaciones')
+    cartera_version = list(store.version('cartera'))
+
+    # Fast path: nothing changed since the last sync
+    if cp and cp['appends'] == appends and cp['edits'] == edits:
+        if cartera_version != cp['cartera_version']:
+            cp['cartera_version'] = _write_cartera_table(cp['portfolio'], store)
+            _save_checkpoint(cp, checkpoint_path)
+        return None
+
+    mode = 'full'
+    portfolio, last_key, last_rowid = None, None, 0
+    replayed = True
+
+    if cp and cp['edits'] == edits:
+        df_new = store.read_after('aportaciones', cp['rowid'])
+        if df_new.empty:
+            mode = 'incremental'
+            portfolio, last_key, last_rowid = cp['portfolio'], cp['last_key'], cp['rowid']
+            replayed = False
+        else:
+            df_new = _prepare_ops(df_new)
+            first = df_new.iloc[0]
+            first_key = (first['fecha'], int(first['tipo_rank']))
+            if cp['last_key'] is None or first_key >= cp['last_key']:
+                mode = 'incremental'
+                portfolio = {a: dict(v) for a, v in cp['portfolio'].items()}
+                portfolio, last_key = replay(df_new, portfolio)
+                last_rowid = int(df_new['rowid'].max())
+
+    if mode == 'full':
+        df_ops = store.read_after('aportaciones', 0)
+        if df_ops.empty:
+            portfolio, last_key = {}, None
+        else:
+            portfolio, last_key = replay(_prepare_ops(df_ops))
+            last_rowid = int(df_ops['rowid'].max())
+
+    cp_cartera_version = cp['cartera_version'] if cp else None
+    cp = {
+        'version': CHECKPOINT_VERSION,
+        'rowid': last_rowid,
+        'appends': appends,
+        'edits': edits,
+        'last_key': last_key,
+        'portfolio': portfolio,
+        'cartera_version': cartera_version
+    }
+    if replayed or cartera_version != cp_cartera_version:
+        cp['cartera_version'] = _write_cartera_table(portfolio, store)
+    _save_checkpoint(cp, checkpoint_path)
+    return mode
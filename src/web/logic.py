@@ -1,13 +1,65 @@
 import pandas as pd
+import numpy as np
+import email
+import email.policy
+import hashlib
 import json
+import mailbox
 import os
+import pickle
 import re
-import market_data
+import tempfile
+import threading
+import time
+import fileio
+import ledger
+import metrics
+import shared_dataset
+import storage
+from asset_matcher import AssetMatcher
+from bisect import bisect_left, insort
 from datetime import datetime
 
 DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'data')
 PRICES_FILE = os.path.join(DATA_DIR, 'latest_prices.json')
-HISTORY_FILE = os.path.join(DATA_DIR, 'precios_historicos.csv')
+HISTORY_FILE = os.path.join(DATA_DIR, 'precios_historicos.csv')  # Legacy CSV, migrated to HISTORY_STORE_DIR
+HISTORY_STORE_DIR = os.path.join(DATA_DIR, 'precios_historicos')
+LEDGER_CHECKPOINT_FILE = os.path.join(DATA_DIR, '.ledger_checkpoint.json')
+DATA_VERSION_FILE = os.path.join(DATA_DIR, '.version')  # Bumped by every write, shared by all worker processes
+DATABASE_FILE = os.path.join(DATA_DIR, 'finanzas.db')
+REFRESH_JOBS_FILE = os.path.join(DATA_DIR, '.refresh_jobs.json')  # Price refresh jobs of every worker process
+# 'csv' (one file per ledger, the default) or 'sqlite' (DATABASE_FILE, see scripts/migrate_storage.py)
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'csv')
+SHARED_DATASET_DIR = os.path.join(DATA_DIR, '.dataset')
+# The parsed payload (and the artifacts built on it) is kept in SHARED_DATASET_DIR per source version:
+# workers map a single parsed copy, and a restarted process starts from it instead of parsing again
+SHARED_DATASET = os.environ.get('SHARED_DATASET', '1') == '1'
+
+def _code_version():
+    """Hash of the modules that parse the ledgers and build the views, plus the library versions the snapshot is written with."""
+    digest = hashlib.sha1(repr((pd.__version__, np.__version__, shared_dataset.pa.__version__)).encode())
+    for module in (__file__, storage.__file__, shared_dataset.__file__, ledger.__file__, fileio.__file__):
+        with open(module, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+# Part of every snapshot key: after a deploy that changes this code, the old snapshot is not used
+CODE_VERSION = _code_version()
+
+_storage = {'key': None, 'store': None}
+_storage_lock = threading.Lock()
+
+def get_storage():
+    """Storage backend of the ledgers and the price history (see storage.py)."""
+    key = (STORAGE_BACKEND, DATA_DIR, DATABASE_FILE, HISTORY_STORE_DIR, HISTORY_FILE)
+    with _storage_lock:
+        if _storage['key'] != key:
+            if STORAGE_BACKEND == 'sqlite':
+                store = storage.SqliteStorage(DATABASE_FILE)
+            else:
+                store = storage.CsvStorage(DATA_DIR, HISTORY_STORE_DIR, HISTORY_FILE)
+            _storage.update(key=key, store=store)
+        return _storage['store']
 
 def _clean_numeric(s):
     """Robustly converts a string with numbers (commas or dots) to float."""
@@ -36,15 +88,29 @@ def _normalize_text(text):
     return "".join(c for c in unicodedata.normalize('NFD', text)
                   if unicodedata.category(c) != 'Mn')
 
-def parse_myinvestor_subject(subject_line):
+# Confirmation subject: "# dd/mm/yyyy # TIPO # Nombre del fondo # TIT: x # PRE: y # z EUR"
+# Regex handles flexible spacing and both dot/comma (captured as string for _clean_numeric)
+MYINVESTOR_SUBJECT_RE = re.compile(
+    r"#\s*(\d{2}/\d{2}/\d{4})\s*#\s*(\w+)\s*#\s*(.*?)\s*#\s*TIT:\s*([\d.,]+)\s*#\s*PRE:\s*([\d.,]+)\s*#\s*([\d.,]+)\s*EUR")
+
+def get_asset_matcher():
+    """AssetMatcher over activos.csv, built once per data version."""
+    return memoize('asset_matcher', ('data',), _build_asset_matcher)
+
+def _build_asset_matcher():
+    activos, _, _, _, _ = load_data()
+    if activos is None: return None
+    nombres = activos['nombre'].tolist()
+    return AssetMatcher(zip(activos['id'].tolist(), nombres, [_normalize_text(n) for n in nombres]))
+
+def parse_myinvestor_subject(subject_line, matcher=None):
     """
     Parses the subject and returns a dict with the extracted data, 
     but DOES NOT save anything yet.
+    'matcher' (see get_asset_matcher()) lets batch imports reuse the same asset index.
     """
     try:
-        # Regex handles flexible spacing and both dot/comma (captured as string for _clean_numeric)
-        pattern = r"#\s*(\d{2}/\d{2}/\d{4})\s*#\s*(\w+)\s*#\s*(.*?)\s*#\s*TIT:\s*([\d.,]+)\s*#\s*PRE:\s*([\d.,]+)\s*#\s*([\d.,]+)\s*EUR"
-        match = re.search(pattern, subject_line)
+        match = MYINVESTOR_SUBJECT_RE.search(subject_line)
         
         if not match:
             return None, "Formato de asunto no reconocido."
@@ -60,42 +126,19 @@ def parse_myinvestor_subject(subject_line):
         importe = _clean_numeric(importe_raw)
 
         # Asset Mapping (Improvement: Normalize both for accent-insensitive search)
-        activos, _, _, _, _ = load_data()
-        if activos is None: return None, "Error cargando activos."
-
-        search_norm = _normalize_text(nombre_activo_raw)
-        activos['nombre_norm'] = activos['nombre'].apply(_normalize_text)
-
-        # 1. Try direct containment of normalized strings
-        asset_match = activos[activos['nombre_norm'].str.contains(search_norm, regex=False)]
-        
-        # 2. If no match, try the inverse (is the catalog name contained in the email string?)
-        if asset_match.empty:
-            asset_match = activos[activos.apply(lambda row: row['nombre_norm'] in search_norm, axis=1)]
-
-        # 3. Last resort: split search string into words and check if MOST words match
-        if asset_match.empty:
-            words = [w for w in search_norm.split() if len(w) > 3] # only significant words
-            if words:
-                # Check how many significant words from search are in the catalog name
-                def score_match(name_norm):
-                    return sum(1 for w in words if w in name_norm)
-                
-                activos['match_score'] = activos['nombre_norm'].apply(score_match)
-                best_score = activos['match_score'].max()
-                if best_score >= len(words) * 0.6: # At least 60% of significant words match
-                    asset_match = activos[activos['match_score'] == best_score]
+        if matcher is None:
+            matcher = get_asset_matcher()
+        if matcher is None: return None, "Error cargando activos."
 
-        if asset_match.empty:
+        asset = matcher.match(_normalize_text(nombre_activo_raw))
+        if asset is None:
             return None, f"Activo no encontrado: {nombre_activo_raw}"
-            
-        asset_info = asset_match.iloc[0].to_dict()
         
         return {
             'fecha': fecha,
             'tipo': tipo,
-            'id_activo': asset_info['id'],
-            'nombre_activo': asset_info['nombre'],
+            'id_activo': asset[0],
+            'nombre_activo': asset[1],
             'cantidad_dinero': importe,
             'titulos': titulos,
             'precio_titulo': precio,
@@ -104,68 +147,195 @@ def parse_myinvestor_subject(subject_line):
     except Exception as e:
         return None, f"Error al parsear: {str(e)}"
 
-def add_contribution(data, force=False, notas=None):
-    """Saves the provided contribution data to the CSV."""
-    try:
-        fecha_target = pd.to_datetime(data['fecha'])
-        asset_id = data['id_activo']
-        titulos = float(data['titulos'])
-        importe = float(data['cantidad_dinero'])
-        
-        aportaciones_path = os.path.join(DATA_DIR, "aportaciones.csv")
-        
-        # Duplicate check with date margin (Improvement: +/- 2 days)
-        if not force and os.path.exists(aportaciones_path):
-            df_old = pd.read_csv(aportaciones_path)
-            if not df_old.empty:
-                df_old['fecha_dt'] = pd.to_datetime(df_old['fecha'])
-                
-                # Filter by asset, shares and amount exactly
-                # Then check if any of those are within the date margin
-                mask = (df_old['id_activo'] == asset_id) & \
-                       (df_old['titulos'] == titulos) & \
-                       (df_old['cantidad_dinero'] == importe)
-                
-                potential_duplicates = df_old[mask].copy()
-                
-                if not potential_duplicates.empty:
-                    # Check date difference in days
-                    potential_duplicates['days_diff'] = (potential_duplicates['fecha_dt'] - fecha_target).dt.days.abs()
-                    real_duplicates = potential_duplicates[potential_duplicates['days_diff'] <= 2]
-                    
-                    if not real_duplicates.empty:
-                        dup_fecha = real_duplicates.iloc[0]['fecha']
-                        return False, f"Atención: Detectada operación similar el {dup_fecha} (+/- 2 días).", True
+def extract_myinvestor_subjects(text=None, filename=None, content=None):
+    """
+    Subjects to import: every non-empty line of 'text', plus the MyInvestor subjects of an
+    uploaded mail export ('content' bytes of an .eml message or an .mbox mailbox).
+    """
+    subjects = [line.strip() for line in (text or '').splitlines() if line.strip()]
+    if not content:
+        return subjects
 
-        if notas is None:
-            notas = 'Auto-importado (Preview)' + (' (Forzado)' if force else '')
+    if (filename or '').lower().endswith('.eml'):
+        messages = [email.message_from_bytes(content, policy=email.policy.default)]
+    else:
+        # mailbox.mbox only reads from a path
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'import.mbox')
+            with open(path, 'wb') as f:
+                f.write(content)
+            box = mailbox.mbox(path, factory=lambda f: email.message_from_binary_file(f, policy=email.policy.default), create=False)
+            messages = list(box)
+            box.close()
+
+    for message in messages:
+        subject = ' '.join(str(message['subject'] or '').split())  # Unfolded, single spaces
+        if MYINVESTOR_SUBJECT_RE.search(subject):
+            subjects.append(subject)
+    return subjects
+
+def preview_myinvestor_batch(subjects):
+    """
+    Parses many subjects with a single asset matcher and flags possible duplicates, both
+    against aportaciones.csv and against earlier rows of the same batch.
+    Returns [{'subject', 'data', 'error', 'duplicate'}]; 'duplicate' is the date of the similar operation.
+    """
+    matcher = get_asset_matcher()
+    store = get_storage()
+    in_batch = {}  # key -> [(day, fecha)] of the rows already previewed
+    rows = []
+    for subject in subjects:
+        data, error = parse_myinvestor_subject(subject, matcher=matcher)
+        row = {'subject': subject, 'data': data, 'error': error, 'duplicate': None}
+        if data:
+            row['duplicate'] = find_duplicate_operation(store, data)
+            key = _duplicate_key(data['id_activo'], data['titulos'], data['cantidad_dinero'])
+            day = pd.Timestamp(data['fecha']).toordinal()
+            if row['duplicate'] is None:
+                row['duplicate'] = next((f for d, f in in_batch.get(key, []) if abs(d - day) <= DUPLICATE_MARGIN_DAYS), None)
+            in_batch.setdefault(key, []).append((day, data['fecha']))
+        rows.append(row)
+    return rows
+
+def import_myinvestor_batch(items):
+    """
+    Saves the accepted rows of a batch preview with a single write. Returns (success, message).
+    Only rows with 'force' (flagged by the preview and checked by the user anyway) skip the
+    duplicate check; the rest that match an operation already saved are left out, so a
+    confirmation sent twice imports nothing the second time.
+    """
+    success, message, _ = add_contributions(items, notas='Auto-importado (Lote)', skip_duplicates=True)
+    return success, message
 
-        new_row = {
-            'fecha': data['fecha'],
-            'tipo': data['tipo'],
-            'id_activo': asset_id,
-            'cantidad_dinero': importe,
-            'titulos': titulos,
-            'precio_titulo': float(data['precio_titulo']),
-            'notas': notas
-        }
+DUPLICATE_MARGIN_DAYS = 2
 
-        df_new = pd.DataFrame([new_row])
-        if os.path.exists(aportaciones_path):
-            df_old = pd.read_csv(aportaciones_path)
-            df_final = pd.concat([df_old, df_new], ignore_index=True)
-        else:
-            df_final = df_new
-            
-        df_final.to_csv(aportaciones_path, index=False)
-        rebuild_portfolio()
-        global _data_cache
-        _data_cache['payload'] = None
-        
+# Operations of aportaciones by (id_activo, titulos, cantidad_dinero) -> sorted [(day, row, fecha)]
+_duplicate_index = {
+    'stat': None,   # (storage location, table version) the index reflects
+    'next_row': 0,  # Row number of the next appended operation
+    'entries': {}
+}
+_duplicate_index_lock = threading.RLock()
+
+def _duplicate_key(asset_id, titulos, importe):
+    return (str(asset_id), float(titulos), float(importe))
+
+def _index_operations(entries, rows, first_row):
+    for i, (fecha, asset_id, titulos, importe) in enumerate(rows):
+        if pd.isna(fecha) or pd.isna(titulos) or pd.isna(importe):
+            continue  # NaN never compares equal, like in the original mask
+        day = pd.Timestamp(fecha).toordinal()
+        insort(entries.setdefault(_duplicate_key(asset_id, titulos, importe), []), (day, first_row + i, str(fecha)[:10]))
+
+def get_duplicate_index(store):
+    """Duplicate index of the aportaciones of 'store', rebuilt only when they changed outside add_contributions()."""
+    with _duplicate_index_lock:
+        stat = (store.location, store.version('aportaciones'))
+        if stat != _duplicate_index['stat']:
+            entries = {}
+            n_rows = 0
+            if stat[1] is not None:
+                df = store.read('aportaciones', columns=['fecha', 'id_activo', 'titulos', 'cantidad_dinero'])
+                if not df.empty:
+                    fechas = pd.to_datetime(df['fecha'])
+                    _index_operations(entries, zip(fechas, df['id_activo'], df['titulos'], df['cantidad_dinero']), 0)
+                n_rows = len(df)
+            _duplicate_index.update(stat=stat, next_row=n_rows, entries=entries)
+        return _duplicate_index
+
+def record_appended_operations(store, rows):
+    """
+    Adds rows just appended by this process, so the next lookup does not reload the ledger.
+    The index must reflect the ledger as it was right before the append (see add_contributions()).
+    """
+    with _duplicate_index_lock:
+        index = _duplicate_index
+        _index_operations(index['entries'], [(pd.to_datetime(r['fecha']), r['id_activo'], r['titulos'], r['cantidad_dinero']) for r in rows],
+                          index['next_row'])
+        index['next_row'] += len(rows)
+        index['stat'] = (store.location, store.version('aportaciones'))
+
+def find_duplicate_operation(store, row):
+    """
+    Date of an existing operation with the same asset, shares and amount within
+    +/- DUPLICATE_MARGIN_DAYS of 'row' (the first one in file order), or None.
+    """
+    with _duplicate_index_lock:
+        dates = get_duplicate_index(store)['entries'].get(
+            _duplicate_key(row['id_activo'], row['titulos'], row['cantidad_dinero']))
+        if not dates:
+            return None
+        day = pd.Timestamp(row['fecha']).toordinal()
+        lo = bisect_left(dates, (day - DUPLICATE_MARGIN_DAYS,))
+        hi = bisect_left(dates, (day + DUPLICATE_MARGIN_DAYS + 1,))
+        if lo == hi:
+            return None
+        return min(dates[lo:hi], key=lambda d: d[1])[2]
+
+def _contribution_row(data, notas):
+    pd.to_datetime(data['fecha'])  # Rejects invalid dates before anything is written
+    return {
+        'fecha': data['fecha'],
+        'tipo': data['tipo'],
+        'id_activo': data['id_activo'],
+        'cantidad_dinero': float(data['cantidad_dinero']),
+        'titulos': float(data['titulos']),
+        'precio_titulo': float(data['precio_titulo']),
+        'notas': data.get('notas') or notas
+    }
+
+def add_contributions(items, force=False, notas=None, skip_duplicates=False):
+    """
+    Saves several operations as one transaction: either every row is appended to
+    aportaciones (a single write under the ledger lock) or none is.
+    Items with a true 'force' key skip the duplicate check like force=True does for all of them.
+    With 'skip_duplicates', duplicated rows are left out instead of rejecting the whole batch.
+    Returns (success, message, is_duplicate).
+    """
+    try:
+        if notas is None:
+            notas = 'Auto-importado (Preview)' + (' (Forzado)' if force else '')
+        rows = [_contribution_row(data, notas) for data in items]
+        if not rows:
+            return False, "No hay operaciones que guardar.", False
+        forced = [force or bool(data.get('force')) for data in items]
+
+        store = get_storage()
+        skipped = 0
+        with store.locked('aportaciones'):
+            # Duplicate check with date margin (Improvement: +/- 2 days), inside the lock so
+            # two concurrent submissions cannot both pass it
+            get_duplicate_index(store)  # In sync with the ledger before appending
+            pending = []
+            for row, row_forced in zip(rows, forced):
+                dup_fecha = None if row_forced else find_duplicate_operation(store, row)
+                if dup_fecha is None:
+                    pending.append(row)
+                elif skip_duplicates:
+                    skipped += 1
+                else:
+                    return False, f"Atención: Detectada operación similar el {dup_fecha} (+/- 2 días).", True
+            if not pending:
+                return False, "Todas las operaciones ya estaban registradas.", True
+
+            # A rewritten ledger (old file without some column) is re-indexed on the next lookup
+            if store.append('aportaciones', pending):
+                record_appended_operations(store, pending)
+
+        sync_portfolio()
+        notify_data_changed()
+
+        if skip_duplicates:
+            omitted = f" {skipped} omitidas por estar ya registradas." if skipped else ""
+            return True, f"{len(pending)} operaciones importadas correctamente.{omitted}", skipped > 0
         return True, "Operación guardada correctamente.", False
     except Exception as e:
         return False, f"Error al guardar: {str(e)}", False
 
+def add_contribution(data, force=False, notas=None):
+    """Saves the provided contribution data to the CSV."""
+    return add_contributions([data], force=force, notas=notas)
+
 def import_myinvestor_data(data, force=False):
     """Saves the already parsed data to the CSV. Compatibility wrapper."""
     return add_contribution(data, force=force)
@@ -213,207 +383,276 @@ def add_transfer(data):
         if data.get('notas'):
             notas += f" - {data['notas']}"
             
-        success1, msg1, _ = add_contribution(exit_data, force=True, notas=notas)
-        if not success1: return False, f"Error en salida: {msg1}"
-        
-        success2, msg2, _ = add_contribution(entry_data, force=True, notas=notas)
-        if not success2: return False, f"Error en entrada: {msg2}"
+        # Both legs are committed together: a failure leaves no half transfer behind
+        success, msg, _ = add_contributions([exit_data, entry_data], force=True, notas=notas)
+        if not success: return False, msg
         
         return True, f"Traspaso registrado correctamente (ID: {transfer_id})"
     except Exception as e:
         return False, f"Error al procesar traspaso: {str(e)}"
 
+def notify_data_changed():
+    """Tells every worker process (including this one) that the data files changed."""
+    try:
+        return fileio.bump_counter(DATA_VERSION_FILE)
+    except Exception as e:
+        print(f"Error updating data version: {e}")
+
+def get_shared_data_version():
+    return fileio.read_counter(DATA_VERSION_FILE)
+
+@metrics.timed('ledger_rebuild')
 def rebuild_portfolio():
-    """Regenerates cartera.csv based on aportaciones.csv (including INICIAL records)"""
+    """Regenerates cartera replaying the whole aportaciones ledger (including INICIAL records)"""
     try:
-        # Start empty
-        portfolio = {}
-
-        # 1. Process Aportaciones (including INICIAL)
-        aportaciones_path = os.path.join(DATA_DIR, "aportaciones.csv")
-        if os.path.exists(aportaciones_path):
-            df_ops = pd.read_csv(aportaciones_path)
-            if not df_ops.empty and 'fecha' in df_ops.columns:
-                df_ops['fecha'] = pd.to_datetime(df_ops['fecha'])
-                # Order by date, then ensure INICIAL comes first if same date
-                df_ops['tipo_rank'] = df_ops['tipo'].apply(lambda x: 0 if str(x).upper() == 'INICIAL' else 1)
-                df_ops.sort_values(by=['fecha', 'tipo_rank'], inplace=True)
-
-                for _, op in df_ops.iterrows():
-                    asset_id = op['id_activo']
-                    tipo = str(op['tipo']).upper().strip()
-                    titulos_op = float(op['titulos']) if pd.notnull(op['titulos']) else 0.0
-                    cantidad_op = float(op['cantidad_dinero']) if pd.notnull(op['cantidad_dinero']) else 0.0
-                    precio_op = float(op['precio_titulo']) if pd.notnull(op['precio_titulo']) else 0.0
-
-                    if asset_id not in portfolio:
-                        portfolio[asset_id] = {'participaciones': 0.0, 'precio_medio_compra': 0.0}
-
-                    current = portfolio[asset_id]
-
-                    if tipo in ['INICIAL', 'COMPRA', 'TRASPASO_ENTRADA']:
-                        total_cost_old = current['participaciones'] * current['precio_medio_compra']
-                        total_cost_new = titulos_op * precio_op
-                        new_shares = current['participaciones'] + titulos_op
-                        
-                        if new_shares > 0:
-                            new_avg = (total_cost_old + total_cost_new) / new_shares
-                            current['participaciones'] = new_shares
-                            current['precio_medio_compra'] = round(new_avg, 2)
-                        
-                        # Handle CASH impact for COMPRA (INICIAL has no cash impact as it's the starting point)
-                        if tipo == 'COMPRA' and 'CASH_DIG' in portfolio:
-                            portfolio['CASH_DIG']['participaciones'] -= cantidad_op
-                            
-                    elif tipo in ['VENTA', 'TRASPASO_SALIDA']:
-                        current['participaciones'] = max(0.0, current['participaciones'] - titulos_op)
-                        if tipo == 'VENTA' and 'CASH_DIG' in portfolio:
-                            portfolio['CASH_DIG']['participaciones'] += cantidad_op
-                        
-                    elif tipo == 'AJUSTE_VALOR':
-                        val = cantidad_op if cantidad_op > 0 else titulos_op
-                        current['participaciones'] = val
-                        current['precio_medio_compra'] = 1.0 # Reset cost basis for cash
-
-        # 3. Save calculated state to cartera.csv
-        rows = []
-        for asset_id, data in portfolio.items():
-            # Only save if there's something relevant (or it was in initial)
-            # Keeping 0 balance items is sometimes useful for history, but let's keep it clean
-            rows.append({
-                'id_activo': asset_id,
-                'participaciones': round(data['participaciones'], 6),
-                'precio_medio_compra': round(data['precio_medio_compra'], 2)
-            })
-            
-        df_final = pd.DataFrame(rows)
-        # Ensure columns order
-        df_final = df_final[['id_activo', 'participaciones', 'precio_medio_compra']]
-        df_final.to_csv(os.path.join(DATA_DIR, "cartera.csv"), index=False)
-        
+        store = get_storage()
+        with store.locked('cartera'):
+            ledger.reset()
+            store.sync_ledger(LEDGER_CHECKPOINT_FILE, force_full=True)
     except Exception as e:
         print(f"Error rebuilding portfolio: {e}")
 
+@metrics.timed('ledger_sync')
+def sync_portfolio():
+    """Updates cartera replaying only the operations appended since the last checkpoint."""
+    try:
+        store = get_storage()
+        # One writer at a time across workers; the checkpoint written by another worker is picked up
+        with store.locked('cartera'):
+            return store.sync_ledger(LEDGER_CHECKPOINT_FILE)
+    except Exception as e:
+        print(f"Error syncing portfolio: {e}")
+        return None
+
+def expand_recurrent_expenses(recurrentes, start_period, end_period):
+    """
+    Generates one expense per recurrent item and month in [start_period, end_period].
+    The preferred day is clamped to the month: invalid days (e.g. 30 in February) fall on
+    the end of the month. Rows are ordered item by item, month by month.
+    """
+    columns = ['fecha', 'cantidad', 'categoria', 'concepto']
+    periods = pd.period_range(start=start_period, end=end_period, freq='M')
+    if recurrentes.empty or len(periods) == 0:
+        return pd.DataFrame(columns=columns)
+
+    n_items, n_months = len(recurrentes), len(periods)
+    days = np.repeat(recurrentes['dia'].astype(int).to_numpy(), n_months)
+    month_start = np.tile(periods.start_time.to_numpy(), n_items)
+    month_end = np.tile(periods.end_time.to_numpy(), n_items)
+    days_in_month = np.tile(periods.days_in_month.to_numpy(), n_items)
+
+    valid = (days >= 1) & (days <= days_in_month)
+    fechas = np.where(valid, month_start + (np.clip(days, 1, None) - 1).astype('timedelta64[D]'), month_end)
+
+    return pd.DataFrame({
+        'fecha': fechas,
+        'cantidad': np.repeat(recurrentes['cantidad'].to_numpy(), n_months),
+        'categoria': np.repeat(recurrentes['categoria'].to_numpy(), n_months),
+        'concepto': np.repeat(recurrentes['concepto'].to_numpy(), n_months)
+    }, columns=columns)
+
+# Last expansion of gastos_recurrentes.csv, extended month by month instead of regenerated
+_recurrent_cache = {
+    'key': None,    # (file version, first period)
+    'end': None,    # Last period generated
+    'frame': None
+}
+
+def get_recurrent_expenses(recurrentes, min_date, end_date, key=None):
+    """
+    Expanded recurrent expenses from the month of 'min_date' to the month of 'end_date'.
+    With the same 'key' (file version) and start month, only the months after the last
+    expansion are generated and appended.
+    """
+    global _recurrent_cache
+    start = pd.Period(min_date, freq='M')
+    end = pd.Period(end_date, freq='M')
+    cache_key = (key, start)
+
+    cache = _recurrent_cache
+    if key is not None and cache['key'] == cache_key and cache['end'] is not None and cache['end'] <= end:
+        frame = cache['frame']
+        if cache['end'] < end:
+            # Same order as a full expansion once sorted by date: new months only add later dates
+            frame = pd.concat([frame, expand_recurrent_expenses(recurrentes, cache['end'] + 1, end)], ignore_index=True)
+    else:
+        frame = expand_recurrent_expenses(recurrentes, start, end)
+
+    _recurrent_cache = {'key': cache_key, 'end': end, 'frame': frame}
+    return frame
+
+def month_key(fechas):
+    """Integer month key of a datetime Series: months since 1970-01 (the ordinal of a monthly pd.Period)."""
+    return pd.Series(fechas.to_numpy(dtype='datetime64[ns]').astype('datetime64[M]').astype(np.int32), index=fechas.index)
+
+def month_label(keys):
+    """'YYYY-MM' labels of month keys."""
+    return np.asarray(keys, dtype=np.int64).astype('datetime64[M]').astype(str)
+
+def _concat_ledgers(df, extra):
+    """pd.concat of two ledgers that keeps the categorical columns of 'df' categorical (union of categories)."""
+    converted = {}
+    for col in df.columns[df.dtypes == 'category']:
+        if col in extra.columns:
+            categories = df[col].cat.categories.union(pd.Index(extra[col].dropna().unique()))
+            df[col] = df[col].cat.set_categories(categories)
+            converted[col] = extra[col].astype(pd.CategoricalDtype(categories))
+    return pd.concat([df, extra.assign(**converted)], ignore_index=True)
+
 # Global cache state
 _data_cache = {
     'payload': None,  # (activos, cartera, ingresos, gastos, aportaciones)
-    'mtimes': {}      # {file_path: last_mtime}
+    'versions': {},   # {table: storage version} the payload was loaded at
+    'shared_version': None,  # DATA_VERSION_FILE counter the payload was loaded at
+    'key': None,      # Fingerprint of those sources (see _payload_key)
+    'version': 0,     # Incremented on every reload
+    'hits': 0,
+    'misses': 0
 }
+_data_lock = threading.Lock()
+
+def _table_versions(store):
+    """Change marker of every ledger read by load_data() (file stats or SQLite change counters)."""
+    return {name: store.version(name) for name in storage.TABLES}
+
+@metrics.timed('fingerprint')
+def get_data_fingerprint():
+    """
+    Hash of every input the views depend on, built from change markers only (nothing is parsed):
+    the ledgers read by load_data(), latest_prices.json, the price history, the shared data
+    version counter and today's date.
+    """
+    store = get_storage()
+    # cartera is left out: it is derived from aportaciones and rewritten by the ledger sync
+    stats = [(store.location, name, v) for name, v in _table_versions(store).items() if name != 'cartera']
+    try:
+        st = os.stat(PRICES_FILE)
+        stats.append((PRICES_FILE, st.st_mtime_ns, st.st_size))
+    except OSError:
+        stats.append((PRICES_FILE, None))
+    stats.append(store.prices_version())
+    stats.append(get_shared_data_version())
+    stats.append(datetime.now().date().isoformat())
+    return hashlib.sha1(repr(stats).encode()).hexdigest()
 
 def load_data():
-    """Loads all CSV data with an optimization cache based on file modification times."""
+    """Loads all ledgers with an optimization cache based on their change markers."""
     global _data_cache
     
-    # Ensure cartera is up to date
-    rebuild_portfolio()
-    
-    # Files to monitor for changes
-    paths = {
-        'activos': os.path.join(DATA_DIR, "activos.csv"),
-        'cartera': os.path.join(DATA_DIR, "cartera.csv"),
-        'aportaciones': os.path.join(DATA_DIR, "aportaciones.csv"),
-        'ingresos': os.path.join(DATA_DIR, "ingresos.csv"),
-        'gastos_var': os.path.join(DATA_DIR, "gastos_variables.csv"),
-        'recurrentes': os.path.join(DATA_DIR, "gastos_recurrentes.csv")
-    }
+    # Ensure cartera is up to date (cheap when aportaciones did not change)
+    sync_portfolio()
     
-    # Check if any file has changed since last load
-    changed = False
-    current_mtimes = {}
-    for p in paths.values():
-        if os.path.exists(p):
-            mtime = os.path.getmtime(p)
-            current_mtimes[p] = mtime
-            if _data_cache['mtimes'].get(p) != mtime:
-                changed = True
+    # Check if any ledger has changed since last load
+    store = get_storage()
+    versions = _table_versions(store)
+    changed = versions != _data_cache['versions']
     
+    # Writes from any worker bump the shared counter (mtimes alone can miss same-tick rewrites)
+    shared_version = get_shared_data_version()
+    if shared_version != _data_cache['shared_version']:
+        changed = True
+
     # Return from cache if possible
     if not changed and _data_cache['payload'] is not None:
+        _data_cache['hits'] += 1
         return _data_cache['payload']
 
-    try:
-        activos = pd.read_csv(paths['activos'])
-        cartera = pd.read_csv(paths['cartera'])
-        
-        # Load Income (Optional)
-        ingresos_path = paths['ingresos']
-        ingresos = pd.read_csv(ingresos_path) if os.path.exists(ingresos_path) else pd.DataFrame(columns=['fecha', 'cantidad', 'concepto', 'categoria'])
-        
-        # Load variable expenses (Optional)
-        gastos_path = paths['gastos_var']
-        if os.path.exists(gastos_path):
-            gastos = pd.read_csv(gastos_path)
-        elif os.path.exists(os.path.join(DATA_DIR, "gastos.csv")):
-            gastos = pd.read_csv(os.path.join(DATA_DIR, "gastos.csv"))
-        else:
-            gastos = pd.DataFrame(columns=['fecha', 'cantidad', 'categoria', 'concepto'])
+    with _data_lock:  # One reload at a time: threads that waited find it done
+        if (_data_cache['payload'] is not None and versions == _data_cache['versions']
+                and shared_version == _data_cache['shared_version']):
+            _data_cache['hits'] += 1
+            return _data_cache['payload']
+        _data_cache['misses'] += 1
+
+        try:
+            key = _payload_key(store, versions, shared_version)
+            if SHARED_DATASET:
+                payload = _load_shared_payload(store, versions, key)
+            else:
+                payload = _parse_data(store, versions)
+
+            # Update cache
+            _data_cache['payload'] = payload
+            _data_cache['versions'] = versions
+            _data_cache['shared_version'] = shared_version
+            _data_cache['key'] = key
+            _data_cache['version'] += 1
             
-        aportaciones_path = paths['aportaciones']
-        aportaciones = pd.read_csv(aportaciones_path) if os.path.exists(aportaciones_path) else pd.DataFrame(columns=['fecha', 'tipo', 'id_activo', 'cantidad_dinero', 'titulos', 'precio_titulo'])
+            return _data_cache['payload']
+        except Exception as e:
+            print(f"Error loading data: {e}")
+            return None, None, None, None, None
 
-        # Convert dates for standard dataframes
-        for df in [ingresos, gastos, aportaciones]:
-            if not df.empty and 'fecha' in df.columns:
-                df['fecha'] = pd.to_datetime(df['fecha'])
-        
-        # --- PROCESS RECURRENT EXPENSES ---
-        recurrentes_path = paths['recurrentes']
-        if os.path.exists(recurrentes_path):
-            recurrentes = pd.read_csv(recurrentes_path)
-            if not recurrentes.empty:
-                # Determine date range
-                min_date = datetime.now()
-                if not ingresos.empty:
-                    min_date = min(min_date, ingresos['fecha'].min())
-                if not gastos.empty:
-                    min_date = min(min_date, gastos['fecha'].min())
-                
-                # Generate until current month (inclusive)
-                end_date = datetime.now()
-                
-                # Generate dates
-                generated_rows = []
-                # Create a date range for months
-                date_range = pd.period_range(start=min_date, end=end_date, freq='M')
-                
-                for _, row in recurrentes.iterrows():
-                    day = int(row['dia'])
-                    for period in date_range:
-                        # Handle month length (e.g., day 30 in Feb)
-                        try:
-                            # Try to create date with preferred day
-                            dt = pd.Timestamp(year=period.year, month=period.month, day=day)
-                        except ValueError:
-                            # If invalid (e.g., Feb 30), take last day of month
-                            dt = period.to_timestamp(how='end')
-                            
-                        generated_rows.append({
-                            'fecha': dt,
-                            'cantidad': row['cantidad'],
-                            'categoria': row['categoria'],
-                            'concepto': row['concepto']
-                        })
-                
-                if generated_rows:
-                    df_recurrentes = pd.DataFrame(generated_rows)
-                    gastos = pd.concat([gastos, df_recurrentes], ignore_index=True)
-
-        # Final processing for all dataframes
-        for df in [ingresos, gastos, aportaciones]:
-            if not df.empty and 'fecha' in df.columns:
-                # Ensure date type again just in case concatenation messed it up
-                df['fecha'] = pd.to_datetime(df['fecha'])
-                df['periodo'] = df['fecha'].dt.to_period('M') 
-                df.sort_values(by='fecha', ascending=True, inplace=True)
+def _payload_key(store, versions, shared_version):
+    """
+    Fingerprint of the payload sources and of the code that reads them: names its published dataset
+    and versions the artifacts built on it.
+    """
+    return hashlib.sha1(repr((CODE_VERSION, store.location, sorted(versions.items()), shared_version,
+                              datetime.now().date().isoformat())).encode()).hexdigest()
+
+def _load_shared_payload(store, versions, key):
+    """
+    Payload mapped from the dataset published for the current sources. The first worker that
+    needs a version parses the ledgers and publishes it; the others (and any process started
+    later on the same sources) map it and pick up the artifacts saved with it.
+    """
+    frames = shared_dataset.load(SHARED_DATASET_DIR, key)
+    if frames is not None:
+        _restore_artifacts(key)
+    else:
+        with fileio.locked(SHARED_DATASET_DIR):
+            frames = shared_dataset.load(SHARED_DATASET_DIR, key)
+            if frames is None:
+                payload = _parse_data(store, versions)
+                try:
+                    shared_dataset.publish(SHARED_DATASET_DIR, key, dict(zip(shared_dataset.FRAMES, payload)))
+                except Exception as e:
+                    print(f"Error publishing shared dataset: {e}")
+                    return payload
+                frames = shared_dataset.load(SHARED_DATASET_DIR, key)
+    return tuple(frames[name] for name in shared_dataset.FRAMES)
+
+@metrics.timed('parse_data')
+def _parse_data(store, versions):
+    """
+    Reads the ledgers into (activos, cartera, ingresos, gastos, aportaciones).
+    The dated ledgers are typed (storage.schema_of): dates parsed while reading, labels as
+    categoricals and 'periodo' as an integer month key (see month_key).
+    """
+    activos = store.read('activos')
+    cartera = store.read('cartera')
+    
+    # Income, variable expenses and operations are optional (empty when missing)
+    ingresos = store.read('ingresos', typed=True)
+    gastos = store.read('gastos_variables', typed=True)
+    aportaciones = store.read('aportaciones', typed=True)
+    
+    # --- PROCESS RECURRENT EXPENSES ---
+    recurrentes = store.read('gastos_recurrentes', typed=True)
+    if not recurrentes.empty:
+        # Determine date range
+        min_date = datetime.now()
+        if not ingresos.empty:
+            min_date = min(min_date, ingresos['fecha'].min())
+        if not gastos.empty:
+            min_date = min(min_date, gastos['fecha'].min())
         
-        # Update cache
-        _data_cache['payload'] = (activos, cartera, ingresos, gastos, aportaciones)
-        _data_cache['mtimes'] = current_mtimes
+        # Generate until current month (inclusive)
+        end_date = datetime.now()
         
-        return _data_cache['payload']
-    except Exception as e:
-        print(f"Error loading data: {e}")
-        return None, None, None, None, None
+        df_recurrentes = get_recurrent_expenses(recurrentes, min_date, end_date,
+                                                key=versions.get('gastos_recurrentes'))
+        if not df_recurrentes.empty:
+            gastos = _concat_ledgers(gastos, df_recurrentes)
+
+    # Final processing for all dataframes ('periodo' also on empty ledgers: the builders group by it)
+    for df in [ingresos, gastos, aportaciones]:
+        if 'fecha' in df.columns:
+            df['periodo'] = month_key(df['fecha'])
+            df.sort_values(by='fecha', ascending=True, inplace=True, kind='stable')
+    
+    return activos, cartera, ingresos, gastos, aportaciones
 
 def get_latest_prices():
     if os.path.exists(PRICES_FILE):
@@ -424,80 +663,257 @@ def get_latest_prices():
             return {}
     return {}
 
+# Derived artifacts (summary, flow, detail, sankey, history...) memoized per data version.
+# Returned objects are shared between callers and requests: treat them as read-only.
+_artifacts = {
+    'entries': {},  # {(name, args): (version, value)}
+    'hits': {},     # {name: count}
+    'misses': {},   # {name: count}
+    'dirty': set(),  # Keys rebuilt since the last save_artifacts_snapshot()
+    'building': {}   # {(name, args): lock held while that entry is built}
+}
+_artifacts_lock = threading.RLock()
+MAX_ENTRIES_PER_ARTIFACT = 32
+MAX_WINDOW = 24  # Months; the dashboard offers up to 12
+_snapshot_thread = None
+
+def get_data_version(deps=('data', 'prices', 'history')):
+    """
+    Version of the inputs in 'deps':
+    'data' (ledgers, plus today's date since views filter on it), 'prices' (latest_prices.json)
+    and 'history' (price store). Versions are fingerprints, so they hold across processes.
+    """
+    version = []
+    if 'data' in deps:
+        load_data()  # Reloads the payload if any CSV changed
+        version.append(('data', _data_cache['key'], datetime.now().date()))
+    if 'prices' in deps:
+        version.append(('prices', os.stat(PRICES_FILE).st_mtime_ns if os.path.exists(PRICES_FILE) else None))
+    if 'history' in deps:
+        version.append(('history', get_storage().prices_version()))
+    return tuple(version)
+
+def memoize(name, deps, builder, *args):
+    """
+    Returns builder(*args), computed at most once per version of its dependencies.
+    The shared lock only guards the entries: builds run under a lock of their own key, so a
+    slow build blocks the callers waiting for that same value and nobody else.
+    """
+    key = (name, args)
+    version = get_data_version(deps)
+    with _artifacts_lock:
+        entry = _artifacts['entries'].get(key)
+        if entry is not None and entry[0] == version:
+            _artifacts['hits'][name] = _artifacts['hits'].get(name, 0) + 1
+            return entry[1]
+        build_lock = _artifacts['building'].setdefault(key, threading.Lock())
+
+    with build_lock:
+        with _artifacts_lock:
+            entry = _artifacts['entries'].get(key)
+            if entry is not None and entry[0] == version:  # Built by the caller we waited for
+                _artifacts['hits'][name] = _artifacts['hits'].get(name, 0) + 1
+                return entry[1]
+            _artifacts['misses'][name] = _artifacts['misses'].get(name, 0) + 1
+        value = builder(*args)
+        with _artifacts_lock:
+            # Drop stale entries of this artifact (other args computed on an older version) and
+            # the oldest ones beyond MAX_ENTRIES_PER_ARTIFACT (args come from request parameters)
+            same = [k for k, (v, _) in _artifacts['entries'].items() if k[0] == name and k != key]
+            stale = [k for k in same if _artifacts['entries'][k][0] != version]
+            fresh = [k for k in same if k not in stale]
+            for other in stale + fresh[:max(0, len(fresh) - MAX_ENTRIES_PER_ARTIFACT + 1)]:
+                del _artifacts['entries'][other]
+                _artifacts['dirty'].discard(other)
+                _artifacts['building'].pop(other, None)
+            _artifacts['entries'].pop(key, None)  # Re-inserted last: the cap drops the oldest
+            _artifacts['entries'][key] = (version, value)
+            _artifacts['dirty'].add(key)
+        return value
+
+def _snapshot_name(entry_key):
+    name, args = entry_key
+    return f"{name}-{hashlib.sha1(repr(args).encode()).hexdigest()[:16]}.pickle"
+
+@metrics.timed('snapshot')
+def save_artifacts_snapshot():
+    """
+    Saves the artifacts rebuilt on the current payload next to its published dataset (one file
+    each), so the next process started on the same sources serves them without rebuilding.
+    Returns the entries saved.
+    """
+    with _artifacts_lock:
+        key = _data_cache['key']
+        if not SHARED_DATASET or key is None:
+            return 0
+        changed = {k: _artifacts['entries'][k] for k in _artifacts['dirty']
+                   if k in _artifacts['entries'] and _artifacts['entries'][k][0][0][1] == key}
+        _artifacts['dirty'] = set()
+    saved = 0
+    for k, entry in changed.items():
+        try:
+            # Pickle, not Arrow: artifacts are dicts mixing frames, series and numbers
+            if shared_dataset.save_blob(SHARED_DATASET_DIR, key, _snapshot_name(k), pickle.dumps((k, entry))):
+                saved += 1
+        except Exception as e:
+            print(f"Error saving artifacts snapshot: {e}")
+    return saved
+
+def schedule_artifacts_snapshot():
+    """Runs save_artifacts_snapshot() in a background thread, one at a time, when something was rebuilt."""
+    global _snapshot_thread
+    with _artifacts_lock:
+        if not SHARED_DATASET or not _artifacts['dirty'] or (_snapshot_thread is not None and _snapshot_thread.is_alive()):
+            return None
+        # Not a daemon: a process shutting down finishes the save instead of dropping it
+        _snapshot_thread = threading.Thread(target=save_artifacts_snapshot, name='artifacts-snapshot')
+        _snapshot_thread.start()
+        return _snapshot_thread
+
+def _restore_artifacts(key):
+    """Adds the artifacts saved with dataset 'key' to the cache; memoize() still checks their versions."""
+    restored = 0
+    for name, data in shared_dataset.load_blobs(SHARED_DATASET_DIR, key).items():
+        try:
+            k, entry = pickle.loads(data)  # Only files this user wrote (see shared_dataset.load_blobs)
+        except Exception as e:
+            print(f"Error reading artifacts snapshot {name}: {e}")
+            continue
+        with _artifacts_lock:
+            _artifacts['entries'].setdefault(k, entry)
+        restored += 1
+    return restored
+
+def get_cache_stats():
+    """Hit/miss counters of the data cache and of every memoized artifact."""
+    with _artifacts_lock:
+        names = sorted(set(_artifacts['hits']) | set(_artifacts['misses']))
+        return {
+            'load_data': {'hits': _data_cache['hits'], 'misses': _data_cache['misses'], 'version': _data_cache['version']},
+            'artifacts': {n: {'hits': _artifacts['hits'].get(n, 0), 'misses': _artifacts['misses'].get(n, 0)} for n in names}
+        }
+
+def cache_metrics():
+    """Cache counters of get_cache_stats() as metric samples (see metrics.register_collector)."""
+    stats = get_cache_stats()
+    caches = {'load_data': stats['load_data'], **stats['artifacts']}
+    hits = [({'cache': name}, c['hits']) for name, c in caches.items()]
+    misses = [({'cache': name}, c['misses']) for name, c in caches.items()]
+    ratios = [({'cache': name}, c['hits'] / (c['hits'] + c['misses']) if c['hits'] + c['misses'] else float('nan'))
+              for name, c in caches.items()]
+    return [
+        ('finance_cache_hits_total', 'counter', 'Lookups answered from the in-process cache.', hits),
+        ('finance_cache_misses_total', 'counter', 'Lookups that rebuilt the cached value.', misses),
+        ('finance_cache_hit_ratio', 'gauge', 'Hits over lookups since the process started.', ratios),
+    ]
+
+metrics.register_collector(cache_metrics)
+
+def clear_artifacts():
+    with _artifacts_lock:
+        _artifacts['entries'].clear()
+        _artifacts['dirty'] = set()
+        _artifacts['building'].clear()
+
+def reset_caches():
+    """Drops every in-process cache, as in a freshly started worker (used to time cold paths)."""
+    global _recurrent_cache, _anomaly_cache
+    clear_artifacts()
+    _data_cache.update(payload=None, versions={}, shared_version=None, key=None)
+    _recurrent_cache = {'key': None, 'end': None, 'frame': None}
+    _anomaly_cache = {'frame': None, 'keys': None, 'flags': None}
+    _cashflow_cubes.clear()
+    with _duplicate_index_lock:
+        _duplicate_index.update(stat=None, next_row=0, entries={})
+    ledger.reset()
+
 def save_price_history(prices_dict):
+    """Upserts today's prices into the year partition of the price store."""
     today = datetime.now().strftime('%Y-%m-%d')
-    new_rows = []
-    for asset_id, price in prices_dict.items():
-        new_rows.append({'fecha': today, 'id_activo': asset_id, 'precio': price})
-    df_new = pd.DataFrame(new_rows)
-    if os.path.exists(HISTORY_FILE):
-        try:
-            df_hist = pd.read_csv(HISTORY_FILE)
-            df_hist = df_hist[df_hist['fecha'] != today]
-            df_final = pd.concat([df_hist, df_new], ignore_index=True)
-        except:
-            df_final = df_new
-    else:
-        df_final = df_new
-    df_final.to_csv(HISTORY_FILE, index=False)
+    get_storage().save_prices(today, prices_dict)
+
+def get_holdings_matrix(aportaciones, dates):
+    """
+    Returns a (date x asset) DataFrame with the shares held at the end of each date in 'dates'.
+    Built in one pass: signed share deltas -> daily pivot -> cumulative sum -> as-of alignment.
+    """
+    dates = pd.DatetimeIndex(pd.to_datetime(dates))
+    if aportaciones is None or aportaciones.empty:
+        return pd.DataFrame(index=dates, dtype=float)
+
+    tipo = aportaciones['tipo'].astype(str).str.upper().str.strip()
+    titulos = aportaciones['titulos'].astype(float).fillna(0.0)
+    sign = np.select([tipo.isin(ledger.ENTRY_TYPES), tipo.isin(ledger.EXIT_TYPES)], [1.0, -1.0], default=0.0)
+
+    df_delta = pd.DataFrame({
+        'fecha': pd.to_datetime(aportaciones['fecha']),
+        'id_activo': aportaciones['id_activo'].astype(object),  # Plain labels: no unobserved categories
+        'delta': titulos * sign
+    })
+    daily = df_delta.pivot_table(index='fecha', columns='id_activo', values='delta', aggfunc='sum', fill_value=0.0)
+    cumulative = daily.sort_index().cumsum()
+
+    # As-of alignment: holdings at each date are those of the last operation date <= date
+    return cumulative.reindex(dates, method='ffill').fillna(0.0)
 
 def get_portfolio_history_chart_data():
     """Generates historical portfolio valuation based on historical prices and holdings at each point in time."""
-    if not os.path.exists(HISTORY_FILE): return None
+    return memoize('history', ('data', 'history'), _build_portfolio_history)
+
+@metrics.timed('history')
+def _build_portfolio_history():
+    store = get_storage()
+    if not store.has_prices(): return None
     try:
         # 1. Load data
-        df_hist = pd.read_csv(HISTORY_FILE)
         _, _, _, _, aportaciones = load_data()
         
         if aportaciones.empty:
             return None
+        df_hist = store.read_prices(columns=['fecha', 'id_activo', 'precio'])
+        df_hist['fecha'] = df_hist['fecha'].dt.strftime('%Y-%m-%d')
             
         # 2. Pivot historical prices
         df_pivot = df_hist.pivot(index='fecha', columns='id_activo', values='precio').fillna(0)
         dates = df_pivot.index.tolist()
         
-        # 3. Calculate shares for each point in time
-        total_values = []
-        for date_str in dates:
-            current_date = pd.to_datetime(date_str)
-            
-            # Sum up all operations until this date
-            mask = aportaciones['fecha'] <= current_date
-            df_ops = aportaciones[mask].copy()
-            
-            if df_ops.empty:
-                total_values.append(0.0)
-                continue
-                
-            # Current shares per asset at this point in time
-            def calc_shares(row):
-                tipo = str(row['tipo']).upper().strip()
-                if tipo in ['INICIAL', 'COMPRA']: return row['titulos']
-                if tipo == 'VENTA': return -row['titulos']
-                return 0.0
-                
-            df_ops['share_delta'] = df_ops.apply(calc_shares, axis=1)
-            shares_at_date = df_ops.groupby('id_activo')['share_delta'].sum().to_dict()
-            
-            # Calculate total valuation with the prices of THAT date
-            daily_total = 0.0
-            for asset_id, shares in shares_at_date.items():
-                if shares > 0 and asset_id in df_pivot.columns:
-                    price = df_pivot.at[date_str, asset_id]
-                    daily_total += shares * price
-                    
-            total_values.append(round(daily_total, 2))
+        # 3. Shares for each point in time, aligned with the price matrix
+        shares = get_holdings_matrix(aportaciones, dates)
+        shares = shares.reindex(columns=df_pivot.columns, fill_value=0.0)
+        shares = shares.where(shares > 0, 0.0)
+        
+        # 4. Total valuation with the prices of THAT date
+        total_values = (shares.to_numpy() * df_pivot.to_numpy()).sum(axis=1).round(2).tolist()
             
         return {'dates': dates, 'values': total_values}
     except Exception as e:
         print(f"Error generating history chart: {e}")
         return None
 
-def refresh_market_data():
+@metrics.timed('refresh_prices')
+def refresh_market_data(job=None):
+    """
+    Scrapes new prices and saves them behind the safety shield.
+    If 'job' is given (see start_refresh_job), per-asset progress and shield decisions are recorded in it.
+    """
     activos, _, _, _, _ = load_data()
     if activos is not None:
         old_prices = get_latest_prices()
-        new_prices = market_data.update_prices(activos)
+
+        on_progress = None
+        if job is not None:
+            with _refresh_lock:
+                job['total'] = len(activos)
+            _publish_refresh_job(job)
+            def on_progress(result):
+                with _refresh_lock:
+                    job['assets'][result['id']] = dict(result)
+                    job['completed'] = len(job['assets'])
+                _publish_refresh_job(job)
+
+        # The scraper stack (requests, BeautifulSoup, lxml) is only needed here: imported on first use
+        import market_data
+        new_prices = market_data.update_prices(activos, on_progress=on_progress)
         
         final_prices = {}
         for asset_id, price in new_prices.items():
@@ -530,16 +946,113 @@ def refresh_market_data():
             else:
                 final_prices[asset_id] = price
 
+            if job is not None:
+                with _refresh_lock:
+                    job['assets'].setdefault(asset_id, {'id': asset_id})['shield'] = {
+                        'decision': 'kept_old' if keep_old and old_p > 0 else 'accepted',
+                        'reason': reason,
+                        'old_price': old_p,
+                        'final_price': final_prices[asset_id]
+                    }
+
         try:
-            with open(PRICES_FILE, 'w') as f:
-                json.dump(final_prices, f)
+            fileio.write_json(PRICES_FILE, final_prices)
             save_price_history(final_prices)
+            notify_data_changed()
             return True, "Precios actualizados (Escudo de seguridad activo)."
         except Exception as e:
             return False, f"Error guardando precios: {e}"
     return False, "Error cargando activos."
 
+# Background price refresh jobs. Their state lives in REFRESH_JOBS_FILE, so any worker process
+# deduplicates a new refresh against a running one and can report its progress.
+_refresh_lock = threading.Lock()
+MAX_FINISHED_JOBS = 20
+REFRESH_STALE_SECONDS = 300  # A running job not updated for this long belongs to a worker that died
+
+def _read_refresh_jobs():
+    try:
+        with open(REFRESH_JOBS_FILE, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _job_view(job):
+    view = dict(job)
+    view['assets'] = [dict(a) for a in job['assets'].values()]
+    return view
+
+def _publish_refresh_job(job):
+    """Writes the current state of 'job' (owned by this process) to REFRESH_JOBS_FILE."""
+    with _refresh_lock:
+        job['updated_at'] = time.time()
+        view = _job_view(job)
+    with fileio.locked(REFRESH_JOBS_FILE):
+        jobs = _read_refresh_jobs()
+        jobs[view['id']] = view
+        fileio.write_json(REFRESH_JOBS_FILE, jobs)
+
+def _run_refresh_job(job):
+    start = time.perf_counter()
+    try:
+        success, message = refresh_market_data(job=job)
+    except Exception as e:
+        success, message = False, f"Error actualizando precios: {e}"
+    with _refresh_lock:
+        job['status'] = 'done' if success else 'error'
+        job['message'] = message
+        job['finished_at'] = datetime.now().isoformat(timespec='seconds')
+        job['duration'] = round(time.perf_counter() - start, 2)
+    _publish_refresh_job(job)
+
+def start_refresh_job():
+    """
+    Starts refresh_market_data() in a background thread.
+    If a refresh is already running (in any worker), its id is returned instead of starting another scrape.
+    Returns (job_id, started).
+    """
+    with fileio.locked(REFRESH_JOBS_FILE):
+        jobs = _read_refresh_jobs()
+        for job in jobs.values():
+            if job['status'] != 'running':
+                continue
+            if time.time() - job.get('updated_at', 0) < REFRESH_STALE_SECONDS:
+                return job['id'], False
+            job.update(status='error', message="Actualización interrumpida.")
+
+        # Forget the oldest finished jobs
+        finished = [j for j in jobs.values() if j['status'] != 'running']
+        for old in sorted(finished, key=lambda j: j['started_at'])[:max(0, len(finished) - MAX_FINISHED_JOBS + 1)]:
+            jobs.pop(old['id'], None)
+
+        import uuid
+        job = {
+            'id': uuid.uuid4().hex[:12],
+            'status': 'running',
+            'message': '',
+            'started_at': datetime.now().isoformat(timespec='seconds'),
+            'updated_at': time.time(),
+            'finished_at': None,
+            'duration': None,
+            'total': None,
+            'completed': 0,
+            'assets': {}
+        }
+        jobs[job['id']] = _job_view(job)
+        fileio.write_json(REFRESH_JOBS_FILE, jobs)
+
+    threading.Thread(target=_run_refresh_job, args=(job,), name=f"refresh-{job['id']}", daemon=True).start()
+    return job['id'], True
+
+def get_refresh_job(job_id):
+    """Returns a snapshot of the job status (None if unknown)."""
+    return _read_refresh_jobs().get(job_id)
+
 def get_portfolio_summary():
+    return memoize('summary', ('data', 'prices'), _build_portfolio_summary)
+
+@metrics.timed('summary')
+def _build_portfolio_summary():
     activos, cartera, ingresos, gastos, aportaciones = load_data()
     if activos is None: return {}
     prices = get_latest_prices()
@@ -590,17 +1103,92 @@ def get_portfolio_summary():
 
 def fill_missing_months(df_grouped):
     if df_grouped.empty: return df_grouped
-    min_date = df_grouped['periodo'].min()
-    max_date = df_grouped['periodo'].max()
-    full_range = pd.period_range(start=min_date, end=max_date, freq='M')
+    full_range = np.arange(df_grouped['periodo'].min(), df_grouped['periodo'].max() + 1)
     df_grouped = df_grouped.set_index('periodo').reindex(full_range, fill_value=0).reset_index()
     df_grouped.rename(columns={'index': 'periodo'}, inplace=True)
-    df_grouped['periodo'] = df_grouped['periodo'].astype(str)
+    df_grouped['periodo'] = month_label(df_grouped['periodo'])
     return df_grouped
 
-def get_financial_flow(portfolio_summary=None):
+ANOMALY_WINDOW = 12           # Previous entries of the same category used as reference
+ANOMALY_MIN_HISTORY = 3       # Below this, the fixed threshold applies
+ANOMALY_FALLBACK_THRESHOLD = 500
+ANOMALY_STD_FACTOR = 1.5
+
+# Flags of the last expenses frame seen, reused for unchanged rows when new expenses are appended
+_anomaly_cache = {
+    'frame': None,   # gastos DataFrame the flags belong to
+    'keys': None,    # (fecha, categoria, cantidad) in date order
+    'flags': None    # np.array of bools in date order
+}
+
+def _anomaly_flags(df_sorted, start=0):
+    """
+    Flags the rows df_sorted[start:] (sorted by date) as extraordinary.
+    A row is compared with the previous ANOMALY_WINDOW entries of its category dated strictly
+    before it: amount > mean + 1.5 * std, or > 500 when there are fewer than 3 such entries.
+    """
+    amounts = df_sorted['cantidad'].to_numpy(dtype=np.float64)
+    n = len(amounts)
+
+    # Rows of each category are contiguous in 'order', keeping date order inside the category
+    cat_codes = pd.factorize(df_sorted['categoria'])[0]
+    order = np.argsort(cat_codes, kind='stable')
+    values = amounts[order]
+    pos_in_cat = df_sorted.groupby('categoria', sort=False, dropna=False, observed=True).cumcount().to_numpy()
+    pos_in_day = df_sorted.groupby(['categoria', 'fecha'], sort=False, dropna=False, observed=True).cumcount().to_numpy()
+    cat_start = np.empty(n, dtype=np.int64)
+    cat_start[order] = np.arange(n) - pos_in_cat[order]
+
+    # History = entries of the category before the first entry of the same date
+    n_prev = pos_in_cat - pos_in_day
+    count = np.minimum(n_prev, ANOMALY_WINDOW)
+    count[cat_codes == -1] = 0  # Rows without category never match any history
+    window_start = cat_start + n_prev - count
+
+    flags = amounts > ANOMALY_FALLBACK_THRESHOLD
+    rows = np.arange(start, n)
+    for k in range(ANOMALY_MIN_HISTORY, ANOMALY_WINDOW + 1):
+        sel = rows[count[rows] == k]
+        if len(sel) == 0:
+            continue
+        windows = values[window_start[sel][:, None] + np.arange(k)]
+        # Same arithmetic as Series.mean()/Series.std() over each window
+        mean = windows.sum(axis=1, dtype=np.float64) / k
+        std = np.sqrt(((mean[:, None] - windows) ** 2).sum(axis=1, dtype=np.float64) / (k - 1))
+        flags[sel] = amounts[sel] > mean + (ANOMALY_STD_FACTOR * std)
+    return flags[start:]
+
+@metrics.timed('anomalies')
+def detect_extraordinary_expenses(gastos):
+    """
+    Returns a boolean Series (aligned with 'gastos') marking extraordinary expenses.
+    Flags are cached: for the same frame nothing is recomputed, and when the new frame only
+    appends later rows to the previous one, only the appended rows are evaluated.
+    """
+    global _anomaly_cache
+    # Stable sort: same-day expenses keep their order, so appended rows leave the prefix untouched
+    df_sorted = gastos.sort_values('fecha', kind='stable')
+    keys = df_sorted[['fecha', 'categoria', 'cantidad']].reset_index(drop=True)
+
+    cache = _anomaly_cache
+    if cache['frame'] is gastos and cache['keys'] is not None and cache['keys'].equals(keys):
+        flags = cache['flags']
+    else:
+        start = 0
+        old_keys = cache['keys']
+        if old_keys is not None and 0 < len(old_keys) <= len(keys) and keys.iloc[:len(old_keys)].equals(old_keys):
+            start = len(old_keys)
+        new_flags = _anomaly_flags(df_sorted, start)
+        flags = np.concatenate([cache['flags'], new_flags]) if start else new_flags
+        _anomaly_cache = {'frame': gastos, 'keys': keys, 'flags': flags}
+
+    return pd.Series(flags, index=df_sorted.index).reindex(gastos.index)
+
+@metrics.timed('flow')
+def _build_financial_flow():
+    """Monthly series and forecast averages (everything in the flow that does not depend on the portfolio)."""
     _, _, ingresos, gastos, _ = load_data()
-    if ingresos is None: return {}, {}
+    if ingresos is None: return None
     
     # --- 1. PREPARE DATA ---
     today_date = datetime.now()
@@ -616,10 +1204,11 @@ def get_financial_flow(portfolio_summary=None):
     # Ensure same range for both to allow combined charting
     all_periods = sorted(list(set(ing_m_raw['periodo']) | set(gas_m_raw['periodo'])))
     if all_periods:
-        min_p, max_p = all_periods[0], all_periods[-1]
-        full_range = pd.period_range(start=min_p, end=max_p, freq='M').astype(str)
+        full_range = np.arange(all_periods[0], all_periods[-1] + 1)
         ing_m_chart = ing_m_raw.set_index('periodo').reindex(full_range, fill_value=0).reset_index().rename(columns={'index': 'periodo'})
         gas_total_m_chart = gas_m_raw.set_index('periodo').reindex(full_range, fill_value=0).reset_index().rename(columns={'index': 'periodo'})
+        ing_m_chart['periodo'] = month_label(ing_m_chart['periodo'])
+        gas_total_m_chart['periodo'] = month_label(gas_total_m_chart['periodo'])
     else:
         ing_m_chart = ing_m_raw
         gas_total_m_chart = gas_m_raw
@@ -627,32 +1216,11 @@ def get_financial_flow(portfolio_summary=None):
     # --- 2. STATISTICAL ANOMALY DETECTION (Moving Average Approach) ---
     # We identify "extraordinary" expenses using a 12-month rolling window to adapt to current lifestyle.
     if not gastos.empty:
-        # Sort by date for proper time series analysis
-        df_sorted = gastos.sort_values('fecha').copy()
+        # Kept out of the cached payload: views served from a snapshot never run this
+        is_extraordinary = detect_extraordinary_expenses(gastos)
         
-        # Calculate stats per category using a rolling window of 12 months (where possible)
-        # For simplicity and given the frequency of use, we'll use the last 12 entries per category 
-        # as a proxy for the 'current' behavior.
-        def is_anomaly(row):
-            cat_mask = df_sorted['categoria'] == row['categoria']
-            # Get historical data for this category UP TO this row's date
-            cat_history = df_sorted[cat_mask & (df_sorted['fecha'] < row['fecha'])].tail(12)
-            
-            if len(cat_history) < 3:
-                # Fallback for new categories or very few entries
-                return row['cantidad'] > 500
-                
-            mean = cat_history['cantidad'].mean()
-            std = cat_history['cantidad'].std()
-            
-            # Threshold: Mean + 1.5 * StdDev
-            threshold = mean + (1.5 * (std if pd.notnull(std) else 0))
-            return row['cantidad'] > threshold
-
-        gastos['is_extraordinary'] = gastos.apply(is_anomaly, axis=1)
-        
-        gas_rec = gastos[~gastos['is_extraordinary']]
-        gas_extra = gastos[gastos['is_extraordinary']]
+        gas_rec = gastos[~is_extraordinary]
+        gas_extra = gastos[is_extraordinary]
     else:
         gas_rec = pd.DataFrame(columns=['periodo', 'cantidad'])
         gas_extra = pd.DataFrame(columns=['periodo', 'cantidad'])
@@ -674,7 +1242,24 @@ def get_financial_flow(portfolio_summary=None):
     
     monthly_net_flow_base = avg_income - weighted_avg_expense
     monthly_net_flow_pessimistic = avg_income - (weighted_avg_expense * 1.20) # 20% buffer
-    
+
+    return {
+        'ingresos_ts': ing_m_chart,
+        'gastos_rec_ts': gas_total_m_chart,
+        'avg_income': avg_income,
+        'avg_expense_rec': avg_expense_rec,
+        'avg_expense_extra_prorated': avg_expense_extra_prorated,
+        'weighted_avg_expense': weighted_avg_expense,
+        'net_flow_base': monthly_net_flow_base,
+        'net_flow_pessimistic': monthly_net_flow_pessimistic
+    }
+
+def get_financial_flow(portfolio_summary=None):
+    flow = memoize('flow', ('data',), _build_financial_flow)
+    if flow is None: return {}, {}
+
+    monthly_net_flow_base = flow['net_flow_base']
+    monthly_net_flow_pessimistic = flow['net_flow_pessimistic']
     current_equity = portfolio_summary.get('equity_value', 0) if portfolio_summary else 0
     current_stable = portfolio_summary.get('stable_value', 0) if portfolio_summary else 0
 
@@ -694,13 +1279,13 @@ def get_financial_flow(portfolio_summary=None):
         }
 
     return {
-        'ingresos_ts': ing_m_chart, 
-        'gastos_rec_ts': gas_total_m_chart, 
+        'ingresos_ts': flow['ingresos_ts'], 
+        'gastos_rec_ts': flow['gastos_rec_ts'], 
         'forecast': {
-            'avg_income': round(avg_income, 2),
-            'avg_expense_rec': round(avg_expense_rec, 2),
-            'avg_expense_extra_prorated': round(avg_expense_extra_prorated, 2),
-            'weighted_avg_expense': round(weighted_avg_expense, 2),
+            'avg_income': round(flow['avg_income'], 2),
+            'avg_expense_rec': round(flow['avg_expense_rec'], 2),
+            'avg_expense_extra_prorated': round(flow['avg_expense_extra_prorated'], 2),
+            'weighted_avg_expense': round(flow['weighted_avg_expense'], 2),
             'net_flow': round(monthly_net_flow_base, 2),
             'months_eoy': months_to_eoy,
             'eoy_year': eoy_year,
@@ -712,6 +1297,9 @@ def get_financial_flow(portfolio_summary=None):
 
 def get_invested_capital_history():
     """Calculates the history of invested capital (cost basis) over time."""
+    return memoize('invested', ('data',), _build_invested_capital_history)
+
+def _build_invested_capital_history():
     _, _, _, _, aportaciones = load_data()
     if aportaciones.empty: return pd.DataFrame(columns=['periodo', 'invertido_acumulado'])
     
@@ -730,8 +1318,8 @@ def get_invested_capital_history():
     df_ops['flujo'] = df_ops.apply(calc_flow, axis=1)
     
     # Group by month
-    monthly_flow = df_ops.groupby(df_ops['fecha'].dt.to_period('M'))['flujo'].sum().reset_index()
-    monthly_flow['periodo'] = monthly_flow['fecha'].astype(str)
+    monthly_flow = df_ops.groupby('periodo')['flujo'].sum().reset_index()
+    monthly_flow['periodo'] = month_label(monthly_flow['periodo'])
     
     # Cumulative sum
     monthly_flow['invertido_acumulado'] = monthly_flow['flujo'].cumsum()
@@ -743,46 +1331,223 @@ def get_monthly_cashflow_detail(periodo=None, window=1):
     Returns detailed income and expense breakdown for a specific month or a window of months.
     If window > 1, it aggregates the 'window' months ending at 'periodo'.
     """
-    _, _, ingresos, gastos, _ = load_data()
-    
-    if ingresos is None or gastos is None:
-        return {'periodo': periodo, 'ingresos': [], 'gastos': [], 'neto': 0}
-        
-    if periodo is None:
-        all_dates = pd.concat([ingresos['fecha'], gastos['fecha']])
-        if all_dates.empty:
-            return {'periodo': 'N/A', 'ingresos': [], 'gastos': [], 'neto': 0}
-        periodo_dt = all_dates.dt.to_period('M').max()
-        periodo = periodo_dt.strftime('%Y-%m')
+    return memoize('detail', ('data',), _build_monthly_cashflow_detail, periodo, int(window))
+
+# Monthly aggregates (period x category for expenses, period x concept for income) with prefix sums
+_cashflow_cubes = {}  # {name: cube}
+
+def _empty_cube(df):
+    return {'frame': df, 'keys': None, 'first': None, 'last': None, 'names': [], 'order': np.array([], dtype=np.int64),
+            'sums': np.zeros((0, 0)), 'counts': np.zeros((0, 0), dtype=np.int64),
+            'cum_sums': np.zeros((1, 0)), 'cum_counts': np.zeros((1, 0), dtype=np.int64), 'ords': np.array([], dtype=np.int64), 'monotonic': True}
+
+def _period_ordinals(keys):
+    ords = keys['periodo'].to_numpy(dtype=np.int64)
+    return {'ords': ords, 'monotonic': bool(np.all(ords[1:] >= ords[:-1]))}
+
+def _extend_cube(cube, keys, start):
+    """Adds keys[start:] to the per-period sums/counts and refreshes the prefix sums from the first touched period."""
+    new = keys.iloc[start:]
+    if new.empty:
+        return dict(cube, keys=keys, **_period_ordinals(keys))
+    ords = new['periodo'].to_numpy(dtype=np.int64)
+    if cube['first'] is not None and ords.min() < cube['first']:
+        return _extend_cube(_empty_cube(cube['frame']), keys, 0)
+    first = cube['first'] if cube['first'] is not None else int(ords.min())
+    last = max(int(ords.max()), cube['last'] if cube['last'] is not None else first)
+
+    # Categories seen for the first time become new columns
+    names = list(cube['names'])
+    positions = {name: i for i, name in enumerate(names)}
+    codes, uniques = pd.factorize(new['key'])
+    for name in uniques:
+        if name not in positions:
+            positions[name] = len(names)
+            names.append(name)
+    col = np.array([positions[name] for name in uniques], dtype=np.int64)[codes[codes >= 0]]
+    row = ords[codes >= 0] - first
+    amounts = np.nan_to_num(new['cantidad'].to_numpy(dtype=np.float64)[codes >= 0])
+
+    n_periods, n_names = last - first + 1, len(names)
+    sums = np.zeros((n_periods, n_names))
+    counts = np.zeros((n_periods, n_names), dtype=np.int64)
+    old_periods, old_names = cube['sums'].shape
+    sums[:old_periods, :old_names] = cube['sums']
+    counts[:old_periods, :old_names] = cube['counts']
+    flat = row * n_names + col
+    sums += np.bincount(flat, weights=amounts, minlength=n_periods * n_names).reshape(n_periods, n_names)
+    counts += np.bincount(flat, minlength=n_periods * n_names).reshape(n_periods, n_names)
+
+    # Periods before the first appended row keep their cumulative values
+    touched = int(row.min()) if len(row) else n_periods
+    touched = min(touched, old_periods)
+    cum_sums = np.zeros((n_periods + 1, n_names))
+    cum_counts = np.zeros((n_periods + 1, n_names), dtype=np.int64)
+    cum_sums[:touched + 1, :old_names] = cube['cum_sums'][:touched + 1]
+    cum_counts[:touched + 1, :old_names] = cube['cum_counts'][:touched + 1]
+    cum_sums[touched + 1:] = cum_sums[touched] + np.cumsum(sums[touched:], axis=0)
+    cum_counts[touched + 1:] = cum_counts[touched] + np.cumsum(counts[touched:], axis=0)
+
+    return {'frame': cube['frame'], 'keys': keys, 'first': first, 'last': last, 'names': names,
+            'order': np.array(sorted(range(n_names), key=lambda i: names[i]), dtype=np.int64),
+            'sums': sums, 'counts': counts, 'cum_sums': cum_sums, 'cum_counts': cum_counts,
+            **_period_ordinals(keys)}
+
+def get_cashflow_cube(name, df, key_col):
+    """
+    Cube of 'df' (sorted by date) aggregated by month and 'key_col'.
+    Rebuilt only when 'df' changes; when the new frame just appends later rows, only those rows are added.
+    """
+    cube = _cashflow_cubes.get(name)
+    if cube is not None and cube['frame'] is df:
+        return cube
+    if df is None or df.empty or 'periodo' not in df.columns:
+        cube = _empty_cube(df)
+    else:
+        keys = pd.DataFrame({'periodo': df['periodo'], 'key': df[key_col], 'cantidad': df['cantidad']}).reset_index(drop=True)
+        old_keys = cube['keys'] if cube is not None else None
+        if old_keys is not None and 0 < len(old_keys) <= len(keys) and keys.iloc[:len(old_keys)].equals(old_keys):
+            cube = _extend_cube(dict(cube, frame=df), keys, len(old_keys))
+        else:
+            cube = _extend_cube(_empty_cube(df), keys, 0)
+    _cashflow_cubes[name] = cube
+    return cube
+
+def cube_window_totals(cube, start_period, end_period):
+    """[(name, total)] of the months start_period..end_period (month keys), names sorted, only names with entries."""
+    if cube['first'] is None:
+        return []
+    n_periods = len(cube['sums'])
+    lo = min(max(start_period - cube['first'], 0), n_periods)
+    hi = min(max(end_period - cube['first'] + 1, 0), n_periods)
+    if hi <= lo:
+        return []
+    order = cube['order']
+    totals = cube['cum_sums'][hi, order] - cube['cum_sums'][lo, order]
+    counts = cube['cum_counts'][hi, order] - cube['cum_counts'][lo, order]
+    return [(cube['names'][i], float(total)) for i, total, count in zip(order, totals, counts) if count > 0]
+
+def cube_window_rows(cube, start_period, end_period):
+    """Rows of the cube's frame dated in start_period..end_period (month keys)."""
+    frame = cube['frame']
+    if frame is None or frame.empty or 'periodo' not in frame.columns:
+        return frame
+    if not cube['monotonic']:
+        return frame[(frame['periodo'] >= start_period) & (frame['periodo'] <= end_period)]
+    lo = np.searchsorted(cube['ords'], start_period, side='left')
+    hi = np.searchsorted(cube['ords'], end_period, side='right')
+    return frame.iloc[lo:hi]
+
+# Payload name -> table of the ledgers the period views read by date range
+_PERIOD_LEDGERS = {'ingresos': 'ingresos', 'gastos': 'gastos_variables', 'aportaciones': 'aportaciones'}
+
+def _range_reads():
+    """True when the period views read their window from the store instead of the cached payload."""
+    # Only SQLite answers a range from the (fecha) index; a CSV range read parses the whole file
+    return STORAGE_BACKEND == 'sqlite'
+
+def read_period(name, start, end):
+    """
+    Rows of the ledger 'name' ('ingresos', 'gastos' or 'aportaciones') dated in the days start..end,
+    typed and ordered as in load_data(). 'gastos' includes the recurrent expenses of those days,
+    expanded for the same months _parse_data() covers.
+    """
+    store = get_storage()
+    df = store.read_range(_PERIOD_LEDGERS[name], start, end, typed=True)
+    if name == 'gastos':
+        recurrentes = store.read('gastos_recurrentes', typed=True)
+        if not recurrentes.empty:
+            firsts = [store.date_bounds(t)[0] for t in ('ingresos', 'gastos_variables')]
+            min_date = min([datetime.now()] + [d for d in firsts if d is not None])
+            start_period = max(pd.Period(min_date, freq='M'), pd.Period(start, freq='M'))
+            end_period = min(pd.Period(datetime.now(), freq='M'), pd.Period(end, freq='M'))
+            extra = expand_recurrent_expenses(recurrentes, start_period, end_period)
+            lo, hi = pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize() + pd.Timedelta(days=1)
+            extra = extra[(extra['fecha'] >= lo) & (extra['fecha'] < hi)]
+            if not extra.empty:
+                df = _concat_ledgers(df, extra.reset_index(drop=True))
+    df['periodo'] = month_key(df['fecha'])
+    return df.sort_values(by='fecha', kind='stable')
+
+def _month_bounds(start_key, end_key):
+    """First day of the month 'start_key' and last day of the month 'end_key' (month keys)."""
+    return (pd.Period(ordinal=int(start_key), freq='M').start_time,
+            pd.Period(ordinal=int(end_key), freq='M').end_time.normalize())
+
+def _last_cashflow_period():
+    """Month key of the last income or expense (recurrent ones run to the current month), None without any."""
+    store = get_storage()
+    lasts = [store.date_bounds(t)[1] for t in ('ingresos', 'gastos_variables')]
+    if not store.read('gastos_recurrentes').empty:
+        lasts.append(pd.Timestamp(datetime.now()))
+    lasts = [d for d in lasts if d is not None]
+    return pd.Period(max(lasts), freq='M').ordinal if lasts else None
+
+def _window_totals(df, key_col):
+    """[(name, total)] of the rows of 'df' by 'key_col', names sorted (same contract as cube_window_totals)."""
+    if df.empty:
+        return []
+    totals = df.groupby(key_col, observed=True)['cantidad'].sum()
+    return sorted((name, float(total)) for name, total in totals.items())
+
+@metrics.timed('monthly_detail')
+def _build_monthly_cashflow_detail(periodo=None, window=1):
+    from_range = _range_reads()  # SQLite: only the rows of the window are read, below
+    if from_range:
+        gas_col = 'categoria'
+        if periodo is None:
+            end_key = _last_cashflow_period()
+            if end_key is None:
+                return {'periodo': 'N/A', 'ingresos': [], 'gastos': [], 'neto': 0}
+            periodo = str(month_label([end_key])[0])
     else:
-        periodo_dt = pd.Period(periodo, freq='M')
+        _, _, ingresos, gastos, _ = load_data()
+
+        if ingresos is None or gastos is None:
+            return {'periodo': periodo, 'ingresos': [], 'gastos': [], 'neto': 0}
+
+        gas_col = 'categoria' if 'categoria' in gastos.columns else 'concepto'
+        ing_cube = get_cashflow_cube('ingresos', ingresos, 'concepto')
+        gas_cube = get_cashflow_cube('gastos', gastos, gas_col)
+
+        if periodo is None:
+            last = [c['last'] for c in (ing_cube, gas_cube) if c['last'] is not None]
+            if not last:
+                return {'periodo': 'N/A', 'ingresos': [], 'gastos': [], 'neto': 0}
+            periodo = str(month_label([max(last)])[0])
+
+    end_key = pd.Period(periodo, freq='M').ordinal
 
     # Calculate the start period based on window
-    start_period_dt = periodo_dt - (int(window) - 1)
-    
-    # Filter by period range
-    mask_ing = (ingresos['periodo'] >= start_period_dt) & (ingresos['periodo'] <= periodo_dt)
-    mask_gas = (gastos['periodo'] >= start_period_dt) & (gastos['periodo'] <= periodo_dt)
-    
-    df_ing = ingresos[mask_ing].copy()
-    df_gas = gastos[mask_gas].copy()
+    start_key = end_key - (int(window) - 1)
     
     # Label for the UI
     display_period = periodo if int(window) == 1 else f"Últimos {window} meses (hasta {periodo})"
 
-    # Aggregate by category/concept
-    ing_grouped = df_ing.groupby('concepto')['cantidad'].sum().reset_index().to_dict('records')
-    gas_col = 'categoria' if 'categoria' in df_gas.columns else 'concepto'
-    gas_grouped = df_gas.groupby(gas_col)['cantidad'].sum().reset_index().rename(columns={gas_col: 'name', 'cantidad': 'value'}).to_dict('records')
+    if from_range:
+        # Through the (fecha) indexes; the payload is not loaded
+        start_day, end_day = _month_bounds(start_key, end_key)
+        ing_totals = _window_totals(read_period('ingresos', start_day, end_day), 'concepto')
+        df_gas = read_period('gastos', start_day, end_day)
+        gas_totals = _window_totals(df_gas, gas_col)
+    else:
+        # Aggregate by category/concept: difference of two prefix sums per name
+        ing_totals = cube_window_totals(ing_cube, start_key, end_key)
+        gas_totals = cube_window_totals(gas_cube, start_key, end_key)
+        df_gas = cube_window_rows(gas_cube, start_key, end_key)
+    ing_data = [{'name': name, 'value': round(value, 2)} for name, value in ing_totals]
+    gas_data = [{'name': name, 'value': round(value, 2)} for name, value in gas_totals]
     
     # Raw data for drill-down
-    df_gas['fecha_str'] = df_gas['fecha'].dt.strftime('%Y-%m-%d')
-    gas_raw = df_gas[['fecha_str', gas_col, 'concepto', 'cantidad']].rename(columns={gas_col: 'categoria'}).to_dict('records')
+    gas_raw = []
+    if df_gas is not None and not df_gas.empty:
+        gas_raw = pd.DataFrame({
+            'fecha_str': df_gas['fecha'].dt.strftime('%Y-%m-%d'),
+            'categoria': df_gas[gas_col],
+            'concepto': df_gas['concepto'],
+            'cantidad': df_gas['cantidad']
+        }).to_dict('records')
 
-    # Format for ECharts
-    ing_data = [{'name': d['concepto'], 'value': round(d['cantidad'], 2)} for d in ing_grouped]
-    gas_data = [{'name': d['name'], 'value': round(d['value'], 2)} for d in gas_grouped]
-    
     total_ing = sum(d['value'] for d in ing_data)
     total_gas = sum(d['value'] for d in gas_data)
     
@@ -799,6 +1564,10 @@ def get_monthly_cashflow_detail(periodo=None, window=1):
 
 def get_sankey_data(periodo=None, window=1):
     """Generates nodes and links for a Sankey diagram for a specific month or window."""
+    return memoize('sankey', ('data',), _build_sankey_data, periodo, int(window))
+
+@metrics.timed('sankey')
+def _build_sankey_data(periodo=None, window=1):
     detail = get_monthly_cashflow_detail(periodo, window)
     if not detail['ingresos'] and not detail['gastos']:
         return {'nodes': [], 'links': []}
@@ -808,20 +1577,24 @@ def get_sankey_data(periodo=None, window=1):
         periodo = detail.get('raw_periodo')
 
     # Load investment data for the period
-    _, _, _, _, aportaciones = load_data()
     investments_in_period = 0.0
     investments_by_asset = []
 
-    if not aportaciones.empty and periodo:
+    if periodo:
         # Handle window
-        p_end = pd.Period(periodo, freq='M')
+        p_end = pd.Period(periodo, freq='M').ordinal
         p_start = p_end - (int(window) - 1)
-        mask = (aportaciones['fecha'].dt.to_period('M') >= p_start) & (aportaciones['fecha'].dt.to_period('M') <= p_end)
+        if _range_reads():
+            aportaciones = read_period('aportaciones', *_month_bounds(p_start, p_end))
+        else:
+            _, _, _, _, aportaciones = load_data()
+
+        mask = (aportaciones['periodo'] >= p_start) & (aportaciones['periodo'] <= p_end)
         df_inv = aportaciones[mask & (aportaciones['tipo'] == 'COMPRA')].copy()
         
         if not df_inv.empty:
             investments_in_period = df_inv['cantidad_dinero'].sum()
-            inv_grouped = df_inv.groupby('id_activo')['cantidad_dinero'].sum().reset_index()
+            inv_grouped = df_inv.groupby('id_activo', observed=True)['cantidad_dinero'].sum().reset_index()
             investments_by_asset = inv_grouped.to_dict('records')
 
     nodes = []
@@ -886,181 +1659,207 @@ def get_sankey_data(periodo=None, window=1):
 
     return {'nodes': nodes, 'links': links}
 
-def create_charts(portfolio, flow_data):
-    charts = {}
-    grid_style = {'left': '3%', 'right': '4%', 'bottom': '3%', 'top': '10%', 'containLabel': True}
-    
-    # Common tooltip formatter
-    tooltip_formatter = "{b0}<br />{c0} €"
-
-    # ... (Ingresos, Gastos, Allocation, Performance logic remains) ...
-    if 'ingresos_ts' in flow_data:
-        df = flow_data['ingresos_ts']
-        charts['ingresos'] = {
-            'tooltip': {'trigger': 'axis', 'formatter': tooltip_formatter},
-            'grid': grid_style,
-            'xAxis': {'type': 'category', 'boundaryGap': False, 'data': df['periodo'].tolist(), 'axisLabel': {'color': '#94a3b8'}},
-            'yAxis': {'type': 'value', 'splitLine': {'lineStyle': {'type': 'dashed', 'color': '#f1f5f9'}}},
-            'series': [{'name': 'Ingresos', 'type': 'line', 'smooth': True, 'data': df['cantidad'].tolist(), 'itemStyle': {'color': '#10b981'}, 'areaStyle': {'color': 'rgba(16, 185, 129, 0.1)'}}]
-        }
+CHART_GRID = {'left': '3%', 'right': '4%', 'bottom': '3%', 'top': '10%', 'containLabel': True}
+CHART_TOOLTIP_FORMATTER = "{b0}<br />{c0} €"
 
-    if 'gastos_rec_ts' in flow_data:
-        df = flow_data['gastos_rec_ts']
-        charts['gastos'] = {
-            'tooltip': {'trigger': 'axis', 'formatter': tooltip_formatter},
-            'grid': grid_style,
-            'xAxis': {'type': 'category', 'boundaryGap': False, 'data': df['periodo'].tolist(), 'axisLabel': {'color': '#94a3b8'}},
-            'yAxis': {'type': 'value', 'splitLine': {'lineStyle': {'type': 'dashed', 'color': '#f1f5f9'}}},
-            'series': [{'name': 'Gastos', 'type': 'line', 'smooth': True, 'data': df['cantidad'].tolist(), 'itemStyle': {'color': '#ef4444'}, 'areaStyle': {'color': 'rgba(239, 68, 68, 0.1)'}}]
-        }
+def _chart_ingresos(flow_data, portfolio):
+    if 'ingresos_ts' not in flow_data: return None
+    df = flow_data['ingresos_ts']
+    return {
+        'tooltip': {'trigger': 'axis', 'formatter': CHART_TOOLTIP_FORMATTER},
+        'grid': CHART_GRID,
+        'xAxis': {'type': 'category', 'boundaryGap': False, 'data': df['periodo'].tolist(), 'axisLabel': {'color': '#94a3b8'}},
+        'yAxis': {'type': 'value', 'splitLine': {'lineStyle': {'type': 'dashed', 'color': '#f1f5f9'}}},
+        'series': [{'name': 'Ingresos', 'type': 'line', 'smooth': True, 'data': df['cantidad'].tolist(), 'itemStyle': {'color': '#10b981'}, 'areaStyle': {'color': 'rgba(16, 185, 129, 0.1)'}}]
+    }
 
-    if 'df_cartera' in portfolio:
-        df = portfolio['df_cartera']
-        df_pos = df[df['valor_mercado'] > 0]
-        data_structure = []
-        for tipo, group in df_pos.groupby('tipo'):
-            children = []
-            for _, row in group.iterrows():
-                children.append({'name': row['id_activo'], 'value': round(row['valor_mercado'], 2)})
-            data_structure.append({'name': tipo, 'children': children})
-        charts['allocation'] = {
-            'tooltip': {'trigger': 'item'},
-            'grid': {'top': 0, 'bottom': 0, 'left': 0, 'right': 0},
-            'series': {'type': 'sunburst', 'data': data_structure, 'radius': ['0%', '100%'], 'center': ['50%', '50%'], 'itemStyle': {'borderWidth': 1, 'borderColor': '#fff'}, 'label': {'rotate': 'radial', 'minAngle': 5}}
-        }
-        df_perf = df.sort_values('plusvalia', ascending=True)
-        series_data = []
-        for _, row in df_perf.iterrows():
-            series_data.append({'value': round(row['plusvalia'], 2), 'itemStyle': {'color': '#34d399' if row['plusvalia'] >= 0 else '#f87171'}, 'rentabilidad': round(row['rentabilidad'], 2), 'valor_mercado': round(row['valor_mercado'], 2), 'nombre_completo': row['nombre']})
-        charts['performance'] = {
-            'grid': {'left': '1%', 'right': '4%', 'bottom': '3%', 'top': '0%', 'containLabel': True},
-            'xAxis': {'type': 'value', 'splitLine': {'lineStyle': {'type': 'dashed', 'color': '#f1f5f9'}}},
-            'yAxis': {'type': 'category', 'data': df_perf['nombre'].tolist(), 'axisLabel': {'color': '#475569', 'width': 160, 'overflow': 'truncate'}},
-            'series': [{'type': 'bar', 'data': series_data, 'barWidth': '12px', 'itemStyle': {'borderRadius': 6}}]
-        }
-        
+def _chart_gastos(flow_data, portfolio):
+    if 'gastos_rec_ts' not in flow_data: return None
+    df = flow_data['gastos_rec_ts']
+    return {
+        'tooltip': {'trigger': 'axis', 'formatter': CHART_TOOLTIP_FORMATTER},
+        'grid': CHART_GRID,
+        'xAxis': {'type': 'category', 'boundaryGap': False, 'data': df['periodo'].tolist(), 'axisLabel': {'color': '#94a3b8'}},
+        'yAxis': {'type': 'value', 'splitLine': {'lineStyle': {'type': 'dashed', 'color': '#f1f5f9'}}},
+        'series': [{'name': 'Gastos', 'type': 'line', 'smooth': True, 'data': df['cantidad'].tolist(), 'itemStyle': {'color': '#ef4444'}, 'areaStyle': {'color': 'rgba(239, 68, 68, 0.1)'}}]
+    }
+
+def _chart_allocation(flow_data, portfolio):
+    if 'df_cartera' not in portfolio: return None
+    df = portfolio['df_cartera']
+    df_pos = df[df['valor_mercado'] > 0]
+    data_structure = []
+    for tipo, group in df_pos.groupby('tipo'):
+        children = [{'name': id_activo, 'value': round(valor, 2)}
+                    for id_activo, valor in zip(group['id_activo'].tolist(), group['valor_mercado'].tolist())]
+        data_structure.append({'name': tipo, 'children': children})
+    return {
+        'tooltip': {'trigger': 'item'},
+        'grid': {'top': 0, 'bottom': 0, 'left': 0, 'right': 0},
+        'series': {'type': 'sunburst', 'data': data_structure, 'radius': ['0%', '100%'], 'center': ['50%', '50%'], 'itemStyle': {'borderWidth': 1, 'borderColor': '#fff'}, 'label': {'rotate': 'radial', 'minAngle': 5}}
+    }
+
+def _chart_performance(flow_data, portfolio):
+    if 'df_cartera' not in portfolio: return None
+    df_perf = portfolio['df_cartera'].sort_values('plusvalia', ascending=True)
+    series_data = [
+        {'value': round(plusvalia, 2), 'itemStyle': {'color': '#34d399' if plusvalia >= 0 else '#f87171'}, 'rentabilidad': round(rentabilidad, 2), 'valor_mercado': round(valor, 2), 'nombre_completo': nombre}
+        for plusvalia, rentabilidad, valor, nombre in zip(df_perf['plusvalia'].tolist(), df_perf['rentabilidad'].tolist(),
+                                                         df_perf['valor_mercado'].tolist(), df_perf['nombre'].tolist())
+    ]
+    return {
+        'grid': {'left': '1%', 'right': '4%', 'bottom': '3%', 'top': '0%', 'containLabel': True},
+        'xAxis': {'type': 'value', 'splitLine': {'lineStyle': {'type': 'dashed', 'color': '#f1f5f9'}}},
+        'yAxis': {'type': 'category', 'data': df_perf['nombre'].tolist(), 'axisLabel': {'color': '#475569', 'width': 160, 'overflow': 'truncate'}},
+        'series': [{'type': 'bar', 'data': series_data, 'barWidth': '12px', 'itemStyle': {'borderRadius': 6}}]
+    }
+
+def align_invested_capital(dates, invested_data):
+    """
+    Invested capital at each date of 'dates' (sorted 'YYYY-MM-DD'): the value of the latest
+    'YYYY-MM' key <= date, or the first value for dates before every key.
+    """
+    if not isinstance(invested_data, dict) or not invested_data:
+        return np.zeros(len(dates))
+    sorted_inv_dates = sorted(invested_data.keys())
+    inv_values = np.array([invested_data[d] for d in sorted_inv_dates], dtype=np.float64)
+    idx = np.searchsorted(np.array(sorted_inv_dates), np.asarray(dates, dtype=str), side='right') - 1
+    return inv_values[np.maximum(idx, 0)]
+
+def _chart_history(flow_data, portfolio):
     history_data = get_portfolio_history_chart_data()
-    # Merge invested capital data
-    invested_data = get_invested_capital_history()
+    if not history_data: return None
+
+    # history_data['dates'] is the master timeline (daily prices): forward fill the monthly invested capital
+    invested_series = [round(v, 2) for v in align_invested_capital(history_data['dates'], get_invested_capital_history()).tolist()]
+    # Profit (Value - Invested)
+    profit = np.maximum(0, np.asarray(history_data['values'], dtype=np.float64) - np.asarray(invested_series))
+    profit_series = [round(v, 2) for v in profit.tolist()]
+
+    return {
+        'tooltip': {'trigger': 'axis', 'formatter': '{b0}<br />Total: {c0} €'}, # Simplified tooltip
+        'legend': {'data': ['Capital Invertido', 'Plusvalía'], 'bottom': 0},
+        'grid': CHART_GRID,
+        'xAxis': {'type': 'category', 'boundaryGap': False, 'data': history_data['dates'], 'axisLabel': {'color': '#94a3b8'}},
+        'yAxis': {'type': 'value', 'scale': True, 'splitLine': {'lineStyle': {'type': 'dashed', 'color': '#f1f5f9'}}},
+        'series': [
+            {
+                'name': 'Capital Invertido',
+                'type': 'line',
+                'stack': 'Total',
+                'smooth': True,
+                'lineStyle': {'width': 0},
+                'showSymbol': False,
+                'areaStyle': {'opacity': 0.8, 'color': '#94a3b8'}, # Gray for base capital
+                'itemStyle': {'color': '#94a3b8'},
+                'data': invested_series
+            },
+            {
+                'name': 'Plusvalía',
+                'type': 'line',
+                'stack': 'Total',
+                'smooth': True,
+                'lineStyle': {'width': 0},
+                'showSymbol': False,
+                'areaStyle': {'opacity': 0.8, 'color': '#10b981'}, # Green for profit
+                'itemStyle': {'color': '#10b981'},
+                'data': profit_series
+            }
+        ]
+    }
+
+def _chart_cashflow(flow_data, portfolio):
+    # Combined Cashflow Chart (Income vs Expenses vs Net)
+    if 'ingresos_ts' not in flow_data or 'gastos_rec_ts' not in flow_data: return None
+    ing_df = flow_data['ingresos_ts']
+    gas_df = flow_data['gastos_rec_ts']
     
-    if history_data:
-        # Align dates: history_data['dates'] is the master timeline (daily prices)
-        # We need to map invested capital to these dates
-        
-        invested_series = []
-        current_inv = 0
-        sorted_inv_dates = sorted(invested_data.keys())
-        
-        # Get initial invested (if dates start before history)
-        if sorted_inv_dates:
-             current_inv = invested_data[sorted_inv_dates[0]]
-
-        for date in history_data['dates']:
-            # If we have an exact match or update in invested_data, update current_inv
-            # Simple forward fill logic
-            # Find the latest date in invested_data <= date
-            # Since history_data dates are strings YYYY-MM-DD
-            
-            # Efficient enough for small datasets:
-            valid_dates = [d for d in sorted_inv_dates if d <= date]
-            if valid_dates:
-                current_inv = invested_data[valid_dates[-1]]
-            
-            invested_series.append(round(current_inv, 2))
-            
-        # Calculate Profit (Value - Invested)
-        profit_series = []
-        for val, inv in zip(history_data['values'], invested_series):
-            profit_series.append(round(max(0, val - inv), 2))
-
-        charts['history'] = {
-            'tooltip': {'trigger': 'axis', 'formatter': '{b0}<br />Total: {c0} €'}, # Simplified tooltip
-            'legend': {'data': ['Capital Invertido', 'Plusvalía'], 'bottom': 0},
-            'grid': grid_style,
-            'xAxis': {'type': 'category', 'boundaryGap': False, 'data': history_data['dates'], 'axisLabel': {'color': '#94a3b8'}},
-            'yAxis': {'type': 'value', 'scale': True, 'splitLine': {'lineStyle': {'type': 'dashed', 'color': '#f1f5f9'}}},
-            'series': [
-                {
-                    'name': 'Capital Invertido',
-                    'type': 'line',
-                    'stack': 'Total',
-                    'smooth': True,
-                    'lineStyle': {'width': 0},
-                    'showSymbol': False,
-                    'areaStyle': {'opacity': 0.8, 'color': '#94a3b8'}, # Gray for base capital
-                    'itemStyle': {'color': '#94a3b8'},
-                    'data': invested_series
-                },
-                {
-                    'name': 'Plusvalía',
-                    'type': 'line',
-                    'stack': 'Total',
-                    'smooth': True,
-                    'lineStyle': {'width': 0},
-                    'showSymbol': False,
-                    'areaStyle': {'opacity': 0.8, 'color': '#10b981'}, # Green for profit
-                    'itemStyle': {'color': '#10b981'},
-                    'data': profit_series
-                }
-            ]
-        }
+    # Calculate net flow
+    net_flow_data = (ing_df['cantidad'] - gas_df['cantidad']).round(2).tolist()
     
-    # Combined Cashflow Chart (Income vs Expenses vs Net)
-    if 'ingresos_ts' in flow_data and 'gastos_rec_ts' in flow_data:
-        ing_df = flow_data['ingresos_ts']
-        gas_df = flow_data['gastos_rec_ts']
-        
-        # Calculate net flow
-        net_flow_data = (ing_df['cantidad'] - gas_df['cantidad']).round(2).tolist()
-        
-        charts['cashflow'] = {
-            'tooltip': {'trigger': 'axis', 'axisPointer': {'type': 'shadow'}},
-            'legend': {'data': ['Ingresos', 'Gastos', 'Flujo Neto'], 'bottom': 0},
-            'grid': grid_style,
-            'xAxis': {
-                'type': 'category', 
-                'data': ing_df['periodo'].tolist(), 
-                'axisLabel': {'color': '#94a3b8'}
+    return {
+        'tooltip': {'trigger': 'axis', 'axisPointer': {'type': 'shadow'}},
+        'legend': {'data': ['Ingresos', 'Gastos', 'Flujo Neto'], 'bottom': 0},
+        'grid': CHART_GRID,
+        'xAxis': {
+            'type': 'category', 
+            'data': ing_df['periodo'].tolist(), 
+            'axisLabel': {'color': '#94a3b8'}
+        },
+        'yAxis': {
+            'type': 'value', 
+            'splitLine': {'lineStyle': {'type': 'dashed', 'color': '#f1f5f9'}}
+        },
+        'series': [
+            {
+                'name': 'Ingresos', 
+                'type': 'bar', 
+                'barGap': '0%',
+                'data': ing_df['cantidad'].tolist(), 
+                'itemStyle': {'color': '#10b981', 'opacity': 0.7, 'borderRadius': [4, 4, 0, 0]}
             },
-            'yAxis': {
-                'type': 'value', 
-                'splitLine': {'lineStyle': {'type': 'dashed', 'color': '#f1f5f9'}}
+            {
+                'name': 'Gastos', 
+                'type': 'bar', 
+                'data': gas_df['cantidad'].tolist(), 
+                'itemStyle': {'color': '#ef4444', 'opacity': 0.7, 'borderRadius': [4, 4, 0, 0]}
             },
-            'series': [
-                {
-                    'name': 'Ingresos', 
-                    'type': 'bar', 
-                    'barGap': '0%',
-                    'data': ing_df['cantidad'].tolist(), 
-                    'itemStyle': {'color': '#10b981', 'opacity': 0.7, 'borderRadius': [4, 4, 0, 0]}
-                },
-                {
-                    'name': 'Gastos', 
-                    'type': 'bar', 
-                    'data': gas_df['cantidad'].tolist(), 
-                    'itemStyle': {'color': '#ef4444', 'opacity': 0.7, 'borderRadius': [4, 4, 0, 0]}
-                },
-                {
-                    'name': 'Flujo Neto', 
-                    'type': 'line', 
-                    'smooth': True, 
-                    'data': net_flow_data, 
-                    'itemStyle': {'color': '#3b82f6'}, 
-                    'lineStyle': {'width': 3},
-                    'symbolSize': 8
-                }
-            ]
-        }
-        
+            {
+                'name': 'Flujo Neto', 
+                'type': 'line', 
+                'smooth': True, 
+                'data': net_flow_data, 
+                'itemStyle': {'color': '#3b82f6'}, 
+                'lineStyle': {'width': 3},
+                'symbolSize': 8
+            }
+        ]
+    }
+
+# ECharts option builders: (builder, inputs it needs, versions it depends on)
+CHARTS = {
+    'ingresos': (_chart_ingresos, 'flow', ('data',)),
+    'gastos': (_chart_gastos, 'flow', ('data',)),
+    'cashflow': (_chart_cashflow, 'flow', ('data',)),
+    'allocation': (_chart_allocation, 'portfolio', ('data', 'prices')),
+    'performance': (_chart_performance, 'portfolio', ('data', 'prices')),
+    'history': (_chart_history, None, ('data', 'history'))
+}
+
+def _build_chart(name):
+    builder, needs, _ = CHARTS[name]
+    flow_data = get_financial_flow() if needs == 'flow' else {}
+    portfolio = get_portfolio_summary() if needs == 'portfolio' else {}
+    with metrics.stage(f"chart_{name}"):
+        return builder(flow_data or {}, portfolio or {})
+
+def get_chart(name):
+    """ECharts option of a single chart (None when there is no data). Raises KeyError for unknown charts."""
+    return memoize(f'chart_{name}', CHARTS[name][2], _build_chart, name)
+
+def create_charts(portfolio, flow_data):
+    """Every chart option at once."""
+    charts = {}
+    for name, (builder, _, _) in CHARTS.items():
+        option = builder(flow_data or {}, portfolio or {})
+        if option is not None:
+            charts[name] = option
     return charts
 
 def get_expense_breakdown():
-    _, _, _, gastos, _ = load_data()
-    if gastos is None or gastos.empty: return []
-    
+    return memoize('expense_breakdown', ('data',), _build_expense_breakdown)
+
+@metrics.timed('expense_breakdown')
+def _build_expense_breakdown():
     today_date = datetime.now()
     # Filter expenses for the last 6 months
     start_date = today_date - pd.DateOffset(months=6)
+
+    if _range_reads():
+        gastos = read_period('gastos', start_date, today_date)
+    else:
+        _, _, _, gastos, _ = load_data()
+    if gastos is None or gastos.empty: return []
     
     # Filter expenses: > start_date AND <= today_date
     df = gastos[(gastos['fecha'] > start_date) & (gastos['fecha'] <= today_date)].copy()
@@ -1073,7 +1872,7 @@ def get_expense_breakdown():
     
     # Group by category
     if 'categoria' in df.columns:
-        grouped = df.groupby('categoria')['cantidad'].sum().reset_index()
+        grouped = df.groupby('categoria', observed=True)['cantidad'].sum().reset_index()
         # Calculate monthly average
         grouped['cantidad'] = grouped['cantidad'] / num_months
         
@@ -1091,6 +1890,10 @@ def get_expense_breakdown():
         return []
 
 def get_upcoming_expenses():
+    return memoize('upcoming', ('data',), _build_upcoming_expenses)
+
+@metrics.timed('upcoming')
+def _build_upcoming_expenses():
     _, _, _, gastos, _ = load_data()
     if gastos is None or gastos.empty: return []
     
@@ -1,79 +1,330 @@
 import requests
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
+try:
+    from lxml import etree, html as lxml_html
+except ImportError:  # Optional fast path, BeautifulSoup is used otherwise
+    lxml_html = None
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse
+import threading
 import time
-import random
+import json
+import os
 import re
+import fileio
+import metrics
+
+QUEFONDOS_URL = "https://www.quefondos.com/es/fondos/ficha/index.html?isin={isin}"
+HEADERS = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"}
+
+# Concurrency and politeness settings (overridable via environment)
+MAX_WORKERS = int(os.environ.get('PRICE_FETCH_WORKERS', 4))
+HOST_RATE = float(os.environ.get('PRICE_FETCH_RATE', 1.0))   # Requests per second per host
+HOST_BURST = int(os.environ.get('PRICE_FETCH_BURST', 2))     # Requests allowed back to back
+
+# Last ETag/Last-Modified and parsed price per ISIN, to revalidate pages with conditional requests
+CACHE_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'data', 'quefondos_cache.json')
+
+class TokenBucket:
+    """Thread-safe token bucket: refills 'rate' tokens per second, stores up to 'capacity'."""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = float(rate)
+        self.capacity = max(1.0, float(capacity))
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a token is available. Returns the seconds spent waiting."""
+        if self.rate <= 0:
+            return 0.0
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+_limit_config = {'rate': HOST_RATE, 'burst': HOST_BURST}
+
+def configure_rate_limit(rate=None, burst=None):
+    """Changes the per-host rate limit. Existing buckets are discarded."""
+    with _limiters_lock:
+        if rate is not None:
+            _limit_config['rate'] = float(rate)
+        if burst is not None:
+            _limit_config['burst'] = int(burst)
+        _limiters.clear()
+
+def get_host_limiter(url):
+    """Returns the token bucket shared by every request to the host of 'url'."""
+    host = urlparse(url).netloc.lower()
+    with _limiters_lock:
+        if host not in _limiters:
+            _limiters[host] = TokenBucket(_limit_config['rate'], _limit_config['burst'])
+        return _limiters[host]
+
+_session = {'session': None}
+_session_lock = threading.Lock()
+
+def get_session():
+    """Returns the shared keep-alive session (bounded connection pool per host)."""
+    with _session_lock:
+        if _session['session'] is None:
+            session = requests.Session()
+            session.headers.update(HEADERS)
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=MAX_WORKERS, pool_block=True)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session['session'] = session
+        return _session['session']
+
+def close_session():
+    with _session_lock:
+        if _session['session'] is not None:
+            _session['session'].close()
+            _session['session'] = None
+
+_http_cache = {'loaded': False, 'dirty': False, 'entries': {}}
+_http_cache_lock = threading.Lock()
+
+def _cache_entries():
+    """Returns the per-ISIN validator cache, loading it from disk the first time."""
+    if not _http_cache['loaded']:
+        _http_cache['loaded'] = True
+        if os.path.exists(CACHE_FILE):
+            try:
+                with open(CACHE_FILE, 'r') as f:
+                    _http_cache['entries'] = json.load(f)
+            except Exception:
+                _http_cache['entries'] = {}
+    return _http_cache['entries']
+
+def get_cached_response(isin):
+    with _http_cache_lock:
+        return _cache_entries().get(isin)
+
+def _store_cached_response(isin, response, price):
+    etag = response.headers.get('ETag')
+    last_modified = response.headers.get('Last-Modified')
+    with _http_cache_lock:
+        entries = _cache_entries()
+        if etag or last_modified:
+            entries[isin] = {'etag': etag, 'last_modified': last_modified, 'price': price}
+            _http_cache['dirty'] = True
+        elif entries.pop(isin, None) is not None:
+            _http_cache['dirty'] = True
+
+def save_http_cache():
+    """Persists the validator cache if it changed."""
+    with _http_cache_lock:
+        if not _http_cache['dirty'] or not os.path.isdir(os.path.dirname(CACHE_FILE)):
+            return
+        try:
+            fileio.write_json(CACHE_FILE, _http_cache['entries'])
+            _http_cache['dirty'] = False
+        except Exception as e:
+            print(f"Error saving QueFondos cache: {e}")
 
 def get_price_quefondos(isin):
     """Scrapes QueFondos for the fund price."""
-    url = f"https://www.quefondos.com/es/fondos/ficha/index.html?isin={isin}"
-    headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"}
+    url = QUEFONDOS_URL.format(isin=isin)
     try:
-        r = requests.get(url, headers=headers, timeout=10)
+        # Conditional request: an unchanged page answers 304 and we reuse the last parsed price
+        cached = get_cached_response(isin)
+        headers = {}
+        if cached:
+            if cached.get('etag'):
+                headers['If-None-Match'] = cached['etag']
+            if cached.get('last_modified'):
+                headers['If-Modified-Since'] = cached['last_modified']
+
+        get_host_limiter(url).acquire()
+        start = time.perf_counter()
+        r = get_session().get(url, headers=headers, timeout=10)
+        metrics.observe('finance_scraper_seconds', time.perf_counter() - start,
+                        help='Latency of the price page requests (rate limit waits excluded).', source='quefondos')
+        if r.status_code == 304 and cached:
+            _count_scrape('not_modified')
+            return cached['price']
         if r.status_code == 200:
-            soup = BeautifulSoup(r.text, 'html.parser')
-            
-            # Step 1: Look for "Valor liquidativo"
-            label = soup.find(string=re.compile("Valor liquidativo", re.IGNORECASE))
-            if label:
-                # Price is in a span.floatright inside the same container
-                parent_p = label.find_parent('p')
-                if parent_p:
-                    span_price = parent_p.find('span', class_='floatright')
-                    if span_price:
-                        text = span_price.text.strip()
-                        # Capture price parts: "117,990000 EUR" -> 117.99
-                        match = re.search(r'([\d\.,]+)', text)
-                        if match:
-                            num_str = match.group(1)
-                            clean_num = num_str.replace('.', '').replace(',', '.')
-                            try:
-                                return float(clean_num)
-                            except:
-                                pass
-
-            # Step 2: Alternative fallback search
-            spans = soup.find_all('span', class_='floatright')
-            for s in spans:
-                if any(x in s.text for x in ["EUR", "USD"]):
-                    match = re.search(r'^([\d\.,]+)', s.text.strip())
-                    if match:
-                        num_str = match.group(1)
-                        # Avoid catching 1.0 or single digit numbers from references
-                        if len(num_str.replace('.', '').replace(',', '')) > 2:
-                            clean_num = num_str.replace('.', '').replace(',', '.')
-                            return float(clean_num)
+            price = _parse_price(r.text)
+            if price:
+                _store_cached_response(isin, r, price)
+            _count_scrape('ok' if price else 'not_found')
+            return price
+        _count_scrape(f"http_{r.status_code}")
 
     except Exception as e:
+        _count_scrape('error')
         print(f"QueFondos Error ({isin}): {e}")
     return None
 
+def _count_scrape(outcome):
+    metrics.inc('finance_scraper_requests_total', help='Price page requests by outcome.', source='quefondos', outcome=outcome)
+
+_NUMBER_RE = re.compile(r'([\d\.,]+)')
+_LEADING_NUMBER_RE = re.compile(r'^([\d\.,]+)')
+
+if lxml_html is not None:
+    _FLOATRIGHT = "contains(concat(' ', normalize-space(@class), ' '), ' floatright ')"
+    # First text node containing the label (case-insensitive, like the regex search)
+    _XPATH_NAV_LABEL = etree.XPath(
+        "(//text()[contains(translate(., 'VALORLIQUIDATIVO', 'valorliquidativo'), 'valor liquidativo')])[1]")
+    _XPATH_FIRST_FLOATRIGHT = etree.XPath(f"(.//span[{_FLOATRIGHT}])[1]")
+    _XPATH_ALL_FLOATRIGHT = etree.XPath(f"//span[{_FLOATRIGHT}]")
+
+def _to_float(num_str):
+    return float(num_str.replace('.', '').replace(',', '.'))
+
+def _parse_price_lxml(html):
+    """
+    Same two steps as _parse_price_soup() using lxml and precompiled XPath selectors.
+    Returns None when neither step finds a price.
+    """
+    root = lxml_html.fromstring(html)
+
+    # Step 1: "Valor liquidativo" label -> enclosing <p> -> first span.floatright
+    labels = _XPATH_NAV_LABEL(root)
+    if labels:
+        label = labels[0]
+        container = label.getparent()
+        if label.is_tail:
+            container = container.getparent()
+        parent_p = container if container is not None and container.tag == 'p' else None
+        if parent_p is None and container is not None:
+            parent_p = next(container.iterancestors('p'), None)
+        if parent_p is not None:
+            spans = _XPATH_FIRST_FLOATRIGHT(parent_p)
+            if spans:
+                match = _NUMBER_RE.search(spans[0].text_content().strip())
+                if match:
+                    try:
+                        return _to_float(match.group(1))
+                    except ValueError:
+                        pass
+
+    # Step 2: Alternative fallback search
+    for span in _XPATH_ALL_FLOATRIGHT(root):
+        text = span.text_content()
+        if "EUR" in text or "USD" in text:
+            match = _LEADING_NUMBER_RE.search(text.strip())
+            if match:
+                num_str = match.group(1)
+                # Avoid catching 1.0 or single digit numbers from references
+                if len(num_str.replace('.', '').replace(',', '')) > 2:
+                    return _to_float(num_str)
+    return None
+
+def _parse_price(html):
+    """Extracts the NAV ("Valor liquidativo") from a QueFondos ficha page."""
+    if lxml_html is not None:
+        try:
+            return _parse_price_lxml(html)  # None is a page without a price: no need to parse it again
+        except (etree.ParserError, ValueError):
+            pass
+    # Slow path: lxml is missing or could not parse the page
+    return _parse_price_soup(html)
+
+def _parse_price_soup(html):
+    """Reference extraction with BeautifulSoup (html.parser)."""
+    soup = BeautifulSoup(html, 'html.parser')
+
+    # Step 1: Look for "Valor liquidativo"
+    label = soup.find(string=re.compile("Valor liquidativo", re.IGNORECASE))
+    if label:
+        # Price is in a span.floatright inside the same container
+        parent_p = label.find_parent('p')
+        if parent_p:
+            span_price = parent_p.find('span', class_='floatright')
+            if span_price:
+                text = span_price.text.strip()
+                # Capture price parts: "117,990000 EUR" -> 117.99
+                match = re.search(r'([\d\.,]+)', text)
+                if match:
+                    num_str = match.group(1)
+                    clean_num = num_str.replace('.', '').replace(',', '.')
+                    try:
+                        return float(clean_num)
+                    except:
+                        pass
+
+    # Step 2: Alternative fallback search
+    spans = soup.find_all('span', class_='floatright')
+    for s in spans:
+        if any(x in s.text for x in ["EUR", "USD"]):
+            match = re.search(r'^([\d\.,]+)', s.text.strip())
+            if match:
+                num_str = match.group(1)
+                # Avoid catching 1.0 or single digit numbers from references
+                if len(num_str.replace('.', '').replace(',', '')) > 2:
+                    clean_num = num_str.replace('.', '').replace(',', '.')
+                    return float(clean_num)
+    return None
+
 def get_fund_price(isin):
     # Strategy: Currently using QueFondos scraper as it proved more reliable than APIs for this specific set of ISINs.
     # Wrapper for the best available method
     return get_price_quefondos(isin)
 
-def update_prices(activos_df):
+def _fetch_asset(asset_id, nombre, isin):
+    start = time.perf_counter()
+    p = get_fund_price(isin)
+    elapsed = round(time.perf_counter() - start, 3)
+    return {
+        'id': asset_id,
+        'nombre': nombre,
+        'isin': isin,
+        'price': p if p else 0.0,
+        'status': 'ok' if p else 'not_found',
+        'seconds': elapsed
+    }
+
+def update_prices(activos_df, max_workers=None, on_progress=None):
+    """
+    Fetches the price of every asset using a bounded thread pool.
+    Requests to the same host are spaced by the per-host token bucket.
+    'on_progress(result)' is called once per asset with its price, status and timing.
+    """
     prices = {}
-    for _, row in activos_df.iterrows():
-        asset_id = row['id']
-        isin = row['isin']
-        tipo = str(row['tipo']).lower()
-        
-        if 'efectivo' in tipo or 'cash' in str(isin).lower():
+    pending = []
+    for asset_id, nombre, isin, tipo in zip(activos_df['id'], activos_df['nombre'],
+                                            activos_df['isin'], activos_df['tipo']):
+        if 'efectivo' in str(tipo).lower() or 'cash' in str(isin).lower():
             prices[asset_id] = 1.0
+            if on_progress:
+                on_progress({'id': asset_id, 'nombre': nombre, 'isin': isin,
+                             'price': 1.0, 'status': 'cash', 'seconds': 0.0})
             continue
-            
-        print(f"Fetching {row['nombre']} ({isin})...")
-        p = get_fund_price(isin)
-        
-        if p:
-            prices[asset_id] = p
-            print(f"  -> Found: {p}")
-        else:
-            prices[asset_id] = 0.0
-            print("  -> Not found")
-            
-        time.sleep(random.uniform(0.5, 1.5))
-        
-    return prices
\ No newline at end of file
+        pending.append((asset_id, nombre, isin))
+
+    if not pending:
+        return prices
+
+    workers = max(1, min(max_workers or MAX_WORKERS, len(pending)))
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_fetch_asset, *args) for args in pending]
+        for future in as_completed(futures):
+            result = future.result()
+            prices[result['id']] = result['price']
+            if result['status'] == 'ok':
+                print(f"Fetched {result['nombre']} ({result['isin']}) -> Found: {result['price']} [{result['seconds']}s]")
+            else:
+                print(f"Fetched {result['nombre']} ({result['isin']}) -> Not found [{result['seconds']}s]")
+            if on_progress:
+                on_progress(result)
+
+    save_http_cache()
+    print(f"Prices fetched for {len(pending)} assets in {round(time.perf_counter() - start, 2)}s ({workers} workers)")
+    return prices
@@ -0,0 +1,123 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+# In-process metrics in the Prometheus text format (no client library needed).
+# Values are per process: with several workers every worker exposes its own counts.
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+_histograms = {}  # {name: {'help': str, 'series': {labels: {'buckets': [...], 'sum': float, 'count': int}}}}
+_counters = {}    # {name: {'help': str, 'series': {labels: float}}}
+_collectors = []  # Callables returning [(name, type, help, [(labels dict, value)])] at scrape time
+_request = threading.local()  # Stage timings of the request handled by this thread
+
+def _labels_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def observe(name, seconds, help='', **labels):
+    """Adds one observation to the histogram 'name'."""
+    with _lock:
+        metric = _histograms.setdefault(name, {'help': help, 'series': {}})
+        series = metric['series'].setdefault(_labels_key(labels), {'buckets': [0] * len(LATENCY_BUCKETS), 'sum': 0.0, 'count': 0})
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                series['buckets'][i] += 1
+        series['sum'] += seconds
+        series['count'] += 1
+
+def inc(name, value=1, help='', **labels):
+    with _lock:
+        metric = _counters.setdefault(name, {'help': help, 'series': {}})
+        key = _labels_key(labels)
+        metric['series'][key] = metric['series'].get(key, 0) + value
+
+def register_collector(collector):
+    """'collector()' is called on every scrape and returns [(name, type, help, [(labels, value)])]."""
+    _collectors.append(collector)
+
+def start_request():
+    _request.stages = []
+
+def request_stages():
+    """[(stage, seconds)] recorded by the current request, in completion order."""
+    return getattr(_request, 'stages', None) or []
+
+def record_stage(stage, seconds):
+    observe('finance_stage_seconds', seconds, help='Time spent in each instrumented stage.', stage=stage)
+    stages = getattr(_request, 'stages', None)
+    if stages is not None:
+        stages.append((stage, seconds))
+
+@contextmanager
+def stage(name):
+    """Times the block as stage 'name' (histogram and Server-Timing of the current request)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+def timed(name):
+    """Decorator version of stage()."""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def server_timing(stages, total=None):
+    """Server-Timing header value; repeated stages (nested or called twice) are summed."""
+    durations = {}
+    for name, seconds in stages:
+        durations[name] = durations.get(name, 0.0) + seconds
+    entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in durations.items()]
+    if total is not None:
+        entries.append(f"total;dur={total * 1000:.1f}")
+    return ', '.join(entries)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels) + '}'
+
+def _format_value(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return 'NaN'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def render():
+    """Every metric in the Prometheus text exposition format (version 0.0.4)."""
+    lines = []
+    with _lock:
+        for name, metric in sorted(_counters.items()):
+            lines += [f"# HELP {name} {metric['help']}", f"# TYPE {name} counter"]
+            for labels, value in sorted(metric['series'].items()):
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        for name, metric in sorted(_histograms.items()):
+            lines += [f"# HELP {name} {metric['help']}", f"# TYPE {name} histogram"]
+            for labels, series in sorted(metric['series'].items()):
+                for bound, count in zip(LATENCY_BUCKETS, series['buckets']):
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', repr(bound)),))} {count}")
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {series['count']}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(series['sum'])}")
+                lines.append(f"{name}_count{_format_labels(labels)} {series['count']}")
+    for collector in _collectors:
+        for name, kind, help, samples in collector():
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+            for labels, value in samples:
+                lines.append(f"{name}{_format_labels(_labels_key(labels))} {_format_value(value)}")
+    return '\n'.join(lines) + '\n'
+
+def reset():
+    """Drops every recorded value (collectors stay registered)."""
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
@@ -0,0 +1,113 @@
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import os
+import fileio
+
+# Daily prices partitioned by year: <store>/year=YYYY/part-0.parquet
+SCHEMA = pa.schema([
+    ('fecha', pa.date32()),
+    ('id_activo', pa.string()),
+    ('precio', pa.float64())
+])
+PARTITION_FILE = 'part-0.parquet'
+
+def _partition_path(store_dir, year):
+    return os.path.join(store_dir, f"year={int(year)}", PARTITION_FILE)
+
+def _to_table(df):
+    df = pd.DataFrame({
+        'fecha': pd.to_datetime(df['fecha']).dt.date,
+        'id_activo': df['id_activo'].astype(str),
+        'precio': df['precio'].astype(float)
+    })
+    return pa.Table.from_pandas(df, schema=SCHEMA, preserve_index=False)
+
+def _write_partition(store_dir, year, table):
+    """Atomically replaces one year partition (the temporary file is a dot file, ignored by readers)."""
+    path = _partition_path(store_dir, year)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with fileio.atomic_open(path, 'wb') as f:
+        pq.write_table(table, f)
+
+def _partition_files(store_dir):
+    if not os.path.isdir(store_dir):
+        return []
+    files = []
+    for name in os.listdir(store_dir):
+        path = os.path.join(store_dir, name, PARTITION_FILE)
+        if name.startswith('year=') and os.path.exists(path):
+            files.append(path)
+    return sorted(files)
+
+def has_data(store_dir):
+    return bool(_partition_files(store_dir))
+
+def version(store_dir):
+    """Cheap change marker: (file, mtime, size) of every partition."""
+    return tuple((p, os.stat(p).st_mtime_ns, os.stat(p).st_size) for p in _partition_files(store_dir))
+
+def upsert_day(store_dir, fecha, prices_dict):
+    """
+    Writes the prices of a single day, replacing any previous prices for that day. The read-modify-write
+    of the year partition runs under the store lock, so concurrent workers do not drop each other's days.
+    """
+    day = pd.Timestamp(fecha).date()
+    df_new = pd.DataFrame({'fecha': day, 'id_activo': list(prices_dict.keys()), 'precio': list(prices_dict.values())})
+    table_new = _to_table(df_new)
+
+    path = _partition_path(store_dir, day.year)
+    with fileio.locked(store_dir):
+        if os.path.exists(path):
+            table_old = pq.read_table(path, schema=SCHEMA)
+            table_old = table_old.filter(pc.not_equal(table_old['fecha'], pa.scalar(day, pa.date32())))
+            table_new = pa.concat_tables([table_old, table_new])
+
+        _write_partition(store_dir, day.year, table_new.sort_by([('fecha', 'ascending'), ('id_activo', 'ascending')]))
+
+def read_prices(store_dir, start=None, end=None, columns=None, assets=None):
+    """
+    Reads prices as a DataFrame ('fecha' as datetime64).
+    'columns' projects the columns to read; 'start'/'end' (inclusive) and 'assets' are pushed down
+    to the Parquet scan, so partitions and row groups outside the range are skipped.
+    """
+    columns = columns or SCHEMA.names
+    if not has_data(store_dir):
+        return pd.DataFrame({c: pd.Series(dtype='datetime64[ns]' if c == 'fecha' else None) for c in columns})
+
+    dataset = ds.dataset(store_dir, format='parquet', partitioning='hive', schema=SCHEMA.append(pa.field('year', pa.int32())))
+    filters = []
+    if start is not None:
+        start = pd.Timestamp(start)
+        filters += [ds.field('year') >= start.year, ds.field('fecha') >= pa.scalar(start.date(), pa.date32())]
+    if end is not None:
+        end = pd.Timestamp(end)
+        filters += [ds.field('year') <= end.year, ds.field('fecha') <= pa.scalar(end.date(), pa.date32())]
+    if assets is not None:
+        filters.append(ds.field('id_activo').isin([str(a) for a in assets]))
+
+    expression = None
+    for f in filters:
+        expression = f if expression is None else expression & f
+
+    table = dataset.to_table(columns=columns, filter=expression)
+    df = table.to_pandas(date_as_object=False)
+    if 'fecha' in df.columns:
+        df['fecha'] = df['fecha'].astype('datetime64[ns]')
+        df.sort_values([c for c in ('fecha', 'id_activo') if c in df.columns], inplace=True, ignore_index=True)
+    return df
+
+def migrate_from_csv(csv_path, store_dir):
+    """One-shot import of precios_historicos.csv. Returns the number of rows written."""
+    df = pd.read_csv(csv_path)
+    if df.empty:
+        return 0
+    df['fecha'] = pd.to_datetime(df['fecha'])
+    df = df.drop_duplicates(subset=['fecha', 'id_activo'], keep='last')
+    with fileio.locked(store_dir):
+        for year, group in df.groupby(df['fecha'].dt.year):
+            table = _to_table(group).sort_by([('fecha', 'ascending'), ('id_activo', 'ascending')])
+            _write_partition(store_dir, year, table)
+    return len(df)
@@ -0,0 +1,127 @@
+import cProfile
+import io
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+# On-demand profiling of single requests. Off unless the process starts with PROFILING=1; then
+# a request asks for it with ?profile=<mode> or the X-Profile header.
+ENABLED = os.environ.get('PROFILING', '0') == '1'
+MODES = ('cprofile', 'sample')
+SAMPLE_INTERVAL = 0.002  # Seconds between stack samples of the sampling profiler
+MAX_PROFILES = 50        # Older captures are deleted
+EXTENSIONS = {'.prof': 'cProfile (pstats)', '.txt': 'Resumen', '.folded': 'Pilas (flamegraph)'}
+
+_busy = threading.Lock()  # One capture at a time: cProfile does not nest across threads
+
+def requested_mode(value):
+    """Profiler mode asked for by a ?profile= / X-Profile value, or None."""
+    if not ENABLED or not value:
+        return None
+    value = value.strip().lower()
+    if value in ('1', 'true', 'yes'):
+        return 'cprofile'
+    return value if value in MODES else None
+
+class _CProfileCapture:
+    """Deterministic profile of the calling thread: .prof for pstats/snakeviz plus a text summary."""
+    def __init__(self):
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def write(self, base):
+        self.profile.dump_stats(base + '.prof')
+        stream = io.StringIO()
+        pstats.Stats(self.profile, stream=stream).sort_stats('cumulative').print_stats(40)
+        with open(base + '.txt', 'w', encoding='utf-8') as f:
+            f.write(stream.getvalue())
+        return [base + '.prof', base + '.txt']
+
+class _SamplingCapture:
+    """Samples the calling thread's stack from a helper thread; writes collapsed stacks (flamegraph.pl, speedscope)."""
+    def __init__(self):
+        self.target = threading.get_ident()
+        self.stacks = Counter()
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while not self.done.wait(SAMPLE_INTERVAL):
+            frame = sys._current_frames().get(self.target)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self.done.set()
+        self.thread.join()
+
+    def write(self, base):
+        with open(base + '.folded', 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return [base + '.folded']
+
+def start(mode):
+    """Starts profiling the current thread; None when another capture is running."""
+    if not _busy.acquire(blocking=False):
+        return None
+    try:
+        capture = _CProfileCapture() if mode == 'cprofile' else _SamplingCapture()
+    except BaseException:
+        _busy.release()
+        raise
+    capture.started = time.time()
+    capture.start_counter = time.perf_counter()
+    return capture
+
+def stop(capture, profiles_dir, label):
+    """Stops 'capture' and saves it under 'profiles_dir'. Returns the base name of the files written."""
+    try:
+        capture.stop()
+        elapsed_ms = (time.perf_counter() - capture.start_counter) * 1000
+        os.makedirs(profiles_dir, exist_ok=True)
+        stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(capture.started))
+        name = f"{stamp}_{re.sub(r'[^A-Za-z0-9]+', '-', label).strip('-') or 'request'}_{elapsed_ms:.0f}ms"
+        capture.write(os.path.join(profiles_dir, name))
+    finally:
+        _busy.release()
+    _prune(profiles_dir)
+    return name
+
+def list_profiles(profiles_dir):
+    """Captured files, newest first: [{'name', 'kind', 'size_kb', 'fecha'}]."""
+    if not os.path.isdir(profiles_dir):
+        return []
+    entries = []
+    for name in os.listdir(profiles_dir):
+        ext = os.path.splitext(name)[1]
+        if ext not in EXTENSIONS:
+            continue
+        stat = os.stat(os.path.join(profiles_dir, name))
+        entries.append({'name': name, 'kind': EXTENSIONS[ext], 'size_kb': round(stat.st_size / 1024, 1),
+                        'mtime': stat.st_mtime,
+                        'fecha': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(stat.st_mtime))})
+    return sorted(entries, key=lambda e: (e['mtime'], e['name']), reverse=True)
+
+def _prune(profiles_dir):
+    captures = sorted({os.path.splitext(name)[0] for name in os.listdir(profiles_dir)
+                       if os.path.splitext(name)[1] in EXTENSIONS})
+    for base in captures[:-MAX_PROFILES]:  # Names start with the timestamp
+        for ext in EXTENSIONS:
+            try:
+                os.remove(os.path.join(profiles_dir, base + ext))
+            except FileNotFoundError:
+                pass
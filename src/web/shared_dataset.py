@@ -0,0 +1,107 @@
+import os
+import shutil
+import tempfile
+import numpy as np
+import pyarrow as pa
+import pyarrow.feather as feather
+import fileio
+
+# Parsed payload of load_data(), published once per source version and memory-mapped by every
+# worker process: <root>/<key>/<frame>.arrow (uncompressed Arrow IPC files), plus <root>/<key>/blobs/.
+FRAMES = ('activos', 'cartera', 'ingresos', 'gastos', 'aportaciones')
+SUFFIX = '.arrow'
+BLOBS_DIR = 'blobs'  # Other files kept with a version (see save_blob)
+
+def _frame_path(root, key, name):
+    return os.path.join(root, key, f"{name}{SUFFIX}")
+
+def is_published(root, key):
+    return os.path.isdir(os.path.join(root, key))
+
+def publish(root, key, frames):
+    """
+    Writes 'frames' ({name: DataFrame}) as version 'key' and removes the older versions.
+    The version directory is renamed into place once complete, so readers never see half of it.
+    The caller holds the publisher lock.
+    """
+    if is_published(root, key):
+        return
+    os.makedirs(root, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=root, prefix=f".{key}.", suffix='.tmp')  # Dot dirs are not versions
+    try:
+        for name in FRAMES:
+            table = pa.Table.from_pandas(frames[name], preserve_index=True)
+            feather.write_feather(table, os.path.join(tmp_dir, f"{name}{SUFFIX}"), compression='uncompressed')
+        os.rename(tmp_dir, os.path.join(root, key))
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    _prune(root, keep=key)
+
+def _prune(root, keep):
+    # Workers still holding an older version keep their mappings: unlinked files stay readable
+    for name in os.listdir(root):
+        if name != keep and not name.startswith('.'):
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+def load(root, key):
+    """
+    {name: DataFrame} of version 'key', or None when it is not published (or was pruned meanwhile).
+    Files are memory-mapped: numeric and date columns are read-only views of the shared pages,
+    only text columns are materialized per process.
+    """
+    try:
+        return {name: _read(_frame_path(root, key, name)) for name in FRAMES}
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+
+def save_blob(root, key, name, data):
+    """
+    Stores 'data' (bytes) as <root>/<key>/blobs/<name>. Returns False when the version is not
+    published (or was pruned meanwhile).
+    """
+    directory = os.path.join(root, key, BLOBS_DIR)
+    try:
+        os.mkdir(directory)  # Not makedirs: a pruned version must not be recreated
+    except FileExistsError:
+        pass
+    except FileNotFoundError:
+        return False
+    try:
+        with fileio.atomic_open(os.path.join(directory, name), 'wb') as f:
+            f.write(data)
+    except FileNotFoundError:
+        return False
+    return True
+
+def load_blobs(root, key):
+    """
+    {name: bytes} stored by save_blob() for version 'key'. Files not owned by this user, or
+    writable by anyone else, are skipped: callers unpickle them.
+    """
+    directory = os.path.join(root, key, BLOBS_DIR)
+    try:
+        names = [n for n in os.listdir(directory) if not n.startswith('.')]  # Dot files are writes in progress
+    except (FileNotFoundError, NotADirectoryError):
+        return {}
+    blobs = {}
+    for name in names:
+        try:
+            with open(os.path.join(directory, name), 'rb') as f:
+                st = os.fstat(f.fileno())
+                if hasattr(os, 'getuid') and (st.st_uid != os.getuid() or st.st_mode & 0o022):
+                    print(f"Ignoring {name}: not owned by this user or writable by others")
+                    continue
+                blobs[name] = f.read()
+        except FileNotFoundError:  # Pruned meanwhile
+            continue
+    return blobs
+
+def _read(path):
+    df = feather.read_table(path, memory_map=True).to_pandas(split_blocks=True)
+    # Arrow nulls come back as None in text columns: restore the NaN read_csv produces
+    for col in df.columns[df.dtypes == object]:
+        missing = df[col].isna()
+        if missing.any():
+            df.loc[missing, col] = np.nan
+    return df
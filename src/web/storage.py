@@ -0,0 +1,428 @@
+import os
+import sqlite3
+import threading
+from contextlib import closing, contextmanager
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import fileio
+import ledger
+import price_store
+
+# Ledgers and their columns in the layout of data_template/ (SQL types for the SQLite backend)
+TABLES = {
+    'activos': [('id', 'TEXT'), ('nombre', 'TEXT'), ('isin', 'TEXT'), ('tipo', 'TEXT'), ('fuente', 'TEXT'), ('precio_actual', 'REAL')],
+    'cartera': [('id_activo', 'TEXT'), ('participaciones', 'REAL'), ('precio_medio_compra', 'REAL')],
+    'aportaciones': [('fecha', 'TEXT'), ('tipo', 'TEXT'), ('id_activo', 'TEXT'), ('cantidad_dinero', 'REAL'),
+                     ('titulos', 'REAL'), ('precio_titulo', 'REAL'), ('notas', 'TEXT')],
+    'ingresos': [('fecha', 'TEXT'), ('cantidad', 'REAL'), ('concepto', 'TEXT'), ('categoria', 'TEXT')],
+    'gastos_variables': [('fecha', 'TEXT'), ('cantidad', 'REAL'), ('categoria', 'TEXT'), ('concepto', 'TEXT')],
+    'gastos_recurrentes': [('dia', 'INTEGER'), ('cantidad', 'REAL'), ('categoria', 'TEXT'), ('concepto', 'TEXT')],
+}
+PRICES_COLUMNS = [('fecha', 'TEXT'), ('id_activo', 'TEXT'), ('precio', 'REAL')]
+REQUIRED = ('activos', 'cartera')  # Reading them fails when missing; the rest default to empty
+INDEXES = {
+    'aportaciones': [('fecha',), ('id_activo', 'fecha')],
+    'ingresos': [('fecha',), ('categoria', 'fecha')],
+    'gastos_variables': [('fecha',), ('categoria', 'fecha')],
+    'precios': [('fecha',)],  # (id_activo, fecha) is the primary key
+}
+PRICES_TABLE = 'precios'
+# Typed reads (see schema_of): labels repeated across the dated ledgers become categoricals
+CATEGORICAL_COLUMNS = ('categoria', 'concepto', 'id_activo', 'tipo')
+CATEGORICAL_TABLES = ('aportaciones', 'ingresos', 'gastos_variables', 'gastos_recurrentes')
+
+def columns_of(name):
+    return [c for c, _ in TABLES[name]]
+
+def schema_of(name):
+    """{column: pandas dtype} of a typed read of 'name'; 'fecha' is parsed as datetime64 instead."""
+    dtypes = {}
+    for col, sql_type in TABLES[name]:
+        if sql_type == 'REAL':
+            dtypes[col] = 'float64'
+        elif col in CATEGORICAL_COLUMNS and name in CATEGORICAL_TABLES:
+            dtypes[col] = 'category'
+    return dtypes
+
+def apply_schema(df, name):
+    """Casts a read of 'name' to schema_of(name); categories are sorted, so grouping keeps label order."""
+    for col, dtype in schema_of(name).items():
+        if col not in df.columns:
+            continue
+        if df[col].dtype != dtype:
+            df[col] = df[col].astype(dtype)
+        if dtype == 'category' and not df[col].cat.categories.is_monotonic_increasing:
+            df[col] = df[col].cat.reorder_categories(df[col].cat.categories.sort_values())
+    if 'fecha' in df.columns and not pd.api.types.is_datetime64_any_dtype(df['fecha']):
+        df['fecha'] = pd.to_datetime(df['fecha'])
+    return df
+
+def _read_csv_arrow(path, name, usecols):
+    """Typed read with pyarrow's CSV reader: dates, floats and dictionaries are built while parsing."""
+    types = {'float64': pa.float64(), 'category': pa.dictionary(pa.int32(), pa.string())}
+    column_types = {c: types[t] for c, t in schema_of(name).items() if c in usecols}
+    if 'fecha' in usecols:
+        column_types['fecha'] = pa.timestamp('ns')
+    table = pa_csv.read_csv(path, parse_options=pa_csv.ParseOptions(newlines_in_values=True),
+                            convert_options=pa_csv.ConvertOptions(column_types=column_types, include_columns=usecols,
+                                                                  strings_can_be_null=True))
+    return _restore_nan(table.to_pandas())
+
+def _day_bounds(start, end):
+    """ISO bounds [start, end + 1 day) of an inclusive date range (either side may be None)."""
+    lo = pd.Timestamp(start).strftime('%Y-%m-%d') if start is not None else None
+    hi = (pd.Timestamp(end).normalize() + pd.Timedelta(days=1)).strftime('%Y-%m-%d') if end is not None else None
+    return lo, hi
+
+def _restore_nan(df):
+    # NULLs come back as None in text columns: use the NaN read_csv produces
+    for col in df.columns[df.dtypes == object]:
+        missing = df[col].isna()
+        if missing.any():
+            df.loc[missing, col] = np.nan
+    return df
+
+class CsvStorage:
+    """
+    The original layout: one CSV per ledger in 'data_dir' and the Parquet price store
+    (a legacy precios_historicos.csv is migrated into it the first time prices are needed).
+    """
+    backend = 'csv'
+
+    def __init__(self, data_dir, history_store_dir, history_file):
+        self.location = data_dir
+        self.data_dir = data_dir
+        self.history_store_dir = history_store_dir
+        self.history_file = history_file
+
+    def path(self, name):
+        return os.path.join(self.data_dir, f"{name}.csv")
+
+    def _source(self, name):
+        path = self.path(name)
+        if name == 'gastos_variables' and not os.path.exists(path):
+            legacy = os.path.join(self.data_dir, "gastos.csv")
+            if os.path.exists(legacy):
+                return legacy
+        return path
+
+    def locked(self, name):
+        return fileio.locked(self.path(name))
+
+    def version(self, name):
+        """(mtime_ns, size) of the file behind 'name', None when it does not exist."""
+        try:
+            st = os.stat(self._source(name))
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def read(self, name, columns=None, typed=False):
+        """
+        Rows of 'name' as read_csv infers them, or with typed=True as schema_of(name): only the
+        schema columns, parsed by pyarrow with dtypes and dates set while reading.
+        """
+        path = self._source(name)
+        if name not in REQUIRED and not os.path.exists(path):
+            df = pd.DataFrame(columns=columns or columns_of(name))
+            return apply_schema(df, name) if typed else df
+        if not typed:
+            return pd.read_csv(path, usecols=(lambda c: c in columns) if columns else None)
+
+        wanted = columns or columns_of(name)
+        usecols = [c for c in fileio.read_header(path) if c in wanted]
+        try:
+            df = _read_csv_arrow(path, name, usecols)
+        except pa.ArrowException:
+            # Ragged rows or values pyarrow rejects (non-ISO dates): the default parser, then the same casts
+            df = pd.read_csv(path, usecols=usecols)
+        return apply_schema(df, name)
+
+    def read_range(self, name, start=None, end=None, columns=None, typed=False):
+        """Rows with 'fecha' in [start, end] (inclusive days), in file order. The whole file is parsed."""
+        df = self.read(name, columns, typed=typed)
+        lo, hi = _day_bounds(start, end)
+        fechas = pd.to_datetime(df['fecha'])
+        mask = pd.Series(True, index=df.index)
+        if lo is not None:
+            mask &= fechas >= lo
+        if hi is not None:
+            mask &= fechas < hi
+        return df[mask].reset_index(drop=True)
+
+    def date_bounds(self, name):
+        """(first, last) 'fecha' of 'name' as Timestamps, (None, None) when it has no dated rows."""
+        fechas = self.read(name, ['fecha'], typed=True)['fecha'].dropna()
+        return (fechas.min(), fechas.max()) if len(fechas) else (None, None)
+
+    def append(self, name, rows):
+        """
+        Appends 'rows' (dicts) with a single write; the caller holds locked(name).
+        Returns False when the file had to be rewritten instead (old file without some column).
+        """
+        path = self.path(name)
+        if fileio.append_csv_rows(path, rows, columns_of(name)):
+            return True
+        df_old = pd.read_csv(path)
+        fileio.write_csv(pd.concat([df_old, pd.DataFrame(rows)], ignore_index=True), path, index=False)
+        return False
+
+    def sync_ledger(self, checkpoint_path, force_full=False):
+        return ledger.sync(self.path('aportaciones'), self.path('cartera'), checkpoint_path, force_full=force_full)
+
+    def has_prices(self):
+        """Migrates the legacy precios_historicos.csv into the Parquet store the first time it is needed."""
+        if not price_store.has_data(self.history_store_dir) and os.path.exists(self.history_file):
+            try:
+                rows = price_store.migrate_from_csv(self.history_file, self.history_store_dir)
+                print(f"Price history migrated to Parquet ({rows} rows).")
+            except Exception as e:
+                print(f"Error migrating price history: {e}")
+        return price_store.has_data(self.history_store_dir)
+
+    def save_prices(self, fecha, prices_dict):
+        self.has_prices()
+        price_store.upsert_day(self.history_store_dir, fecha, prices_dict)
+
+    def read_prices(self, start=None, end=None, columns=None, assets=None):
+        return price_store.read_prices(self.history_store_dir, start=start, end=end, columns=columns, assets=assets)
+
+    def prices_version(self):
+        history_mtime = os.stat(self.history_file).st_mtime_ns if os.path.exists(self.history_file) else None
+        return (price_store.version(self.history_store_dir), history_mtime)
+
+class SqliteStorage:
+    """
+    Every ledger and the price history as tables of a single SQLite database, indexed for
+    date range queries. Dates are stored as the ISO text of the CSVs ('YYYY-MM-DD'), so text
+    order is date order. Triggers count inserts and edits per table: version() is a single
+    indexed read and the ledger replays only the rows inserted since its checkpoint.
+    """
+    backend = 'sqlite'
+
+    def __init__(self, db_path):
+        self.location = db_path
+        self.db_path = db_path
+        self._schema_lock = threading.Lock()
+        with self._connect() as conn:
+            for name in TABLES:
+                self._create_table(conn, name, columns_of(name))
+            conn.execute(f'CREATE TABLE IF NOT EXISTS "{PRICES_TABLE}" (fecha TEXT NOT NULL, id_activo TEXT NOT NULL, '
+                         f'precio REAL, PRIMARY KEY (id_activo, fecha))')
+            self._track_changes(conn, PRICES_TABLE)
+            self._create_indexes(conn, PRICES_TABLE)
+
+    @contextmanager
+    def _connect(self):
+        # A connection per operation: cheap for SQLite and safe across threads and forked workers
+        with closing(sqlite3.connect(self.db_path, timeout=30)) as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            with conn:  # One transaction
+                yield conn
+
+    def _create_table(self, conn, name, columns):
+        types = dict(TABLES.get(name, []))
+        definitions = ', '.join(f"{_q(c)} {types.get(c, '')}".strip() for c in columns)
+        conn.execute(f'CREATE TABLE IF NOT EXISTS "{name}" ({definitions})')
+        self._track_changes(conn, name)
+        self._create_indexes(conn, name)
+
+    def _track_changes(self, conn, name):
+        conn.execute('CREATE TABLE IF NOT EXISTS _changes (name TEXT PRIMARY KEY, '
+                     'appends INTEGER NOT NULL DEFAULT 0, edits INTEGER NOT NULL DEFAULT 0)')
+        conn.execute('INSERT OR IGNORE INTO _changes (name) VALUES (?)', (name,))
+        for event, counter in (('INSERT', 'appends'), ('UPDATE', 'edits'), ('DELETE', 'edits')):
+            conn.execute(f'CREATE TRIGGER IF NOT EXISTS "{name}_{event.lower()}" AFTER {event} ON "{name}" '
+                         f"BEGIN UPDATE _changes SET {counter} = {counter} + 1 WHERE name = '{name}'; END")
+
+    def _create_indexes(self, conn, name):
+        existing = set(self._table_columns(conn, name))
+        for cols in INDEXES.get(name, []):
+            if set(cols) <= existing:
+                conn.execute(f'CREATE INDEX IF NOT EXISTS "idx_{name}_{"_".join(cols)}" ON "{name}" ({", ".join(map(_q, cols))})')
+
+    def _table_columns(self, conn, name):
+        return [row[1] for row in conn.execute(f'PRAGMA table_info("{name}")')]
+
+    def _add_columns(self, conn, name, columns):
+        with self._schema_lock:
+            existing = self._table_columns(conn, name)
+            for col in columns:
+                if col not in existing:
+                    conn.execute(f'ALTER TABLE "{name}" ADD COLUMN {_q(col)}')
+
+    def locked(self, name):
+        return fileio.locked(f"{self.db_path}.{name}")
+
+    def version(self, name):
+        """(inserts, edits) counted by the triggers of 'name'."""
+        with self._connect() as conn:
+            row = conn.execute('SELECT appends, edits FROM _changes WHERE name = ?', (name,)).fetchone()
+        return tuple(row) if row else None
+
+    def _read_sql(self, conn, name, columns, where='', params=(), order='rowid'):
+        columns = columns or self._table_columns(conn, name)
+        types = dict(PRICES_COLUMNS if name == PRICES_TABLE else TABLES.get(name, []))
+        query = f'SELECT {", ".join(map(_q, columns))} FROM "{name}" {where} ORDER BY {order}'
+        df = pd.read_sql_query(query, conn, params=params,
+                               dtype={c: 'float64' for c in columns if types.get(c) == 'REAL'})
+        return _restore_nan(df)
+
+    def read(self, name, columns=None, typed=False):
+        """Rows of 'name' in insertion order; typed=True casts them to schema_of(name)."""
+        with self._connect() as conn:
+            df = self._read_sql(conn, name, columns)
+        return apply_schema(df, name) if typed else df
+
+    def read_range(self, name, start=None, end=None, columns=None, typed=False):
+        """Rows with 'fecha' in [start, end] (inclusive days), in insertion order; served by the (fecha) index."""
+        lo, hi = _day_bounds(start, end)
+        conditions, params = [], []
+        if lo is not None:
+            conditions.append('fecha >= ?')
+            params.append(lo)
+        if hi is not None:
+            conditions.append('fecha < ?')
+            params.append(hi)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        with self._connect() as conn:
+            df = self._read_sql(conn, name, columns, where, params)
+        return apply_schema(df, name) if typed else df
+
+    def date_bounds(self, name):
+        """(first, last) 'fecha' of 'name' as Timestamps, (None, None) when it has no rows; two (fecha) index lookups."""
+        with self._connect() as conn:
+            # One aggregate per subquery: SQLite only answers a lone MIN/MAX from the index
+            first, last = conn.execute(f'SELECT (SELECT MIN(fecha) FROM "{name}"), (SELECT MAX(fecha) FROM "{name}")').fetchone()
+        return (pd.Timestamp(first), pd.Timestamp(last)) if first is not None else (None, None)
+
+    def read_after(self, name, rowid):
+        """Rows inserted after 'rowid', with their 'rowid' as first column."""
+        with self._connect() as conn:
+            columns = ['rowid'] + self._table_columns(conn, name)
+            return self._read_sql(conn, name, columns, 'WHERE rowid > ?', (rowid,))
+
+    def append(self, name, rows):
+        """Inserts 'rows' (dicts) in one transaction. Returns True (nothing is ever rewritten)."""
+        with self._connect() as conn:
+            columns = self._table_columns(conn, name)
+            extra = [k for row in rows for k in row if k not in columns]
+            if extra:
+                self._add_columns(conn, name, dict.fromkeys(extra))
+                columns = self._table_columns(conn, name)
+            conn.executemany(f'INSERT INTO "{name}" ({", ".join(map(_q, columns))}) VALUES ({", ".join("?" * len(columns))})',
+                             [[_sql_value(row.get(c)) for c in columns] for row in rows])
+        return True
+
+    def replace(self, name, df):
+        """Replaces every row of 'name' with 'df' in one transaction (columns missing from the table are added)."""
+        with self._connect() as conn:
+            self._add_columns(conn, name, list(df.columns))
+            conn.execute(f'DELETE FROM "{name}"')
+            if not df.empty:
+                conn.executemany(f'INSERT INTO "{name}" ({", ".join(map(_q, df.columns))}) VALUES ({", ".join("?" * len(df.columns))})',
+                                 [[_sql_value(v) for v in row] for row in df.itertuples(index=False, name=None)])
+
+    def sync_ledger(self, checkpoint_path, force_full=False):
+        return ledger.sync_rows(self, checkpoint_path, force_full=force_full)
+
+    def has_prices(self):
+        with self._connect() as conn:
+            return conn.execute(f'SELECT 1 FROM "{PRICES_TABLE}" LIMIT 1').fetchone() is not None
+
+    def save_prices(self, fecha, prices_dict):
+        """Writes the prices of a single day, replacing any previous prices for that day."""
+        day = pd.Timestamp(fecha).strftime('%Y-%m-%d')
+        with self._connect() as conn:
+            conn.execute(f'DELETE FROM "{PRICES_TABLE}" WHERE fecha = ?', (day,))
+            conn.executemany(f'INSERT INTO "{PRICES_TABLE}" (fecha, id_activo, precio) VALUES (?, ?, ?)',
+                             [(day, str(a), float(p)) for a, p in prices_dict.items()])
+
+    def read_prices(self, start=None, end=None, columns=None, assets=None):
+        """Same contract as price_store.read_prices() ('fecha' as datetime64, ordered by date and asset)."""
+        columns = columns or ['fecha', 'id_activo', 'precio']
+        lo, hi = _day_bounds(start, end)
+        conditions, params = [], []
+        if lo is not None:
+            conditions.append('fecha >= ?')
+            params.append(lo)
+        if hi is not None:
+            conditions.append('fecha < ?')
+            params.append(hi)
+        if assets is not None:
+            assets = [str(a) for a in assets]
+            conditions.append(f"id_activo IN ({', '.join('?' * len(assets))})")
+            params += assets
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        order = ', '.join(c for c in ('fecha', 'id_activo') if c in columns) or 'rowid'
+        with self._connect() as conn:
+            df = self._read_sql(conn, PRICES_TABLE, columns, where, params, order=order)
+        if 'fecha' in df.columns:
+            df['fecha'] = pd.to_datetime(df['fecha'])
+        return df
+
+    def prices_version(self):
+        return self.version(PRICES_TABLE)
+
+def _q(column):
+    return '"' + str(column).replace('"', '""') + '"'
+
+def _sql_value(value):
+    """NaN/NaT as NULL and numpy scalars as plain Python values."""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    return value.item() if hasattr(value, 'item') else value
+
+def import_csv(data_dir, db_path, history_store_dir=None):
+    """
+    Loads the CSV layout of 'data_dir' (and its price store) into the SQLite database 'db_path',
+    replacing the tables it contains. Columns keep the order of each file; columns unknown to the
+    schema are kept as untyped columns. Returns {table: rows imported}.
+    """
+    source = CsvStorage(data_dir, history_store_dir or os.path.join(data_dir, 'precios_historicos'),
+                        os.path.join(data_dir, 'precios_historicos.csv'))
+    target = SqliteStorage(db_path)
+    counts = {}
+    with target._connect() as conn:
+        for name in TABLES:
+            if not os.path.exists(source._source(name)):
+                continue
+            df = pd.read_csv(source._source(name))
+            conn.execute(f'DROP TABLE IF EXISTS "{name}"')
+            target._create_table(conn, name, list(df.columns))
+            conn.execute('UPDATE _changes SET edits = edits + 1 WHERE name = ?', (name,))  # Counters survive the drop
+            if not df.empty:
+                conn.executemany(f'INSERT INTO "{name}" ({", ".join(map(_q, df.columns))}) VALUES ({", ".join("?" * len(df.columns))})',
+                                 [[_sql_value(v) for v in row] for row in df.itertuples(index=False, name=None)])
+            counts[name] = len(df)
+    if source.has_prices():
+        prices = source.read_prices()
+        prices['fecha'] = prices['fecha'].dt.strftime('%Y-%m-%d')
+        with target._connect() as conn:
+            conn.execute(f'DELETE FROM "{PRICES_TABLE}"')
+            conn.executemany(f'INSERT INTO "{PRICES_TABLE}" (fecha, id_activo, precio) VALUES (?, ?, ?)',
+                             prices[['fecha', 'id_activo', 'precio']].itertuples(index=False, name=None))
+        counts[PRICES_TABLE] = len(prices)
+    return counts
+
+def export_csv(db_path, data_dir):
+    """
+    Writes every table of 'db_path' back to the CSV layout in 'data_dir' (same columns and order);
+    prices go to precios_historicos.csv, which the CSV backend migrates into its price store.
+    Returns {table: rows exported}.
+    """
+    source = SqliteStorage(db_path)
+    os.makedirs(data_dir, exist_ok=True)
+    counts = {}
+    for name in TABLES:
+        df = source.read(name)
+        fileio.write_csv(df, os.path.join(data_dir, f"{name}.csv"), index=False)
+        counts[name] = len(df)
+    if source.has_prices():
+        prices = source.read_prices()
+        prices['fecha'] = prices['fecha'].dt.strftime('%Y-%m-%d')
+        fileio.write_csv(prices, os.path.join(data_dir, 'precios_historicos.csv'), index=False)
+        counts[PRICES_TABLE] = len(prices)
+    return counts
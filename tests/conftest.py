@@ -0,0 +1,34 @@
+import os
+import sys
+import pytest
+
+# Add src/web to path
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'src', 'web'))
+import logic
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """Minimal data directory with one fund and a cash account."""
+    (tmp_path / "activos.csv").write_text(
+        "id,nombre,isin,tipo,fuente,precio_actual\n"
+        "MSCI_W,Fondo Índice MSCI World,IE00TEST0001,Renta Variable,quefondos,100\n"
+        "CASH_DIG,Cuenta Efectivo,CASH,Efectivo,manual,1\n")
+    (tmp_path / "aportaciones.csv").write_text(
+        "fecha,tipo,id_activo,cantidad_dinero,titulos,precio_titulo,notas\n"
+        "2025-01-01,INICIAL,CASH_DIG,5000.0,5000.0,1.0,Inicial\n"
+        "2025-01-10,COMPRA,MSCI_W,1000.0,10.0,100.0,Manual\n")
+    (tmp_path / "ingresos.csv").write_text("fecha,cantidad,concepto,categoria\n2025-01-25,2500.0,Nomina,Trabajo\n")
+    (tmp_path / "gastos_variables.csv").write_text("fecha,cantidad,categoria,concepto\n2025-01-12,80.0,Comida,Super\n")
+    monkeypatch.setattr(logic, 'DATA_DIR', str(tmp_path))
+    monkeypatch.setattr(logic, 'PRICES_FILE', str(tmp_path / 'latest_prices.json'))
+    monkeypatch.setattr(logic, 'HISTORY_FILE', str(tmp_path / 'precios_historicos.csv'))
+    monkeypatch.setattr(logic, 'HISTORY_STORE_DIR', str(tmp_path / 'precios_historicos'))
+    monkeypatch.setattr(logic, 'LEDGER_CHECKPOINT_FILE', str(tmp_path / '.ledger_checkpoint.json'))
+    monkeypatch.setattr(logic, 'DATA_VERSION_FILE', str(tmp_path / '.version'))
+    monkeypatch.setattr(logic, 'SHARED_DATASET_DIR', str(tmp_path / '.dataset'))
+    monkeypatch.setattr(logic, 'DATABASE_FILE', str(tmp_path / 'finanzas.db'))
+    monkeypatch.setattr(logic, 'REFRESH_JOBS_FILE', str(tmp_path / '.refresh_jobs.json'))
+    monkeypatch.setattr(logic, '_data_cache', {'payload': None, 'versions': {}, 'shared_version': None, 'key': None, 'version': 0, 'hits': 0, 'misses': 0})
+    monkeypatch.setattr(logic, '_artifacts', {'entries': {}, 'hits': {}, 'misses': {}, 'dirty': set(), 'building': {}})
+    logic.reset_caches()  # Recurrent, anomaly, cube and duplicate caches left by the previous test
+    return tmp_path
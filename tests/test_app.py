@@ -0,0 +1,159 @@
+import os
+import sys
+import time
+
+# Add src/web to path
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'src', 'web'))
+import app as dashboard
+import logic
+
+def test_conditional_get_skips_work_until_data_changes(data_dir, monkeypatch):
+    client = dashboard.app.test_client()
+    first = client.get('/api/monthly-detail/2025-01?window=1')
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+
+    calls = []
+    with monkeypatch.context() as m:
+        m.setattr(logic, 'load_data', lambda: calls.append(1))
+        second = client.get('/api/monthly-detail/2025-01?window=1', headers={'If-None-Match': etag})
+    assert second.status_code == 304
+    assert second.headers['ETag'] == etag
+    assert calls == []  # Answered from the fingerprint alone
+
+    # Another window is another representation
+    other = client.get('/api/monthly-detail/2025-01?window=3', headers={'If-None-Match': etag})
+    assert other.status_code == 200
+
+    # Windows outside what the views support are clamped instead of cached one by one
+    assert client.get('/api/monthly-detail/2025-01?window=100000').status_code == 200
+    windows = {k[1][1] for k in logic._artifacts['entries'] if k[0] == 'detail'}
+    assert max(windows) == logic.MAX_WINDOW
+
+def test_etag_changes_when_a_watched_file_changes(data_dir):
+    client = dashboard.app.test_client()
+    etag = client.get('/detail').headers['ETag']
+
+    time.sleep(0.01)
+    with open(data_dir / "gastos_variables.csv", "a") as f:
+        f.write("2025-01-20,30.0,Ocio,Cine\n")
+    response = client.get('/detail', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+def test_etag_changes_with_the_code_version(data_dir, monkeypatch):
+    client = dashboard.app.test_client()
+    etag = client.get('/detail').headers['ETag']
+    monkeypatch.setattr(logic, 'CODE_VERSION', 'next-deploy')
+    response = client.get('/detail', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+def test_charts_are_served_one_by_one(data_dir):
+    (data_dir / "latest_prices.json").write_text('{"MSCI_W": 110.0, "CASH_DIG": 1.0}')
+    client = dashboard.app.test_client()
+    page = client.get('/')
+    assert page.status_code == 200
+    assert b'data-chart="history"' in page.data
+
+    allocation = client.get('/api/charts/allocation').get_json()
+    assert allocation['series']['data'] == [
+        {'name': 'Efectivo', 'children': [{'name': 'CASH_DIG', 'value': 4000.0}]},
+        {'name': 'Renta Variable', 'children': [{'name': 'MSCI_W', 'value': 1100.0}]}]
+    performance = client.get('/api/charts/performance').get_json()
+    assert performance['yAxis']['data'] == ['Cuenta Efectivo', 'Fondo Índice MSCI World']
+    assert [d['value'] for d in performance['series'][0]['data']] == [0.0, 100.0]
+    assert client.get('/api/charts/unknown').status_code == 404
+
+def test_batch_import_preview_then_confirm(data_dir):
+    client = dashboard.app.test_client()
+    subjects = "\n".join([
+        "# 01/03/2025 # SUSCRIPCION # MSCI World # TIT: 2,0 # PRE: 100,00 # 200,00 EUR",
+        "# 11/01/2025 # SUSCRIPCION # MSCI World # TIT: 10,0 # PRE: 100,00 # 1.000,00 EUR",
+    ])
+    preview = client.post('/import-myinvestor-batch', data={'subjects': subjects})
+    assert preview.status_code == 200
+    html = preview.get_data(as_text=True)
+    assert 'name="fecha_1" value="2025-01-11"' in html
+    assert 'Posible duplicado (2025-01-10)' in html
+
+    # Only the first row stays checked
+    form = {'confirm': 'true', 'accept': ['0']}
+    for field in ('fecha', 'tipo', 'id_activo', 'cantidad_dinero', 'titulos', 'precio_titulo'):
+        form[f'{field}_0'] = {'fecha': '2025-03-01', 'tipo': 'COMPRA', 'id_activo': 'MSCI_W',
+                              'cantidad_dinero': '200.0', 'titulos': '2.0', 'precio_titulo': '100.0'}[field]
+    response = client.post('/import-myinvestor-batch', data=form)
+    assert response.status_code == 302
+    assert (data_dir / "aportaciones.csv").read_text().count('Auto-importado (Lote)') == 1
+
+    # The same confirmation again (double click, reload): nothing new is appended
+    assert client.post('/import-myinvestor-batch', data=form).status_code == 302
+    assert (data_dir / "aportaciones.csv").read_text().count('Auto-importado (Lote)') == 1
+
+    # A row the preview flagged is only saved when the user checked it anyway
+    assert 'name="duplicate_1" value="2025-01-10"' in html
+    forced = {'confirm': 'true', 'accept': ['1'], 'duplicate_1': '2025-01-10'}
+    for field in ('fecha', 'tipo', 'id_activo', 'cantidad_dinero', 'titulos', 'precio_titulo'):
+        forced[f'{field}_1'] = {'fecha': '2025-01-11', 'tipo': 'COMPRA', 'id_activo': 'MSCI_W',
+                                'cantidad_dinero': '1000.0', 'titulos': '10.0', 'precio_titulo': '100.0'}[field]
+    client.post('/import-myinvestor-batch', data=forced)
+    assert (data_dir / "aportaciones.csv").read_text().count('Auto-importado (Lote)') == 2
+
+
+def test_responses_report_stage_timings_and_metrics(data_dir):
+    client = dashboard.app.test_client()
+    page = client.get('/')
+    timing = page.headers['Server-Timing']
+    assert 'parse_data;dur=' in timing and 'render;dur=' in timing and 'total;dur=' in timing
+
+    scrape = client.get('/metrics')
+    assert scrape.mimetype == 'text/plain'
+    text = scrape.data.decode()
+    assert 'finance_stage_seconds_count{stage="parse_data"}' in text
+    assert 'finance_request_seconds_bucket{endpoint="index",le="+Inf"}' in text
+    assert 'finance_requests_total{endpoint="index",status="200"}' in text
+    assert 'finance_cache_hit_ratio{cache="summary"}' in text
+
+def test_profiler_captures_a_single_request_only_when_enabled(data_dir, monkeypatch):
+    import profiler
+    client = dashboard.app.test_client()
+    assert 'X-Profile' not in client.get('/?profile=1').headers
+    assert client.get('/profiles').status_code == 404
+
+    monkeypatch.setattr(profiler, 'ENABLED', True)
+    name = client.get('/?profile=cprofile').headers['X-Profile']
+    sampled = client.get('/api/monthly-detail/2025-01', headers={'X-Profile': 'sample'}).headers['X-Profile']
+    assert 'X-Profile' not in client.get('/detail').headers
+    files = sorted(os.listdir(data_dir / 'profiles'))
+    assert files == sorted([f"{name}.prof", f"{name}.txt", f"{sampled}.folded"])
+    assert 'cumulative' in (data_dir / 'profiles' / f"{name}.txt").read_text()
+
+    index = client.get('/profiles')
+    assert index.status_code == 200 and f"{name}.prof".encode() in index.data
+    assert client.get(f"/profiles/{name}.prof").status_code == 200
+    assert client.get('/profiles/../gastos_variables.csv').status_code == 404
+
+def test_refresh_status_flashes_the_outcome_once(data_dir, monkeypatch):
+    monkeypatch.setattr(logic, '_run_refresh_job', lambda job: None)
+    job_id, _ = logic.start_refresh_job()
+    jobs = logic._read_refresh_jobs()
+    jobs[job_id].update(status='error', message='Error actualizando precios: sin conexión')
+    logic.fileio.write_json(logic.REFRESH_JOBS_FILE, jobs)
+
+    client = dashboard.app.test_client()
+    assert client.get(f'/api/refresh/{job_id}').get_json()['status'] == 'error'
+    client.get(f'/api/refresh/{job_id}')
+    html = client.get('/').get_data(as_text=True)
+    assert html.count('Error actualizando precios: sin conexión') == 1
+    assert 'alert-danger' in html
+    assert client.get('/api/refresh/missing').status_code == 404
+
+def test_fresh_install_renders_every_page(data_dir):
+    import shutil
+    template = os.path.join(os.path.dirname(__file__), '..', 'data_template')
+    for name in os.listdir(template):
+        shutil.copy(os.path.join(template, name), data_dir / name)
+
+    client = dashboard.app.test_client()
+    for url in ('/', '/data', '/detail', '/api/charts/ingresos'):
+        assert client.get(url).status_code == 200, url
@@ -0,0 +1,49 @@
+import os
+import sys
+import random
+
+# Add src/web to path
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'src', 'web'))
+from asset_matcher import AssetMatcher
+
+def _reference_match(entries, search_norm):
+    """Linear three-stage search the matcher replaces."""
+    for asset_id, nombre, nombre_norm in entries:
+        if search_norm in nombre_norm:
+            return asset_id, nombre
+    for asset_id, nombre, nombre_norm in entries:
+        if nombre_norm in search_norm:
+            return asset_id, nombre
+    words = [w for w in search_norm.split() if len(w) > 3]
+    if words and entries:
+        scores = [sum(1 for w in words if w in nombre_norm) for _, _, nombre_norm in entries]
+        best_score = max(scores)
+        if best_score >= len(words) * 0.6:
+            asset_id, nombre, _ = entries[scores.index(best_score)]
+            return asset_id, nombre
+    return None
+
+WORDS = ['fondo', 'indice', 'msci', 'world', 'europe', 'emergentes', 'bonos', 'gobierno', 'renta', 'fija',
+         'vanguard', 'amundi', 'ishares', 'acc', 'eur', 'usd', 'global', 'small', 'cap', 'oro']
+
+def _catalog(rng, n):
+    names = [' '.join(rng.sample(WORDS, rng.randint(1, 5))) for _ in range(n)] + ['oro', 'ab', '']
+    return [(f'A{i}', name.upper(), name) for i, name in enumerate(names)]
+
+def test_matcher_agrees_with_linear_search():
+    rng = random.Random(11)
+    entries = _catalog(rng, 300)
+    matcher = AssetMatcher(entries)
+    queries = [' '.join(rng.sample(WORDS, rng.randint(1, 6))) for _ in range(400)]
+    queries += [q[rng.randint(0, 3):] for q in queries[:100]]  # Partial words
+    queries += ['', 'x', 'zz zzzzz', 'fondo indice msci world europe emergentes bonos']
+    for q in queries:
+        assert matcher.match(q) == _reference_match(entries, q), q
+
+def test_matcher_scores_significant_words():
+    matcher = AssetMatcher([('MSCI_W', 'Fondo Índice MSCI World', 'fondo indice msci world'),
+                            ('EM', 'Fondo Índice Emergentes', 'fondo indice emergentes')])
+    assert matcher.match('ishares msci world') == ('MSCI_W', 'Fondo Índice MSCI World')
+    assert matcher.match('vanguard msci world index fund') is None  # 2 of 4 words: below 60%
+    assert matcher.match('indice emergentes acc') == ('EM', 'Fondo Índice Emergentes')
+    assert matcher.match('bonos gobierno') is None
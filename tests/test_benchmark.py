@@ -0,0 +1,32 @@
+import os
+import sys
+
+# Add scripts to path
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'scripts'))
+import benchmark
+
+BASELINE = {'load_data': {'cold': 100.0, 'warm': 2.0}, 'create_charts': {'cold': 200.0, 'warm': 4.0}}
+
+def _regressed(results, **kwargs):
+    return [(name, mode) for name, mode, _, _, regressed in benchmark.compare(results, BASELINE, **kwargs) if regressed]
+
+def test_compare_flags_slowdowns_above_the_threshold():
+    results = {'load_data': {'cold': 124.0, 'warm': 2.0}, 'create_charts': {'cold': 260.0, 'warm': 4.0}}
+    assert _regressed(results, threshold=0.25) == [('create_charts', 'cold')]
+    assert _regressed(results, threshold=0.35) == []
+
+def test_compare_ignores_small_deltas_and_scales_by_machine_speed():
+    # +150% but only 3 ms: noise
+    assert _regressed({'load_data': {'warm': 5.0}}, threshold=0.25) == []
+    # A machine twice as slow doubles the reference
+    assert _regressed({'load_data': {'cold': 190.0}}, threshold=0.25, speed=2.0) == []
+    assert _regressed({'load_data': {'cold': 190.0}}, threshold=0.25) == [('load_data', 'cold')]
+    # Timings without a reference are not compared
+    assert benchmark.compare({'nuevo': {'cold': 1.0}}, BASELINE) == []
+
+def test_committed_baseline_covers_the_default_scale():
+    import json
+    with open(benchmark.BASELINE_FILE) as f:
+        baseline = json.load(f)['medium']
+    assert set(baseline['results']) == set(benchmark.ENTRY_POINTS)
+    assert baseline['calibration_ms'] > 0
@@ -0,0 +1,74 @@
+import os
+import sys
+import multiprocessing
+import pandas as pd
+
+# Add src/web to path
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'src', 'web'))
+import fileio
+
+COLUMNS = ['fecha', 'id', 'cantidad']
+
+def _append_many(path, worker, n):
+    for i in range(n):
+        with fileio.locked(path):
+            fileio.append_csv_rows(path, [{'fecha': '2025-01-01', 'id': f'W{worker}', 'cantidad': float(i)}], COLUMNS)
+
+def test_append_writes_header_once_and_keeps_existing_lines(tmp_path):
+    path = str(tmp_path / "ops.csv")
+    assert fileio.append_csv_rows(path, [{'fecha': '2025-01-01', 'id': 'A', 'cantidad': 1.5}], COLUMNS)
+
+    # Content without a trailing newline and a header in another order
+    with open(path, 'w') as f:
+        f.write("id,fecha,cantidad,notas\nA,2025-01-01,1.5,x")
+    assert fileio.append_csv_rows(path, [{'fecha': '2025-01-02', 'id': 'B, S.A.', 'cantidad': 2.0}], COLUMNS)
+    with open(path) as f:
+        assert f.read() == 'id,fecha,cantidad,notas\nA,2025-01-01,1.5,x\n"B, S.A.",2025-01-02,2.0,\n'
+
+    # Unknown column: nothing is written
+    assert not fileio.append_csv_rows(path, [{'fecha': '2025-01-03', 'otra': 1}], COLUMNS)
+    assert len(pd.read_csv(path)) == 2
+
+def test_concurrent_appends_from_processes_are_not_interleaved(tmp_path):
+    path = str(tmp_path / "ops.csv")
+    ctx = multiprocessing.get_context('fork')
+    workers = [ctx.Process(target=_append_many, args=(path, w, 50)) for w in range(4)]
+    for p in workers:
+        p.start()
+    for p in workers:
+        p.join()
+
+    df = pd.read_csv(path)
+    assert len(df) == 200
+    assert df.groupby('id')['cantidad'].apply(sorted).apply(lambda v: v == [float(i) for i in range(50)]).all()
+
+def _bump_many(path, n):
+    for _ in range(n):
+        fileio.bump_counter(path)
+
+def test_atomic_open_keeps_old_content_on_failure(tmp_path):
+    path = str(tmp_path / "prices.json")
+    fileio.write_json(path, {'A': 1.0})
+    os.chmod(path, 0o640)
+    try:
+        with fileio.atomic_open(path) as f:
+            f.write('{"A": 2.')
+            raise RuntimeError("scraper crashed")
+    except RuntimeError:
+        pass
+    with open(path) as f:
+        assert f.read() == '{"A": 1.0}'
+    assert os.listdir(tmp_path) == ['prices.json']  # No temp file left behind
+
+    fileio.write_json(path, {'A': 2.0})
+    assert oct(os.stat(path).st_mode & 0o777) == oct(0o640)
+
+def test_bump_counter_is_shared_by_processes(tmp_path):
+    path = str(tmp_path / ".version")
+    ctx = multiprocessing.get_context('fork')
+    workers = [ctx.Process(target=_bump_many, args=(path, 25)) for _ in range(4)]
+    for p in workers:
+        p.start()
+    for p in workers:
+        p.join()
+    assert fileio.read_counter(path) == 100
@@ -0,0 +1,113 @@
+import os
+import sys
+import pandas as pd
+
+# Add src/web to path
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'src', 'web'))
+import ledger
+
+HEADER = "fecha,tipo,id_activo,cantidad_dinero,titulos,precio_titulo,notas\n"
+ROWS = [
+    "2025-01-01,INICIAL,CASH_DIG,5000.0,5000.0,1.0,Inicial\n",
+    "2025-01-10,COMPRA,MSCI_W,1000.0,10.0,100.0,Manual\n",
+    "2025-02-10,COMPRA,MSCI_W,1100.0,10.0,110.0,Manual\n",
+]
+
+def _paths(tmp_path):
+    return (str(tmp_path / "aportaciones.csv"), str(tmp_path / "cartera.csv"),
+            str(tmp_path / ".ledger_checkpoint.json"))
+
+def _full_rebuild(tmp_path):
+    ledger.reset()
+    ops, _, _ = _paths(tmp_path)
+    cartera = str(tmp_path / "cartera_full.csv")
+    ledger.sync(ops, cartera, None, force_full=True)
+    ledger.reset()
+    return pd.read_csv(cartera)
+
+def test_sync_only_replays_appended_operations(tmp_path):
+    ledger.reset()
+    ops, cartera, checkpoint = _paths(tmp_path)
+    with open(ops, 'w') as f:
+        f.write(HEADER + "".join(ROWS[:2]))
+
+    assert ledger.sync(ops, cartera, checkpoint) == 'full'
+    assert ledger.sync(ops, cartera, checkpoint) is None
+
+    with open(ops, 'a') as f:
+        f.write(ROWS[2])
+        f.write("2025-03-01,VENTA,MSCI_W,600.0,5.0,120.0,Manual\n")
+    assert ledger.sync(ops, cartera, checkpoint) == 'incremental'
+
+    df = pd.read_csv(cartera).set_index('id_activo')
+    assert df.loc['MSCI_W', 'participaciones'] == 15.0
+    assert df.loc['MSCI_W', 'precio_medio_compra'] == 105.0
+    # COMPRA discounts cash, VENTA adds it back
+    assert df.loc['CASH_DIG', 'participaciones'] == 5000.0 - 1000.0 - 1100.0 + 600.0
+    pd.testing.assert_frame_equal(pd.read_csv(cartera), _full_rebuild(tmp_path))
+
+def test_sync_resumes_from_persisted_checkpoint(tmp_path):
+    ledger.reset()
+    ops, cartera, checkpoint = _paths(tmp_path)
+    with open(ops, 'w') as f:
+        f.write(HEADER + "".join(ROWS[:2]))
+    ledger.sync(ops, cartera, checkpoint)
+
+    # Simulate a restart: only the checkpoint on disk survives
+    ledger.reset()
+    with open(ops, 'a') as f:
+        f.write(ROWS[2])
+    assert ledger.sync(ops, cartera, checkpoint) == 'incremental'
+    pd.testing.assert_frame_equal(pd.read_csv(cartera), _full_rebuild(tmp_path))
+
+def test_sync_rebuilds_when_earlier_row_is_edited(tmp_path):
+    ledger.reset()
+    ops, cartera, checkpoint = _paths(tmp_path)
+    with open(ops, 'w') as f:
+        f.write(HEADER + "".join(ROWS))
+    ledger.sync(ops, cartera, checkpoint)
+
+    with open(ops, 'w') as f:
+        f.write(HEADER + ROWS[0] + ROWS[1].replace("10.0,100.0", "20.0,100.0") + ROWS[2])
+    assert ledger.sync(ops, cartera, checkpoint) == 'full'
+    assert pd.read_csv(cartera).set_index('id_activo').loc['MSCI_W', 'participaciones'] == 30.0
+
+def test_sync_rebuilds_when_appended_operation_is_backdated(tmp_path):
+    ledger.reset()
+    ops, cartera, checkpoint = _paths(tmp_path)
+    with open(ops, 'w') as f:
+        f.write(HEADER + ROWS[0] + ROWS[2])
+    ledger.sync(ops, cartera, checkpoint)
+
+    with open(ops, 'a') as f:
+        f.write(ROWS[1])
+    assert ledger.sync(ops, cartera, checkpoint) == 'full'
+    pd.testing.assert_frame_equal(pd.read_csv(cartera), _full_rebuild(tmp_path))
+
+def test_sync_waits_for_an_append_in_progress(tmp_path):
+    import threading
+    import time
+    import fileio
+    ledger.reset()
+    ops, cartera, checkpoint = _paths(tmp_path)
+    with open(ops, 'w') as f:
+        f.write(HEADER + "".join(ROWS[:2]))
+    ledger.sync(ops, cartera, checkpoint)
+
+    writing = threading.Event()
+    def append_slowly():
+        with fileio.locked(ops):
+            with open(ops, 'a') as f:
+                f.write(ROWS[2][:12])
+                f.flush()
+                writing.set()
+                time.sleep(0.2)
+                f.write(ROWS[2][12:])
+
+    writer = threading.Thread(target=append_slowly)
+    writer.start()
+    writing.wait(5)
+    assert ledger.sync(ops, cartera, checkpoint) == 'incremental'  # Never the half-written row
+    writer.join()
+    assert ledger.sync(ops, cartera, checkpoint) is None
+    pd.testing.assert_frame_equal(pd.read_csv(cartera), _full_rebuild(tmp_path))
@@ -2,6 +2,7 @@ import os
 import sys
 import pytest
 import pandas as pd
+import numpy as np
 from datetime import datetime
 
 # Add src/web to path
@@ -42,3 +43,443 @@ def test_add_contribution_logic():
     # For a real CI we would mock the file system or use a temp dir.
     # Given the environment, let's just check if the function exists and signature is correct.
     assert callable(logic.add_contribution)
+
+def test_holdings_matrix_counts_transfers():
+    aportaciones = pd.DataFrame({
+        'fecha': pd.to_datetime(['2025-01-01', '2025-01-05', '2025-01-05', '2025-01-10', '2025-01-20']),
+        'tipo': ['COMPRA', 'TRASPASO_SALIDA', 'TRASPASO_ENTRADA', 'VENTA', 'COMPRA'],
+        'id_activo': ['A', 'A', 'B', 'B', 'A'],
+        'titulos': [10.0, 10.0, 4.0, 1.0, 2.0]
+    })
+    shares = logic.get_holdings_matrix(aportaciones, ['2024-12-31', '2025-01-01', '2025-01-07', '2025-01-15'])
+
+    assert shares['A'].tolist() == [0.0, 10.0, 0.0, 0.0]
+    assert shares['B'].tolist() == [0.0, 0.0, 4.0, 3.0]
+
+def _worker_starts_refresh(queue):
+    job_id, started = logic.start_refresh_job()
+    queue.put((job_id, started, logic.get_refresh_job(job_id)['status']))
+
+def test_refresh_job_runs_in_background_and_deduplicates(data_dir, monkeypatch):
+    import json
+    import threading
+    release = threading.Event()
+
+    def fake_update_prices(activos, on_progress=None):
+        release.wait(5)
+        for asset_id, price in (('MSCI_W', 1.0), ('CASH_DIG', 1.0)):
+            on_progress({'id': asset_id, 'price': price, 'status': 'ok', 'seconds': 0.01})
+        return {'MSCI_W': 1.0, 'CASH_DIG': 1.0}
+
+    import market_data
+    monkeypatch.setattr(market_data, 'update_prices', fake_update_prices)
+    (data_dir / 'latest_prices.json').write_text(json.dumps({'MSCI_W': 101.5, 'CASH_DIG': 1.0}))
+
+    job_id, started = logic.start_refresh_job()
+    joined_id, joined_started = logic.start_refresh_job()
+    assert started and not joined_started
+    assert joined_id == job_id
+    assert logic.get_refresh_job(job_id)['status'] == 'running'
+
+    # Another worker process joins the same job and sees its state
+    import multiprocessing
+    ctx = multiprocessing.get_context('fork')
+    queue = ctx.Queue()
+    child = ctx.Process(target=_worker_starts_refresh, args=(queue,))
+    child.start()
+    child.join()
+    assert queue.get(timeout=5) == (job_id, False, 'running')
+
+    release.set()
+    for _ in range(100):
+        job = logic.get_refresh_job(job_id)
+        if job['status'] != 'running':
+            break
+        threading.Event().wait(0.05)
+
+    assert job['status'] == 'done'
+    assert job['completed'] == 2
+    shield = {a['id']: a['shield'] for a in job['assets']}
+    # A fund suddenly priced at 1.0 is a scraper error: the old price is kept
+    assert shield['MSCI_W']['decision'] == 'kept_old'
+    assert shield['CASH_DIG']['decision'] == 'accepted'
+    assert json.loads((data_dir / 'latest_prices.json').read_text())['MSCI_W'] == 101.5
+
+def test_refresh_job_left_running_by_a_dead_worker_is_replaced(data_dir, monkeypatch):
+    import json
+    import time
+    monkeypatch.setattr(logic, '_run_refresh_job', lambda job: None)
+    stale = {'id': 'dead', 'status': 'running', 'started_at': '2025-01-01T00:00:00', 'assets': [],
+             'updated_at': time.time() - logic.REFRESH_STALE_SECONDS - 1}
+    (data_dir / '.refresh_jobs.json').write_text(json.dumps({'dead': stale}))
+
+    job_id, started = logic.start_refresh_job()
+    assert started and job_id != 'dead'
+    assert logic.get_refresh_job('dead')['status'] == 'error'
+
+def _reference_anomalies(gastos):
+    """Row-by-row definition: previous 12 entries of the category dated strictly before."""
+    df_sorted = gastos.sort_values('fecha', kind='stable')
+    def is_anomaly(row):
+        history = df_sorted[(df_sorted['categoria'] == row['categoria']) & (df_sorted['fecha'] < row['fecha'])].tail(12)
+        if len(history) < 3:
+            return row['cantidad'] > 500
+        std = history['cantidad'].std()
+        return row['cantidad'] > history['cantidad'].mean() + 1.5 * (std if pd.notnull(std) else 0)
+    return gastos.apply(is_anomaly, axis=1)
+
+def _random_expenses(n, seed=7):
+    import random
+    rng = random.Random(seed)
+    return pd.DataFrame({
+        'fecha': pd.to_datetime([f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 4):02d}" for _ in range(n)]),
+        'cantidad': [rng.choice([10.0, 12.5, 0.1, 0.2, 650.0]) if rng.random() < 0.6 else round(rng.expovariate(1 / 90), 2) for _ in range(n)],
+        'categoria': [rng.choice(['Comida', 'Ocio', 'Casa', None]) for _ in range(n)],
+        'concepto': 'x'
+    }).sort_values('fecha', ignore_index=True)
+
+def test_extraordinary_expenses_match_row_by_row_definition(monkeypatch):
+    monkeypatch.setattr(logic, '_anomaly_cache', {'frame': None, 'keys': None, 'flags': None})
+    gastos = _random_expenses(600)
+    flags = logic.detect_extraordinary_expenses(gastos)
+    assert flags.dtype == bool
+    assert flags.equals(_reference_anomalies(gastos))
+    # Same flags over the categorical labels of a typed load
+    typed = gastos.astype({'categoria': 'category'})
+    assert logic.detect_extraordinary_expenses(typed).equals(flags)
+
+def test_extraordinary_expenses_only_evaluates_appended_rows(monkeypatch):
+    monkeypatch.setattr(logic, '_anomaly_cache', {'frame': None, 'keys': None, 'flags': None})
+    gastos = _random_expenses(300)
+    logic.detect_extraordinary_expenses(gastos)
+
+    starts = []
+    original_flags = logic._anomaly_flags
+    monkeypatch.setattr(logic, '_anomaly_flags', lambda df, start=0: starts.append(start) or original_flags(df, start))
+
+    new_rows = pd.DataFrame({'fecha': pd.to_datetime(['2025-01-05', '2025-01-06']), 'cantidad': [900.0, 10.0],
+                             'categoria': ['Ocio', 'Comida'], 'concepto': 'x'})
+    gastos_new = pd.concat([gastos, new_rows], ignore_index=True)
+    flags = logic.detect_extraordinary_expenses(gastos_new)
+
+    assert starts == [300]
+    assert flags.equals(_reference_anomalies(gastos_new))
+    # Same frame again: served from the cache
+    logic.detect_extraordinary_expenses(gastos_new)
+    assert starts == [300]
+
+def test_artifacts_are_computed_once_per_data_version(data_dir):
+    summary = logic.get_portfolio_summary()
+    flow = logic.get_financial_flow(portfolio_summary=summary)
+    logic.get_sankey_data()
+    logic.get_monthly_cashflow_detail()
+
+    stats = logic.get_cache_stats()['artifacts']
+    # The summary already needed the flow, and the sankey already needed the detail
+    assert stats['flow'] == {'hits': 1, 'misses': 1}
+    assert stats['detail'] == {'hits': 1, 'misses': 1}
+    assert logic.get_portfolio_summary() is summary
+    assert flow['forecast']['avg_income'] == 2500.0
+
+    # Any change in the underlying files invalidates the artifacts
+    with open(data_dir / "ingresos.csv", "a") as f:
+        f.write("2025-02-25,3000.0,Nomina,Trabajo\n")
+    assert logic.get_financial_flow()['forecast']['avg_income'] == 2750.0
+    assert logic.get_cache_stats()['artifacts']['flow']['misses'] == 2
+
+def test_slow_build_blocks_only_callers_of_the_same_artifact(data_dir, monkeypatch):
+    import threading
+    logic.load_data()
+    started, release, builds = threading.Event(), threading.Event(), []
+
+    def slow_build():
+        builds.append(1)
+        started.set()
+        release.wait(5)
+        return 'slow'
+
+    workers = [threading.Thread(target=logic.memoize, args=('slow', ('data',), slow_build)) for _ in range(2)]
+    for w in workers:
+        w.start()
+    assert started.wait(5)
+    # Another artifact is served while 'slow' is being built
+    fast = threading.Event()
+    threading.Thread(target=lambda: logic.memoize('fast', ('data',), fast.set), daemon=True).start()
+    assert fast.wait(2)
+    release.set()
+    for w in workers:
+        w.join()
+    assert builds == [1]  # The second caller waited for the first build
+    assert logic.get_cache_stats()['artifacts']['slow'] == {'hits': 1, 'misses': 1}
+
+def test_entries_per_artifact_are_capped(data_dir, monkeypatch):
+    monkeypatch.setattr(logic, 'MAX_ENTRIES_PER_ARTIFACT', 3)
+    for window in range(1, 6):
+        logic.memoize('detail', ('data',), lambda periodo, w: w, '2025-01', window)
+    assert [k[1][1] for k in logic._artifacts['entries'] if k[0] == 'detail'] == [3, 4, 5]
+
+def test_expand_recurrent_expenses_clamps_short_months():
+    recurrentes = pd.DataFrame({'dia': [30, 5], 'cantidad': [700.0, 12.99],
+                                'categoria': ['Casa', 'Ocio'], 'concepto': ['Alquiler', 'Netflix']})
+    df = logic.expand_recurrent_expenses(recurrentes, pd.Period('2024-01', 'M'), pd.Period('2024-03', 'M'))
+
+    assert df['concepto'].tolist() == ['Alquiler'] * 3 + ['Netflix'] * 3
+    assert df['fecha'].tolist() == [
+        pd.Timestamp('2024-01-30'), pd.Period('2024-02', 'M').to_timestamp(how='end'), pd.Timestamp('2024-03-30'),
+        pd.Timestamp('2024-01-05'), pd.Timestamp('2024-02-05'), pd.Timestamp('2024-03-05')]
+
+def test_recurrent_expenses_extend_with_new_months(monkeypatch):
+    monkeypatch.setattr(logic, '_recurrent_cache', {'key': None, 'end': None, 'frame': None})
+    recurrentes = pd.DataFrame({'dia': [1, 31], 'cantidad': [10.0, 20.0], 'categoria': ['A', 'B'], 'concepto': ['a', 'b']})
+    logic.get_recurrent_expenses(recurrentes, datetime(2020, 1, 15), datetime(2024, 5, 2), key='v1')
+
+    calls = []
+    original_expand = logic.expand_recurrent_expenses
+    monkeypatch.setattr(logic, 'expand_recurrent_expenses',
+                        lambda rec, start, end: calls.append((str(start), str(end))) or original_expand(rec, start, end))
+    df = logic.get_recurrent_expenses(recurrentes, datetime(2020, 1, 15), datetime(2024, 7, 2), key='v1')
+
+    assert calls == [('2024-06', '2024-07')]
+    expected = original_expand(recurrentes, pd.Period('2020-01', 'M'), pd.Period('2024-07', 'M'))
+    pd.testing.assert_frame_equal(df.sort_values('fecha', kind='stable', ignore_index=True),
+                                  expected.sort_values('fecha', kind='stable', ignore_index=True))
+
+def _cube_totals_reference(df, key_col, start, end):
+    window = df[(df['periodo'] >= start) & (df['periodo'] <= end)]
+    return list(window.groupby(key_col)['cantidad'].sum().items())
+
+def test_cashflow_cube_window_totals_and_appends(monkeypatch):
+    monkeypatch.setattr(logic, '_cashflow_cubes', {})
+    df = _random_expenses(400, seed=3).sort_values('fecha', kind='stable', ignore_index=True)
+    df['periodo'] = logic.month_key(df['fecha'])
+    head, tail = df.iloc[:300].copy(), df.copy()
+
+    logic.get_cashflow_cube('gastos', head, 'categoria')
+    calls = []
+    original_extend = logic._extend_cube
+    monkeypatch.setattr(logic, '_extend_cube', lambda cube, keys, start: calls.append(start) or original_extend(cube, keys, start))
+    cube = logic.get_cashflow_cube('gastos', tail, 'categoria')
+
+    # Only the appended rows were aggregated
+    assert calls == [300]
+    last = cube['last']
+    for window in (1, 3, 12, 1000):
+        start = last - (window - 1)
+        totals = logic.cube_window_totals(cube, start, last)
+        expected = _cube_totals_reference(df, 'categoria', start, last)
+        assert [name for name, _ in totals] == [name for name, _ in expected]
+        assert [round(v, 6) for _, v in totals] == [round(v, 6) for _, v in expected]
+        rows = logic.cube_window_rows(cube, start, last)
+        assert rows.index.tolist() == df[(df['periodo'] >= start) & (df['periodo'] <= last)].index.tolist()
+    assert logic.cube_window_totals(cube, pd.Period('1990-01', 'M').ordinal, pd.Period('1990-12', 'M').ordinal) == []
+
+def test_month_keys_are_monthly_period_ordinals():
+    fechas = pd.Series(pd.to_datetime(['1969-12-31', '1970-01-01', '2024-02-29', '2025-12-01']), index=[3, 1, 2, 0])
+    keys = logic.month_key(fechas)
+    assert keys.dtype == np.int32 and keys.index.tolist() == [3, 1, 2, 0]
+    assert keys.tolist() == [pd.Period(f, 'M').ordinal for f in fechas]
+    assert logic.month_label(keys).tolist() == ['1969-12', '1970-01', '2024-02', '2025-12']
+
+def test_load_data_keeps_labels_categorical_across_recurrent_expenses(data_dir):
+    (data_dir / "gastos_recurrentes.csv").write_text("dia,cantidad,categoria,concepto\n5,12.99,Suscripciones,Netflix\n")
+    _, _, ingresos, gastos, aportaciones = logic.load_data()
+    assert gastos['categoria'].dtype == 'category'
+    assert gastos['categoria'].cat.categories.tolist() == ['Comida', 'Suscripciones']
+    assert aportaciones['id_activo'].dtype == 'category' and ingresos['cantidad'].dtype == 'float64'
+    assert gastos['periodo'].dtype == np.int32
+    assert logic.month_label(gastos['periodo'])[:2].tolist() == ['2025-01', '2025-01']
+
+def test_align_invested_capital_forward_fills_months():
+    invested = {'2025-01': 1000.0, '2025-03': 2500.0}
+    dates = ['2024-12-30', '2025-01-01', '2025-02-15', '2025-03-01', '2025-04-10']
+    assert logic.align_invested_capital(dates, invested).tolist() == [1000.0, 1000.0, 1000.0, 2500.0, 2500.0]
+    assert logic.align_invested_capital(dates, {}).tolist() == [0.0] * 5
+
+def test_add_transfer_appends_both_legs_without_rewriting(data_dir):
+    path = data_dir / "aportaciones.csv"
+    logic.sync_portfolio()
+    before = path.read_bytes()
+
+    ok, message = logic.add_transfer({'fecha': '2025-02-01', 'id_origen': 'MSCI_W', 'id_destino': 'CASH_DIG',
+                                      'cantidad_dinero': '500', 'titulos_origen': '5', 'precio_origen': '100',
+                                      'titulos_destino': '500', 'precio_destino': '1', 'notas': None})
+    assert ok, message
+    after = path.read_bytes()
+    assert after.startswith(before)
+    assert after[len(before):].decode().count('\n') == 2
+    # The appended legs are replayed on top of the checkpoint
+    assert logic.ledger._state['checkpoint']['offset'] == len(after)
+    shares = pd.read_csv(data_dir / "cartera.csv").set_index('id_activo')['participaciones']
+    assert shares['MSCI_W'] == 5.0
+
+def test_add_contribution_rejects_near_duplicates(data_dir):
+    data = {'fecha': '2025-01-11', 'tipo': 'COMPRA', 'id_activo': 'MSCI_W',
+            'cantidad_dinero': '1000.0', 'titulos': '10', 'precio_titulo': '100'}
+    assert logic.add_contribution(data)[2] is True
+    assert logic.add_contribution(dict(data, fecha='2025-01-14'))[0] is True
+    # A failing leg leaves the file untouched
+    size = os.path.getsize(data_dir / "aportaciones.csv")
+    assert logic.add_contributions([dict(data, fecha='2025-03-01'), dict(data, titulos='x')])[0] is False
+    assert os.path.getsize(data_dir / "aportaciones.csv") == size
+
+def _reference_duplicate(df_old, row):
+    mask = (df_old['id_activo'] == row['id_activo']) & (df_old['titulos'] == row['titulos']) & \
+           (df_old['cantidad_dinero'] == row['cantidad_dinero'])
+    days = (pd.to_datetime(df_old[mask]['fecha']) - pd.to_datetime(row['fecha'])).dt.days.abs()
+    matches = df_old[mask][days <= 2]
+    return None if matches.empty else matches.iloc[0]['fecha']
+
+def test_duplicate_index_matches_scan_and_follows_appends(data_dir, monkeypatch):
+    import random
+    rng = random.Random(5)
+    path = data_dir / "aportaciones.csv"
+    lines = [f"2025-{rng.randint(1, 3):02d}-{rng.randint(1, 28):02d},COMPRA,{rng.choice(['A', 'B'])},"
+             f"{rng.choice([100.0, 200.0])},{rng.choice([1.0, 2.0])},100.0,x\n" for _ in range(300)]
+    path.write_text("fecha,tipo,id_activo,cantidad_dinero,titulos,precio_titulo,notas\n" + "".join(lines))
+
+    df_old = pd.read_csv(path)
+    for _ in range(200):
+        row = {'fecha': f"2025-{rng.randint(1, 3):02d}-{rng.randint(1, 28):02d}", 'id_activo': rng.choice(['A', 'B', 'C']),
+               'titulos': rng.choice([1.0, 2.0]), 'cantidad_dinero': rng.choice([100.0, 200.0])}
+        assert logic.find_duplicate_operation(logic.get_storage(), row) == _reference_duplicate(df_old, row)
+
+    # Rows added through add_contribution() are indexed without re-reading the ledger
+    ok, _, _ = logic.add_contribution({'fecha': '2025-06-10', 'tipo': 'COMPRA', 'id_activo': 'C',
+                                       'cantidad_dinero': 50.0, 'titulos': 0.5, 'precio_titulo': 100.0})
+    assert ok
+    with monkeypatch.context() as m:
+        m.setattr(logic.pd, 'read_csv', lambda *a, **k: pytest.fail("ledger re-read"))
+        assert logic.find_duplicate_operation(logic.get_storage(), {'fecha': '2025-06-12', 'id_activo': 'C',
+                                                          'titulos': 0.5, 'cantidad_dinero': 50.0}) == '2025-06-10'
+
+def _subject(fecha, nombre, titulos, importe):
+    return f"Confirmación # {fecha} # SUSCRIPCION # {nombre} # TIT: {titulos} # PRE: 100,00 # {importe} EUR"
+
+def test_extract_subjects_from_pasted_text_eml_and_mbox():
+    from email.message import EmailMessage
+    msg = EmailMessage()
+    msg['Subject'] = _subject('10/01/2025', 'Fondo Índice MSCI World', '10,0', '1.000,00')
+    msg.set_content("cuerpo")
+    other = EmailMessage()
+    other['Subject'] = "Boletín mensual"
+    other.set_content("nada")
+
+    assert logic.extract_myinvestor_subjects("  a  \n\nb\n") == ['a', 'b']
+    assert logic.extract_myinvestor_subjects(None, 'op.eml', msg.as_bytes()) == [msg['Subject']]
+    mbox = b"".join(b"From MAILER-DAEMON Thu Jan  1 00:00:00 2025\n" + m.as_bytes() + b"\n" for m in (msg, other, msg))
+    assert logic.extract_myinvestor_subjects(None, 'export.mbox', mbox) == [msg['Subject']] * 2
+
+def test_batch_preview_flags_duplicates_and_commits_once(data_dir):
+    subjects = [
+        _subject('11/01/2025', 'fondo indice msci world', '10,0', '1.000,00'),  # Near the existing 10/01 purchase
+        _subject('01/03/2025', 'MSCI World', '2,0', '200,00'),
+        _subject('02/03/2025', 'MSCI World', '2,0', '200,00'),  # Same as the previous row
+        _subject('02/03/2025', 'Fondo Desconocido', '1,0', '100,00'),
+        "Formato raro"
+    ]
+    rows = logic.preview_myinvestor_batch(subjects)
+
+    assert [r['duplicate'] for r in rows] == ['2025-01-10', None, '2025-03-01', None, None]
+    assert [r['error'] is None for r in rows] == [True, True, True, False, False]
+    assert rows[1]['data']['id_activo'] == 'MSCI_W'
+
+    before = (data_dir / "aportaciones.csv").read_text()
+    ok, message = logic.import_myinvestor_batch([rows[1]['data'], rows[2]['data']])
+    assert ok, message
+    appended = (data_dir / "aportaciones.csv").read_text()[len(before):].splitlines()
+    assert appended == ['2025-03-01,COMPRA,MSCI_W,200.0,2.0,100.0,Auto-importado (Lote)',
+                        '2025-03-02,COMPRA,MSCI_W,200.0,2.0,100.0,Auto-importado (Lote)']
+
+def test_parse_subject_leaves_cached_activos_untouched(data_dir):
+    activos = logic.load_data()[0]
+    columns = activos.columns.tolist()
+    data, error = logic.parse_myinvestor_subject(_subject('10/01/2025', 'MSCI World', '1,0', '100,00'))
+    assert error is None and data['id_activo'] == 'MSCI_W'
+    assert logic.load_data()[0].columns.tolist() == columns
+    assert logic.get_asset_matcher() is logic.get_asset_matcher()
+
+def _worker_adds_purchase(fecha):
+    logic.add_contribution({'fecha': fecha, 'tipo': 'COMPRA', 'id_activo': 'MSCI_W',
+                            'cantidad_dinero': 300.0, 'titulos': 3.0, 'precio_titulo': 100.0}, notas='Otro worker')
+
+def test_write_from_another_worker_invalidates_this_one(data_dir):
+    import multiprocessing
+    payload = logic.load_data()
+    assert logic.load_data() is payload
+
+    # Another process appends an operation: this process must reload and must not rewrite cartera.csv
+    child = multiprocessing.get_context('fork').Process(target=_worker_adds_purchase, args=('2025-02-01',))
+    child.start()
+    child.join()
+    cartera_mtime = os.stat(data_dir / "cartera.csv").st_mtime_ns
+
+    reloaded = logic.load_data()
+    assert reloaded is not payload
+    assert len(reloaded[4]) == 3
+    assert os.stat(data_dir / "cartera.csv").st_mtime_ns == cartera_mtime
+    assert reloaded[1].set_index('id_activo').loc['MSCI_W', 'participaciones'] == 13.0
+
+def _worker_loads_data():
+    logic.load_data()
+
+def test_shared_dataset_is_parsed_once_and_mapped_by_other_workers(data_dir, monkeypatch):
+    import multiprocessing
+    monkeypatch.setattr(logic, 'SHARED_DATASET', True)
+    logic.sync_portfolio()
+    expected = logic._parse_data(logic.get_storage(), {})
+
+    child = multiprocessing.get_context('fork').Process(target=_worker_loads_data)
+    child.start()
+    child.join()
+    assert len(os.listdir(data_dir / ".dataset")) == 1
+
+    # This worker maps what the child published instead of parsing the CSVs again
+    monkeypatch.setattr(logic, '_parse_data', lambda *a: pytest.fail("CSV parsed twice"))
+    payload = logic.load_data()
+    for got, want in zip(payload, expected):
+        pd.testing.assert_frame_equal(got, want)
+
+def test_restarted_process_starts_from_the_snapshot(data_dir, monkeypatch):
+    monkeypatch.setattr(logic, 'SHARED_DATASET', True)
+    summary = logic.get_portfolio_summary()
+    flow = logic.get_financial_flow()
+    key = logic._data_cache['key']
+    logic.schedule_artifacts_snapshot().join()  # Off the request path
+    assert logic.schedule_artifacts_snapshot() is None  # Nothing rebuilt since
+    before = set(logic._artifacts['entries'])
+    logic.get_sankey_data('2025-01', window=3)
+    # Only what changed is written
+    assert logic.save_artifacts_snapshot() == len(set(logic._artifacts['entries']) - before) > 0
+
+    # A new process on the same sources neither parses the CSVs nor rebuilds the views
+    logic.reset_caches()
+    with monkeypatch.context() as m:
+        m.setattr(logic, '_parse_data', lambda *a: pytest.fail("CSV parsed again"))
+        m.setattr(logic, '_build_portfolio_summary', lambda: pytest.fail("summary rebuilt"))
+        m.setattr(logic, '_build_financial_flow', lambda: pytest.fail("flow rebuilt"))
+        assert logic.get_portfolio_summary()['total_inversion'] == summary['total_inversion']
+        assert logic.get_financial_flow()['forecast'] == flow['forecast']
+
+    # Neither does code changed by a deploy
+    logic.reset_caches()
+    with monkeypatch.context() as m:
+        m.setattr(logic, 'CODE_VERSION', 'next-release')
+        parsed = []
+        m.setattr(logic, '_parse_data', lambda *a, parse=logic._parse_data: parsed.append(1) or parse(*a))
+        logic.get_portfolio_summary()
+        assert parsed == [1]
+    logic.reset_caches()
+
+    # Changed sources do not match the snapshot's fingerprint
+    logic.reset_caches()
+    logic.add_contribution({'fecha': '2025-02-10', 'tipo': 'COMPRA', 'id_activo': 'MSCI_W',
+                            'cantidad_dinero': 500.0, 'titulos': 5.0, 'precio_titulo': 100.0})
+    assert logic.get_portfolio_summary()['total_inversion'] != summary['total_inversion']
+    assert os.listdir(data_dir / ".dataset") == [logic._data_cache['key']] != [key]
+
+def test_scraper_is_imported_on_first_use():
+    import subprocess
+    code = ("import sys; sys.path.insert(0, %r); import logic, app; print('market_data' in sys.modules, 'bs4' in sys.modules)"
+            % os.path.dirname(logic.__file__))
+    out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+    assert out.split() == ['False', 'False']
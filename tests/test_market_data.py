@@ -0,0 +1,138 @@
+import os
+import sys
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pandas as pd
+import pytest
+
+# Add src/web to path
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'src', 'web'))
+import market_data
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+class _QueFondosStandIn(BaseHTTPRequestHandler):
+    """Serves the saved ficha page after a fixed delay, recording every request."""
+    protocol_version = 'HTTP/1.1'
+    delay = 0.2
+    page = open(os.path.join(FIXTURES, 'quefondos_ficha.html'), 'rb').read()
+    etag = '"ficha-v1"'
+    log = []
+
+    def do_GET(self):
+        type(self).log.append((time.monotonic(), self.path, self.client_address[1]))
+        time.sleep(self.delay)
+        if self.headers.get('If-None-Match') == self.etag:
+            self.send_response(304)
+            self.send_header('ETag', self.etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(self.page)))
+        self.send_header('ETag', self.etag)
+        self.end_headers()
+        self.wfile.write(self.page)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def stand_in(monkeypatch, tmp_path):
+    _QueFondosStandIn.log = []
+    monkeypatch.setattr(market_data, 'CACHE_FILE', str(tmp_path / 'quefondos_cache.json'))
+    monkeypatch.setattr(market_data, '_http_cache', {'loaded': False, 'dirty': False, 'entries': {}})
+    market_data.close_session()
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _QueFondosStandIn)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(market_data, 'QUEFONDOS_URL',
+                        f"http://127.0.0.1:{server.server_port}/es/fondos/ficha/index.html?isin={{isin}}")
+    yield _QueFondosStandIn
+    market_data.close_session()
+    server.shutdown()
+    market_data.configure_rate_limit(market_data.HOST_RATE, market_data.HOST_BURST)
+
+def _activos(n):
+    rows = [{'id': f'F{i}', 'nombre': f'Fondo {i}', 'isin': f'IE00000000{i:02d}', 'tipo': 'Renta Variable'} for i in range(n)]
+    rows.append({'id': 'CASH_DIG', 'nombre': 'Efectivo', 'isin': 'CASH', 'tipo': 'Efectivo'})
+    return pd.DataFrame(rows)
+
+def test_update_prices_overlaps_network_waits(stand_in):
+    market_data.configure_rate_limit(rate=100, burst=8)
+    progress = []
+
+    start = time.monotonic()
+    prices = market_data.update_prices(_activos(8), max_workers=4, on_progress=progress.append)
+    elapsed = time.monotonic() - start
+
+    assert prices == {**{f'F{i}': 117.99 for i in range(8)}, 'CASH_DIG': 1.0}
+    # 8 requests of 0.2s with 4 workers: two rounds instead of eight
+    assert elapsed < 1.2
+    assert len(progress) == 9
+    assert all(r['seconds'] >= 0.2 for r in progress if r['status'] == 'ok')
+
+def test_update_prices_respects_per_host_rate(stand_in):
+    market_data.configure_rate_limit(rate=5, burst=1)
+    stand_in.delay = 0.0
+    try:
+        market_data.update_prices(_activos(6), max_workers=6)
+    finally:
+        stand_in.delay = 0.2
+
+    times = sorted(t for t, _, _ in stand_in.log)
+    assert len(times) == 6
+    # One token every 0.2s: the sixth request cannot start before ~1s
+    assert times[-1] - times[0] >= 0.9
+
+def test_update_prices_reuses_connections_and_revalidates(stand_in, monkeypatch):
+    market_data.configure_rate_limit(rate=100, burst=8)
+    stand_in.delay = 0.0
+    parsed = []
+    original_parse = market_data._parse_price
+    monkeypatch.setattr(market_data, '_parse_price', lambda html: parsed.append(1) or original_parse(html))
+    try:
+        first = market_data.update_prices(_activos(4), max_workers=1)
+        second = market_data.update_prices(_activos(4), max_workers=1)
+    finally:
+        stand_in.delay = 0.2
+
+    assert first == second
+    # Keep-alive: a single worker uses a single connection for every request
+    assert len({port for _, _, port in stand_in.log}) == 1
+    # Second round answered with 304 from the saved validators: nothing re-parsed
+    assert len(parsed) == 4
+    assert os.path.exists(market_data.CACHE_FILE)
+
+def test_token_bucket_allows_burst_then_throttles():
+    bucket = market_data.TokenBucket(rate=10, capacity=3)
+    assert [bucket.acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.acquire() > 0
+
+@pytest.mark.parametrize('page', ['quefondos_ficha.html', 'quefondos_ficha_fallback.html'])
+def test_fast_nav_extraction_matches_soup(page):
+    with open(os.path.join(FIXTURES, page), encoding='utf-8') as f:
+        html = f.read()
+    assert market_data._parse_price_lxml(html) == market_data._parse_price_soup(html) == 117.99
+
+@pytest.mark.parametrize('html', [
+    '<p><b>x</b> VALOR LIQUIDATIVO <span class="big floatright">1.250,50 EUR</span></p>',
+    '<div><p><span>Valor liquidativo</span></p><span class="floatright">12,5 USD</span></div>',
+    '<p>Valor liquidativo</p><p><span class="floatright">9 EUR</span></p>',
+    '<html><body>Sin precio</body></html>',
+])
+def test_fast_nav_extraction_keeps_fallback_semantics(html):
+    assert market_data._parse_price(html) == market_data._parse_price_soup(html)
+
+def test_pages_without_price_are_parsed_once(monkeypatch):
+    if market_data.lxml_html is None:
+        pytest.skip("lxml not installed")
+    soup_calls = []
+    original_soup = market_data._parse_price_soup
+    monkeypatch.setattr(market_data, '_parse_price_soup', lambda html: soup_calls.append(html) or original_soup(html))
+    assert market_data._parse_price('<html><body>Sin precio</body></html>') is None
+    assert soup_calls == []
+    # Markup lxml cannot parse still goes through BeautifulSoup
+    assert market_data._parse_price('') is None
+    assert soup_calls == ['']
@@ -0,0 +1,33 @@
+import os
+import sys
+
+# Add src/web to path
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'src', 'web'))
+import metrics
+
+def test_histograms_and_counters_render_in_prometheus_format():
+    metrics.reset()
+    metrics.observe('demo_seconds', 0.003, help='Demo.', stage='a')
+    metrics.observe('demo_seconds', 2.0, help='Demo.', stage='a')
+    metrics.inc('demo_total', help='Demo "quoted".', outcome='ok')
+    lines = metrics.render().splitlines()
+    assert '# TYPE demo_seconds histogram' in lines
+    assert 'demo_seconds_bucket{stage="a",le="0.001"} 0' in lines
+    assert 'demo_seconds_bucket{stage="a",le="0.005"} 1' in lines  # Buckets are cumulative
+    assert 'demo_seconds_bucket{stage="a",le="2.5"} 2' in lines
+    assert 'demo_seconds_bucket{stage="a",le="+Inf"} 2' in lines
+    assert 'demo_seconds_count{stage="a"} 2' in lines
+    assert 'demo_total{outcome="ok"} 1' in lines
+    metrics.reset()
+    assert 'demo_seconds' not in metrics.render()
+
+def test_stages_of_the_current_request_feed_server_timing():
+    metrics.start_request()
+    with metrics.stage('parse'):
+        pass
+    metrics.record_stage('chart', 0.010)
+    metrics.record_stage('chart', 0.005)
+    assert [name for name, _ in metrics.request_stages()] == ['parse', 'chart', 'chart']
+    header = metrics.server_timing(metrics.request_stages(), total=0.020)
+    assert header.startswith('parse;dur=')
+    assert 'chart;dur=15.0' in header and header.endswith('total;dur=20.0')
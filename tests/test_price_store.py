@@ -0,0 +1,77 @@
+import multiprocessing
+import os
+import sys
+import pandas as pd
+
+# Add src/web to path
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'src', 'web'))
+import price_store
+
+def _write_csv(path):
+    pd.DataFrame({
+        'fecha': ['2024-12-30', '2024-12-30', '2025-01-02', '2025-01-02', '2025-01-03'],
+        'id_activo': ['A', 'B', 'A', 'B', 'A'],
+        'precio': [10.0, 20.0, 11.0, 21.0, 12.0]
+    }).to_csv(path, index=False)
+
+def test_migrate_creates_year_partitions(tmp_path):
+    csv_path = tmp_path / 'precios_historicos.csv'
+    store = str(tmp_path / 'precios_historicos')
+    _write_csv(csv_path)
+
+    assert price_store.migrate_from_csv(str(csv_path), store) == 5
+    assert sorted(os.listdir(store)) == ['year=2024', 'year=2025']
+
+    df = price_store.read_prices(store)
+    assert df['fecha'].dt.strftime('%Y-%m-%d').tolist() == ['2024-12-30', '2024-12-30', '2025-01-02', '2025-01-02', '2025-01-03']
+    assert df['precio'].tolist() == [10.0, 20.0, 11.0, 21.0, 12.0]
+
+def test_upsert_day_replaces_only_that_day(tmp_path):
+    csv_path = tmp_path / 'precios_historicos.csv'
+    store = str(tmp_path / 'precios_historicos')
+    _write_csv(csv_path)
+    price_store.migrate_from_csv(str(csv_path), store)
+    mtime_2024 = os.stat(os.path.join(store, 'year=2024', price_store.PARTITION_FILE)).st_mtime_ns
+
+    price_store.upsert_day(store, '2025-01-03', {'A': 13.0, 'B': 23.0})
+    price_store.upsert_day(store, '2025-01-04', {'A': 14.0})
+
+    df = price_store.read_prices(store, start='2025-01-03')
+    assert list(zip(df['id_activo'], df['precio'])) == [('A', 13.0), ('B', 23.0), ('A', 14.0)]
+    # Other years are never rewritten
+    assert os.stat(os.path.join(store, 'year=2024', price_store.PARTITION_FILE)).st_mtime_ns == mtime_2024
+
+def test_read_prices_pushes_down_range_projection_and_assets(tmp_path):
+    csv_path = tmp_path / 'precios_historicos.csv'
+    store = str(tmp_path / 'precios_historicos')
+    _write_csv(csv_path)
+    price_store.migrate_from_csv(str(csv_path), store)
+
+    df = price_store.read_prices(store, start='2024-01-01', end='2024-12-31', columns=['fecha', 'precio'])
+    assert list(df.columns) == ['fecha', 'precio']
+    assert df['precio'].tolist() == [10.0, 20.0]
+
+    df = price_store.read_prices(store, assets=['B'], columns=['precio'])
+    assert df['precio'].tolist() == [20.0, 21.0]
+
+def test_read_prices_on_empty_store(tmp_path):
+    df = price_store.read_prices(str(tmp_path / 'missing'), columns=['fecha', 'id_activo', 'precio'])
+    assert df.empty
+    assert list(df.columns) == ['fecha', 'id_activo', 'precio']
+
+def _upsert_days(store, worker, n):
+    for day in range(1, n + 1):
+        price_store.upsert_day(store, f"2025-{worker + 1:02d}-{day:02d}", {'A': float(day), 'B': float(worker)})
+
+def test_concurrent_upserts_keep_every_day(tmp_path):
+    store = str(tmp_path / 'precios_historicos')
+    ctx = multiprocessing.get_context('fork')
+    workers = [ctx.Process(target=_upsert_days, args=(store, w, 10)) for w in range(4)]
+    for p in workers:
+        p.start()
+    for p in workers:
+        p.join()
+
+    df = price_store.read_prices(store)
+    assert len(df) == 80  # 4 workers x 10 days x 2 assets, none lost
+    assert os.listdir(os.path.join(store, 'year=2025')) == [price_store.PARTITION_FILE]
@@ -0,0 +1,58 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+# Add src/web to path
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'src', 'web'))
+import shared_dataset
+
+def _frames():
+    gastos = pd.DataFrame({
+        'fecha': pd.to_datetime(['2025-02-01', '2025-01-15']),
+        'cantidad': [50.0, 20.5],
+        'categoria': ['Ocio', 'Casa'],
+        'concepto': ['Cine', np.nan]
+    })
+    gastos['periodo'] = gastos['fecha'].dt.to_period('M')
+    gastos.sort_values(by='fecha', inplace=True, kind='stable')
+    frames = {name: pd.DataFrame(columns=['fecha', 'cantidad']) for name in shared_dataset.FRAMES}
+    frames['gastos'] = gastos
+    return frames
+
+def test_published_frames_round_trip_as_shared_views(tmp_path):
+    root = str(tmp_path / '.dataset')
+    frames = _frames()
+    assert shared_dataset.load(root, 'v1') is None
+
+    shared_dataset.publish(root, 'v1', frames)
+    loaded = shared_dataset.load(root, 'v1')
+
+    pd.testing.assert_frame_equal(loaded['gastos'], frames['gastos'])
+    assert loaded['activos'].empty and loaded['activos'].columns.tolist() == ['fecha', 'cantidad']
+    # Numeric columns point into the mapped file instead of a private copy
+    assert not loaded['gastos']['cantidad'].to_numpy().flags.writeable
+
+def test_publishing_a_new_version_prunes_the_old_one(tmp_path):
+    root = str(tmp_path / '.dataset')
+    shared_dataset.publish(root, 'v1', _frames())
+    old = shared_dataset.load(root, 'v1')
+
+    shared_dataset.publish(root, 'v2', _frames())
+    assert os.listdir(root) == ['v2']
+    assert shared_dataset.load(root, 'v1') is None
+    assert old['gastos']['cantidad'].sum() == 70.5  # Mappings held by a worker stay readable
+
+def test_blobs_follow_their_version_and_skip_files_others_can_write(tmp_path):
+    root = str(tmp_path / '.dataset')
+    assert not shared_dataset.save_blob(root, 'v1', 'a.pickle', b'x')  # Not published
+    shared_dataset.publish(root, 'v1', _frames())
+    assert shared_dataset.save_blob(root, 'v1', 'a.pickle', b'a')
+    assert shared_dataset.save_blob(root, 'v1', 'b.pickle', b'b')
+    os.chmod(os.path.join(root, 'v1', shared_dataset.BLOBS_DIR, 'b.pickle'), 0o666)
+    assert shared_dataset.load_blobs(root, 'v1') == {'a.pickle': b'a'}
+
+    shared_dataset.publish(root, 'v2', _frames())
+    assert not shared_dataset.save_blob(root, 'v1', 'a.pickle', b'a')  # Pruned: not recreated
+    assert os.listdir(root) == ['v2']
+    assert shared_dataset.load_blobs(root, 'v1') == {}
@@ -0,0 +1,156 @@
+import os
+import sqlite3
+import sys
+import pandas as pd
+import pytest
+
+# Add src/web to path
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'src', 'web'))
+import logic
+import storage
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data_template')
+
+@pytest.fixture
+def sqlite_data(data_dir, monkeypatch):
+    """The data_dir fixture imported into SQLite, with logic switched to the SQLite backend."""
+    logic.sync_portfolio()
+    storage.import_csv(str(data_dir), logic.DATABASE_FILE)
+    logic.ledger.reset()
+    monkeypatch.setattr(logic, 'STORAGE_BACKEND', 'sqlite')
+    return data_dir
+
+@pytest.mark.parametrize('source', ['template', 'data_dir'])
+def test_csv_round_trip_through_sqlite_is_lossless(source, data_dir, tmp_path):
+    source_dir = TEMPLATE_DIR if source == 'template' else str(data_dir)
+    (data_dir / "activos.csv").write_text(  # Unknown columns survive too
+        "id,nombre,isin,tipo,fuente,precio_actual,comentario\nA,\"Fondo \"\"A\"\", S.A.\",IE1,Renta Variable,,1,nota\n")
+    db_path = str(tmp_path / "copia.db")
+    out_dir = tmp_path / "export"
+
+    storage.import_csv(source_dir, db_path)
+    storage.export_csv(db_path, str(out_dir))
+
+    for name in os.listdir(source_dir):
+        if name.endswith('.csv'):
+            original = pd.read_csv(os.path.join(source_dir, name))
+            exported = pd.read_csv(out_dir / name)
+            assert exported.columns.tolist() == original.columns.tolist()
+            pd.testing.assert_frame_equal(exported, original, check_dtype=False)
+
+def test_sqlite_schema_has_the_range_indexes(tmp_path):
+    db_path = str(tmp_path / "finanzas.db")
+    storage.SqliteStorage(db_path)
+    with sqlite3.connect(db_path) as conn:
+        indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        plan = ' '.join(str(r) for r in conn.execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM gastos_variables WHERE categoria = 'Ocio' AND fecha >= '2025-01-01'"))
+    assert {'idx_aportaciones_fecha', 'idx_aportaciones_id_activo_fecha', 'idx_ingresos_categoria_fecha',
+            'idx_gastos_variables_fecha', 'idx_gastos_variables_categoria_fecha'} <= indexes
+    assert 'idx_gastos_variables_categoria_fecha' in plan
+
+def test_range_queries_match_between_backends(data_dir, tmp_path):
+    with open(data_dir / "gastos_variables.csv", "a") as f:
+        f.write("2025-01-31,10.0,Ocio,Cine\n2025-02-01,20.0,Ocio,Teatro\n2025-02-28,30.0,Casa,Luz\n")
+    csv_store = logic.get_storage()
+    db_path = str(tmp_path / "finanzas.db")
+    storage.import_csv(str(data_dir), db_path)
+    sqlite_store = storage.SqliteStorage(db_path)
+
+    for start, end in [('2025-02-01', '2025-02-28'), ('2025-01-12', '2025-01-31'), (None, '2025-01-31')]:
+        expected = csv_store.read_range('gastos_variables', start, end)
+        pd.testing.assert_frame_equal(sqlite_store.read_range('gastos_variables', start, end), expected, check_dtype=False)
+    assert sqlite_store.read_range('gastos_variables', '2025-02-01', '2025-02-28')['concepto'].tolist() == ['Teatro', 'Luz']
+    assert sqlite_store.date_bounds('gastos_variables') == csv_store.date_bounds('gastos_variables')
+    assert sqlite_store.date_bounds('gastos_variables') == (pd.Timestamp('2025-01-12'), pd.Timestamp('2025-02-28'))
+
+def test_sqlite_period_views_read_only_their_window(data_dir, monkeypatch):
+    (data_dir / "gastos_recurrentes.csv").write_text("dia,cantidad,categoria,concepto\n5,700.0,Vivienda,Alquiler\n31,40.0,Casa,Luz\n")
+    with open(data_dir / "gastos_variables.csv", "a") as f:
+        f.write("2025-02-03,20.0,Ocio,Teatro\n2025-03-15,45.5,Comida,Super\n")
+    with open(data_dir / "ingresos.csv", "a") as f:
+        f.write("2025-02-25,2500.0,Nomina,Trabajo\n2025-03-10,120.0,Venta,Extra\n")
+    with open(data_dir / "aportaciones.csv", "a") as f:
+        f.write("2025-03-02,COMPRA,MSCI_W,300.0,3.0,100.0,Manual\n")
+
+    def views():
+        logic._artifacts['entries'].clear()
+        return ([logic.get_monthly_cashflow_detail(p, w) for p, w in ((None, 1), ('2025-02', 1), ('2025-03', 3), ('2024-12', 1))],
+                [logic.get_sankey_data(p, w) for p, w in (('2025-03', 1), ('2025-03', 2))],
+                logic.get_expense_breakdown())
+
+    expected = views()
+    logic.sync_portfolio()
+    storage.import_csv(str(data_dir), logic.DATABASE_FILE)
+    monkeypatch.setattr(logic, 'STORAGE_BACKEND', 'sqlite')
+    reads = []
+    read_range = storage.SqliteStorage.read_range
+    monkeypatch.setattr(storage.SqliteStorage, 'read_range',
+                        lambda self, name, start=None, end=None, **kw: reads.append((name, str(start.date()), str(end.date())))
+                        or read_range(self, name, start, end, **kw))
+    assert views() == expected
+    assert ('gastos_variables', '2025-01-01', '2025-03-31') in reads and ('aportaciones', '2025-02-01', '2025-03-31') in reads
+
+def test_sqlite_backend_serves_the_same_payload(sqlite_data, monkeypatch):
+    payload = logic.load_data()
+    with monkeypatch.context() as m:
+        m.setattr(logic, 'STORAGE_BACKEND', 'csv')
+        expected = logic._parse_data(logic.get_storage(), {})
+    for got, want in zip(payload, expected):
+        pd.testing.assert_frame_equal(got.reset_index(drop=True), want.reset_index(drop=True), check_dtype=False)
+
+def test_sqlite_ledger_replays_inserted_rows_only(sqlite_data):
+    store = logic.get_storage()
+    assert logic.sync_portfolio() == 'full'  # No checkpoint of the table yet
+    assert logic.sync_portfolio() is None
+    csv_size = os.path.getsize(sqlite_data / "aportaciones.csv")
+
+    ok, message, _ = logic.add_contribution({'fecha': '2025-02-01', 'tipo': 'COMPRA', 'id_activo': 'MSCI_W',
+                                             'cantidad_dinero': '500', 'titulos': '5', 'precio_titulo': '100'})
+    assert ok, message
+    assert os.path.getsize(sqlite_data / "aportaciones.csv") == csv_size  # The CSV is no longer written
+    assert logic.ledger._state['checkpoint']['rowid'] == 3
+    cartera = store.read('cartera').set_index('id_activo')['participaciones']
+    assert cartera['MSCI_W'] == 15.0 and cartera['CASH_DIG'] == 3500.0
+
+    # Same operation two days later: caught by the duplicate index built from the table
+    assert logic.add_contribution({'fecha': '2025-02-03', 'tipo': 'COMPRA', 'id_activo': 'MSCI_W',
+                                   'cantidad_dinero': '500', 'titulos': '5', 'precio_titulo': '100'})[2] is True
+
+    # Editing a row in place forces a full replay
+    with sqlite3.connect(logic.DATABASE_FILE) as conn:
+        conn.execute("UPDATE aportaciones SET titulos = 20.0 WHERE fecha = '2025-01-10'")
+    assert store.sync_ledger(logic.LEDGER_CHECKPOINT_FILE) == 'full'
+    assert store.read('cartera').set_index('id_activo').loc['MSCI_W', 'participaciones'] == 25.0
+
+def test_sqlite_price_history_replaces_the_day(sqlite_data):
+    logic.save_price_history({'MSCI_W': 100.0})
+    logic.save_price_history({'MSCI_W': 101.0, 'CASH_DIG': 1.0})
+    store = logic.get_storage()
+    df = store.read_prices(assets=['MSCI_W'])
+    assert df['precio'].tolist() == [101.0]
+    assert str(df['fecha'].dtype) == 'datetime64[ns]'
+    assert store.read_prices(end='2000-01-01').empty
+
+def test_typed_reads_follow_the_schema_on_both_backends(data_dir, tmp_path):
+    (data_dir / "gastos_variables.csv").write_text(
+        "fecha,cantidad,categoria,concepto,sobrante\n"
+        "2025-01-12,80,Ocio,Cine,x\n"
+        "2025-01-13,12.5,Casa,,y\n"
+        "2025-02-01,3,Comida,\"Super\nmercado\",z\n")
+    csv_store = storage.CsvStorage(str(data_dir), str(tmp_path / 'precios'), str(tmp_path / 'precios.csv'))
+    typed = csv_store.read('gastos_variables', typed=True)
+    assert typed.columns.tolist() == ['fecha', 'cantidad', 'categoria', 'concepto']
+    assert typed['fecha'].dtype == 'datetime64[ns]' and typed['cantidad'].dtype == 'float64'
+    assert typed['categoria'].cat.categories.tolist() == ['Casa', 'Comida', 'Ocio']  # Sorted
+    assert pd.isna(typed.loc[1, 'concepto']) and typed.loc[2, 'concepto'] == 'Super\nmercado'
+
+    storage.import_csv(str(data_dir), str(tmp_path / "copia.db"))
+    from_sqlite = storage.SqliteStorage(str(tmp_path / "copia.db")).read('gastos_variables', typed=True)
+    pd.testing.assert_frame_equal(from_sqlite[typed.columns], typed)
+
+    # Dates pyarrow does not parse fall back to the default parser, with the same dtypes
+    (data_dir / "gastos_variables.csv").write_text("fecha,cantidad,categoria,concepto\n2025-1-5,80,Ocio,Cine\n")
+    fallback = csv_store.read('gastos_variables', typed=True)
+    assert fallback['fecha'].tolist() == [pd.Timestamp('2025-01-05')]
+    assert fallback['categoria'].dtype == 'category' and fallback['cantidad'].dtype == 'float64'
@@ -0,0 +1,29 @@
+import os
+import sys
+import pandas as pd
+
+# Add scripts to path
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'scripts'))
+import price_store
+import synthetic_data
+
+SIZES = dict(n_assets=3, years=1, n_operations=50, n_expenses=200, n_recurring=4)
+FILES = ['activos.csv', 'aportaciones.csv', 'ingresos.csv', 'gastos_variables.csv', 'gastos_recurrentes.csv',
+         'latest_prices.json']
+
+def _read(directory, name):
+    with open(os.path.join(directory, name), 'rb') as f:
+        return f.read()
+
+def test_same_seed_writes_identical_files(tmp_path):
+    first, second, other = str(tmp_path / 'a'), str(tmp_path / 'b'), str(tmp_path / 'c')
+    counts = synthetic_data.generate(first, seed=1, **SIZES)
+    assert synthetic_data.generate(second, seed=1, **SIZES) == counts
+    synthetic_data.generate(other, seed=2, **SIZES)
+
+    for name in FILES:
+        assert _read(first, name) == _read(second, name), name
+    pd.testing.assert_frame_equal(price_store.read_prices(os.path.join(first, 'precios_historicos')),
+                                  price_store.read_prices(os.path.join(second, 'precios_historicos')))
+    assert _read(first, 'gastos_variables.csv') != _read(other, 'gastos_variables.csv')
+    assert counts['aportaciones'] == SIZES['n_operations'] + 1  # Plus the initial cash deposit